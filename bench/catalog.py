@@ -0,0 +1,82 @@
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.db import DB  # noqa: E402
+from bench import gen_db  # noqa: E402
+from bench.run import latency_summary  # noqa: E402
+from bench.stub_waifu import TAGS  # noqa: E402
+
+ORIENTATIONS = (None, "Portrait", "Landscape")
+
+def _expression(tags, prefix: bool = False) -> str:
+    # what core.catalog.match_expression builds
+    return " ".join(f'"{tag}"*' if prefix else f'"{tag}"' for tag in tags)
+
+### --- The inline handler's catalog queries, as core.catalog sends them --- ###
+QUERIES = {
+    # one tag, exact token
+    "search_one_tag": lambda rng: _expression([rng.choice(TAGS)]),
+    # every tag must match
+    "search_two_tags": lambda rng: _expression(rng.sample(TAGS, 2)),
+    # half-typed tag, the fallback when the exact token found nothing
+    "search_prefix": lambda rng: _expression([rng.choice(TAGS)[:3]], prefix=True),
+    # a word no image has: the exact query and then the prefix fallback both come back empty
+    "search_miss": lambda rng: _expression(["zzzunknown"]),
+}
+
+def measure(db_path: str, queries: int, candidates: int, page: int, seed: int) -> dict:
+    db = DB(db_path)
+    if not db.fts5:
+        db.close()
+        return {"error": "SQLite built without FTS5, tag search is off"}
+    rng = random.Random(seed)
+    results = {}
+    for name, build in QUERIES.items():
+        samples = []
+        for _ in range(queries):
+            match, orientation, nsfw = build(rng), rng.choice(ORIENTATIONS), rng.random() < 0.3
+            started = time.perf_counter()
+            rows = db.search_images(match, orientation, nsfw, candidates)
+            if not rows and name == "search_miss":
+                db.search_images(match + "*", orientation, nsfw, candidates)
+            samples.append((time.perf_counter() - started) * 1000)
+        results[name] = latency_summary(samples)
+    samples = []
+    for _ in range(queries):
+        started = time.perf_counter()
+        db.sample_images(rng.choice(ORIENTATIONS), rng.random() < 0.3, page)
+        samples.append((time.perf_counter() - started) * 1000)
+    results["sample_images"] = latency_summary(samples)
+    db.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Catalog tag search and random sampling latency at several catalog sizes")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000], help="images in each generated catalog")
+    parser.add_argument("--queries", type=int, default=300, help="queries per kind and size")
+    parser.add_argument("--candidates", type=int, default=200, help="CATALOG.CANDIDATES, rows ranked per search")
+    parser.add_argument("--page", type=int, default=10, help="INLINE.PAGE_SIZE, rows per sample")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir")
+    args = parser.parse_args()
+
+    work = Path(args.workdir or tempfile.mkdtemp(prefix="zbbench-catalog-"))
+    results = []
+    for size in args.sizes:
+        db_path = str(work / f"catalog-{size}.db")
+        if not Path(db_path).exists():
+            started = time.perf_counter()
+            gen_db.generate(db_path, 1000, images=size, seed=args.seed).close()
+            print(f"generated {size} images in {time.perf_counter() - started:.0f}s", file=sys.stderr)
+        results.append({"images": size, "latency_ms": measure(db_path, args.queries, args.candidates, args.page, args.seed)})
+    print(json.dumps({"queries": args.queries, "candidates": args.candidates, "tags": len(TAGS), "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
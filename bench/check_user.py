@@ -0,0 +1,93 @@
+import argparse
+import asyncio
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench import env, gen_db, trace as traces  # noqa: E402
+
+# mode -> config overrides
+MODES = {
+    "cached": {},
+    "uncached": {"USER_CACHE.MAX_SIZE": 0},
+}
+
+### --- check_user over synthetic /start updates, in a process of its own per mode --- ###
+async def run_mode(mode: str, workdir: str, db_path: str, updates: int, active_users: int, seed: int) -> dict:
+    env.prepare(workdir, db_path, "http://127.0.0.1:9/images", MODES[mode])
+
+    from telegram import Update
+    from telegram.ext import ExtBot
+    from bench.fake_bot import FakeRequest
+    from core.config_loader import ADB
+    from core.utils import check_user
+
+    bot = ExtBot("123:ABC", request=FakeRequest(), get_updates_request=FakeRequest())
+    await bot.initialize()
+    context = SimpleNamespace(bot=bot)
+    items = traces.synthetic("start", gen_db.user_ids(db_path), updates, active_users=active_users, seed=seed)
+    batch = [Update.de_json(data, bot) for _, data in items]
+
+    env.QUERIES.count = 0
+    started = time.perf_counter()
+    for update in batch:
+        await check_user(update, context)
+    seconds = time.perf_counter() - started
+    hot_path = env.QUERIES.count
+    # what the write-behind buffer still owes the database
+    await ADB.flush()
+    cache = ADB.db.user_cache.stats()
+    flushes = ADB.db.flush_stats
+    await bot.shutdown()
+    ADB.close()
+    ADB.db.close()
+    return {
+        "mode": mode,
+        "updates": updates,
+        "db_queries_per_update": round(hot_path / updates, 3),
+        "db_queries_per_update_with_flush": round(env.QUERIES.count / updates, 3),
+        "us_per_update": round(seconds / updates * 1e6, 1),
+        "user_cache": {"hits": cache["hits"], "misses": cache["misses"]},
+        # executemany rows count as queries; these are the batched last_active writes among them
+        "write_behind": {"flushes": flushes["flushes"], "rows": flushes["rows"]},
+    }
+
+def _child(mode: str, workdir: Path, source: str, args) -> dict:
+    # every mode starts from the same database
+    db_path = workdir / f"{mode}.db"
+    shutil.copy(source, db_path)
+    out = subprocess.run([sys.executable, "-m", "bench.check_user", "--mode", mode, "--db", str(db_path), "--workdir", str(workdir / mode),
+                          "--updates", str(args.updates), "--active-users", str(args.active_users), "--seed", str(args.seed)],
+                         cwd=env.ROOT, capture_output=True, text=True, check=True).stdout
+    return json.loads(out)
+
+def main():
+    parser = argparse.ArgumentParser(description="DB queries and time per update of utils.check_user, with the user cache on and off")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--updates", type=int, default=10_000)
+    parser.add_argument("--active-users", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir")
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(asyncio.run(run_mode(args.mode, args.workdir, args.db, args.updates, args.active_users, args.seed))))
+        return
+
+    work = Path(args.workdir or tempfile.mkdtemp(prefix="zbbench-check-"))
+    source = str(work / "source.db")
+    gen_db.generate(source, args.users, seed=args.seed).close()
+    results = [_child(mode, work, source, args) for mode in MODES]
+    print(json.dumps({"users": args.users, "active_users": args.active_users, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import argparse
+import json
+import sys
+from typing import Iterator, Optional, Tuple
+
+# metric -> True when bigger is better
+METRICS = {
+    "throughput": True,
+    "latency_ms.p50": False,
+    "latency_ms.p95": False,
+    "latency_ms.p99": False,
+    "api_calls_per_update": False,
+    "db_queries_per_update": False,
+    "upstream_requests_per_update": False,
+    "upstream_connections": False,
+}
+
+def _get(report: dict, dotted: str) -> Optional[float]:
+    value = report
+    for key in dotted.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+def diff(base: dict, new: dict) -> Iterator[Tuple[str, Optional[float], Optional[float], Optional[float], bool]]:
+    # (metric, base, new, change in %, regressed beyond 0%)
+    for metric, higher_is_better in METRICS.items():
+        old_value, new_value = _get(base, metric), _get(new, metric)
+        if old_value is None or new_value is None:
+            yield metric, old_value, new_value, None, False
+            continue
+        change = (new_value - old_value) / old_value * 100 if old_value else (0.0 if new_value == old_value else float("inf"))
+        worse = change < 0 if higher_is_better else change > 0
+        yield metric, old_value, new_value, change, worse
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two bench reports")
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, help="exit 1 if any metric got worse by more than this many percent")
+    args = parser.parse_args()
+
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    if base.get("scenario") != new.get("scenario"):
+        print(f"warning: comparing {base.get('scenario')} with {new.get('scenario')}", file=sys.stderr)
+
+    print(f"{'metric':<30} {base.get('git_rev') or 'base':>14} {new.get('git_rev') or 'new':>14} {'change':>9}")
+    regressions = []
+    for metric, old_value, new_value, change, worse in diff(base, new):
+        shown = "n/a" if change is None else f"{change:+.1f}%"
+        print(f"{metric:<30} {str(old_value):>14} {str(new_value):>14} {shown:>9}")
+        if args.threshold is not None and worse and abs(change) > args.threshold:
+            regressions.append(metric)
+
+    if regressions:
+        print(f"regressed by more than {args.threshold}%: {', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench import env  # noqa: E402
+
+def _ns_per_call(fn, calls: int) -> float:
+    started = time.perf_counter_ns()
+    for _ in range(calls):
+        fn()
+    return round((time.perf_counter_ns() - started) / calls, 1)
+
+### --- Role checks and text rendering: the compiled snapshot vs plain dicts and str.format --- ###
+def measure(workdir: Path, staff: int, calls: int) -> dict:
+    # staff ids in the config, so the old per-call set() shows how it grows with the lists
+    admins, owners = list(range(1000, 1000 + staff)), [1]
+    env.prepare(str(workdir), str(workdir / "render.db"), "http://127.0.0.1:9/images", {"ADMINS": admins, "OWNERS": owners})
+
+    from core.config_loader import CFG, render, snapshot
+
+    # what CFG / TEXTS were before the snapshot: the parsed JSON, read on every call
+    old_cfg = json.loads((workdir / "config" / "config.json").read_text(encoding="utf-8"))
+    old_texts = json.loads((workdir / "config" / "texts.json").read_text(encoding="utf-8"))
+    outsider, tags = 42, "waifu, maid"
+    caption = snapshot().templates["animebot.message"]
+    return {
+        # a user who is not staff: the common case, and the whole list is looked at
+        "is_admin_dict_ns": _ns_per_call(lambda: outsider in set(old_cfg.get("ADMINS", []) + old_cfg.get("OWNERS", [])), calls),
+        "is_admin_snapshot_ns": _ns_per_call(lambda: outsider in snapshot().staff, calls),
+        "render_main_menu_dict_ns": _ns_per_call(lambda: old_texts["main_menu"]["title"].format(version=old_cfg["VERSION"]), calls),
+        "render_main_menu_snapshot_ns": _ns_per_call(lambda: render("main_menu.title", version=CFG["VERSION"]), calls),
+        # the inline handler looks the template up once per update, then formats per result
+        "render_caption_dict_ns": _ns_per_call(lambda: old_texts["animebot"]["message"].format(tags=tags), calls),
+        "render_caption_template_ns": _ns_per_call(lambda: caption(tags=tags), calls),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Admin checks and text rendering: config snapshot vs the old dict lookups and .format")
+    parser.add_argument("--staff", type=int, default=20, help="ADMINS entries in the config")
+    parser.add_argument("--calls", type=int, default=500_000, help="calls per measurement")
+    args = parser.parse_args()
+
+    result = measure(Path(tempfile.mkdtemp(prefix="zbbench-render-")), args.staff, args.calls)
+    print(json.dumps({"staff": args.staff + 1, "calls": args.calls, "ns_per_call": result}, indent=2))
+
+if __name__ == "__main__":
+    main()
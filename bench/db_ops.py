@@ -0,0 +1,105 @@
+import argparse
+import json
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.db import DB  # noqa: E402
+from bench import gen_db  # noqa: E402
+
+# SQLite's own defaults, what connections ran with before the pragmas were set
+SQLITE_DEFAULTS = {"journal_mode": "DELETE", "synchronous": "FULL", "cache_size": -2000, "mmap_size": 0, "temp_store": 0}
+
+### --- What DB did before: a connection per call, default pragmas, no cache, every write committed at once --- ###
+class PerCallDB(DB):
+    def __init__(self, path: str):
+        super().__init__(path, cache_size=0, pragmas=SQLITE_DEFAULTS, flush_max_batch=1)
+
+    @contextmanager
+    def _connect(self, write: bool = True):
+        con = self._open()
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+MODES = {
+    "per_call": PerCallDB,
+    # long-lived connections and pragmas alone
+    "persistent_nocache": lambda path: DB(path, cache_size=0, flush_max_batch=1),
+    "current": DB,
+}
+
+def run_mode(mode: str, db_path: str, ids: list, ops: int, write_ratio: float, threads: int, seed: int) -> dict:
+    db = MODES[mode](db_path)
+    rng = random.Random(seed)
+    # (user_id, write) decided up front, so every mode does the same operations
+    plan = [(rng.choice(ids), rng.random() < write_ratio) for _ in range(ops)]
+    now = int(time.time())
+
+    def one(item):
+        user_id, write = item
+        if write:
+            db.upsert_user(user_id, f"u{user_id}", f"User {user_id}", "-", now)
+        else:
+            db.get_user(user_id)
+
+    started = time.perf_counter()
+    if threads > 1:
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(one, plan, chunksize=64))
+    else:
+        for item in plan:
+            one(item)
+    seconds = time.perf_counter() - started
+    # the write-behind buffer is part of the cost
+    db.flush()
+    total = time.perf_counter() - started
+    db.close()
+    return {
+        "mode": mode,
+        "ops": ops,
+        "ops_per_s": round(ops / seconds),
+        "ops_per_s_with_flush": round(ops / total),
+        "us_per_op": round(seconds / ops * 1e6, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="get_user/upsert_user ops/s: a connection per call vs the long-lived WAL connections")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--ops", type=int, default=20_000)
+    parser.add_argument("--active-users", type=int, default=1000, help="users the operations pick from")
+    parser.add_argument("--write-ratio", type=float, default=0.5, help="share of upsert_user among the operations")
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir")
+    args = parser.parse_args()
+
+    work = Path(args.workdir or tempfile.mkdtemp(prefix="zbbench-db-"))
+    source = str(work / "source.db")
+    gen_db.generate(source, args.users, seed=args.seed).close()
+    ids = random.Random(args.seed).sample(gen_db.user_ids(source), args.active_users)
+    results = []
+    for mode in args.modes:
+        db_path = str(work / f"{mode}.db")
+        # a fresh copy per mode; the WAL was checkpointed on close
+        shutil.copy(source, db_path)
+        try:
+            results.append(run_mode(mode, db_path, ids, args.ops, args.write_ratio, args.threads, args.seed))
+        except sqlite3.OperationalError as e:
+            results.append({"mode": mode, "error": repr(e)})
+    print(json.dumps({"users": args.users, "active_users": args.active_users, "write_ratio": args.write_ratio,
+                      "threads": args.threads, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Statements that are bookkeeping, not queries the handlers asked for
+_SKIP_PREFIXES = ("PRAGMA", "BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "--")
+
+### --- DB statement counter, attached to every connection core.db opens --- ###
+class QueryCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def __call__(self, statement: str):
+        if statement.lstrip().upper().startswith(_SKIP_PREFIXES):
+            return
+        with self._lock:
+            self.count += 1
+
+QUERIES = QueryCounter()
+
+def _count_queries():
+    from core.db import DB
+
+    original = DB._open
+    if getattr(original, "_bench_counted", False):
+        return
+
+    def _open(self) -> sqlite3.Connection:
+        con = original(self)
+        con.set_trace_callback(QUERIES)
+        return con
+
+    _open._bench_counted = True
+    DB._open = _open
+
+def _set_path(cfg: dict, dotted: str, value):
+    keys = dotted.split(".")
+    target = cfg
+    for key in keys[:-1]:
+        target = target.setdefault(key, {})
+    target[keys[-1]] = value
+
+def parse_overrides(items) -> Dict[str, object]:
+    # "UPSTREAM.HEDGE=false" -> {"UPSTREAM.HEDGE": False}; values are JSON, bare words stay strings
+    overrides = {}
+    for item in items or []:
+        key, _, raw = item.partition("=")
+        try:
+            overrides[key] = json.loads(raw)
+        except ValueError:
+            overrides[key] = raw
+    return overrides
+
+### --- Throwaway working directory with its own config/, set up before core is imported --- ###
+def prepare(workdir: str, db_path: str, upstream_url: str, overrides: Optional[Dict[str, object]] = None) -> dict:
+    if "core.config_loader" in sys.modules:
+        raise RuntimeError("bench environment must be prepared before core is imported")
+    work = Path(workdir).resolve()
+    (work / "config").mkdir(parents=True, exist_ok=True)
+
+    cfg = json.loads((ROOT / "config" / "config-example.json").read_text(encoding="utf-8"))
+    cfg["BOT_TOKEN"] = "123:ABC"
+    cfg["BOT_USERNAME"] = "bench_bot"
+    cfg["DB_PATH"] = str(Path(db_path).resolve())
+    cfg["MODE"] = "polling"
+    cfg.setdefault("UPSTREAM", {})["URL"] = upstream_url
+    cfg.setdefault("STATE", {})["BACKEND"] = "memory"
+    cfg.setdefault("METRICS", {})["ENABLED"] = False
+    cfg.setdefault("CONFIG_WATCH", {})["ENABLED"] = False
+    cfg.setdefault("MEDIA_CACHE", {})["DIR"] = str(work / "media")
+    for key, value in (overrides or {}).items():
+        _set_path(cfg, key, value)
+
+    (work / "config" / "config.json").write_text(json.dumps(cfg, ensure_ascii=False, indent=2), encoding="utf-8")
+    shutil.copy(ROOT / "config" / "texts.json", work / "config" / "texts.json")
+
+    os.chdir(work)
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    _count_queries()
+    return cfg
@@ -0,0 +1,106 @@
+import asyncio
+import json
+import random
+from collections import Counter
+from typing import Optional, Tuple
+
+from telegram.request import BaseRequest, RequestData
+
+from core.ratelimit import KeyedBuckets
+
+# Methods that deliver something to a user, where Forbidden (bot blocked) can happen
+SEND_METHODS = {"sendMessage", "copyMessage", "sendPhoto", "sendAnimation", "sendDocument", "sendChatAction"}
+# Methods Telegram's flood limits count
+LIMITED_METHODS = {"sendMessage", "copyMessage", "sendPhoto", "sendAnimation", "sendDocument", "editMessageText"}
+
+### --- Fake Bot API transport: the real Bot/ExtBot code runs, nothing leaves the process --- ###
+class FakeRequest(BaseRequest):
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, forbidden_rate: float = 0.0,
+                 retry_after_every: int = 0, retry_after: int = 1, member_status: str = "member", enforce_limits: bool = False, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.forbidden_rate = forbidden_rate
+        self.retry_after_every = retry_after_every
+        self.retry_after = retry_after
+        self.member_status = member_status
+        # Roughly what Telegram enforces: 30 msg/s per bot, ~1/s per private chat (short bursts ok), 20/min per group
+        self.enforce_limits = enforce_limits
+        self.global_limit = KeyedBuckets(30, 30)
+        self.private_limit = KeyedBuckets(1, 5)
+        self.group_limit = KeyedBuckets(20 / 60, 20)
+        self.random = random.Random(seed)
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+        self._message_id = 0
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def total_calls(self) -> int:
+        # getMe only happens at startup
+        return sum(count for method, count in self.calls.items() if method != "getMe")
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None, *args, **kwargs) -> Tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] += 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+
+        if self.retry_after_every and self.calls[api_method] % self.retry_after_every == 0:
+            self.errors["retry_after"] += 1
+            return 429, self._error(429, f"Too Many Requests: retry after {self.retry_after}", {"retry_after": self.retry_after})
+        if self.enforce_limits and api_method in LIMITED_METHODS and not self._within_limits(request_data):
+            self.errors["flood"] += 1
+            return 429, self._error(429, f"Too Many Requests: retry after {self.retry_after}", {"retry_after": self.retry_after})
+        if api_method in SEND_METHODS and self.forbidden_rate and self.random.random() < self.forbidden_rate:
+            self.errors["forbidden"] += 1
+            return 403, self._error(403, "Forbidden: bot was blocked by the user")
+
+        params = request_data.parameters if request_data else {}
+        return 200, json.dumps({"ok": True, "result": self._result(api_method, params)}).encode()
+
+    def _within_limits(self, request_data: Optional[RequestData]) -> bool:
+        chat_id = request_data.parameters.get("chat_id") if request_data else None
+        if chat_id is not None:
+            chat_id = int(chat_id) if str(chat_id).lstrip("-").isdigit() else chat_id
+            per_chat = self.private_limit if isinstance(chat_id, int) and chat_id > 0 else self.group_limit
+            if not per_chat.allow(chat_id):
+                return False
+        return self.global_limit.allow(None)
+
+    @staticmethod
+    def _error(code: int, description: str, parameters: Optional[dict] = None) -> bytes:
+        body = {"ok": False, "error_code": code, "description": description}
+        if parameters:
+            body["parameters"] = parameters
+        return json.dumps(body).encode()
+
+    def _message(self, params: dict) -> dict:
+        self._message_id += 1
+        chat_id = int(params.get("chat_id", 0) or 0)
+        return {"message_id": self._message_id, "date": 0, "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "channel"}}
+
+    def _result(self, api_method: str, params: dict):
+        if api_method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        if api_method == "getChatMember":
+            user_id = int(params.get("user_id", 0))
+            return {"status": self.member_status, "user": {"id": user_id, "is_bot": user_id == 1, "first_name": "u"}}
+        if api_method == "copyMessage":
+            self._message_id += 1
+            return {"message_id": self._message_id}
+        if api_method == "sendPhoto":
+            message = self._message(params)
+            message["photo"] = [{"file_id": f"photo{self._message_id}", "file_unique_id": f"u{self._message_id}", "width": 1, "height": 1}]
+            return message
+        if api_method in ("sendMessage", "sendAnimation", "sendDocument", "editMessageText"):
+            return self._message(params)
+        # answerInlineQuery, answerCallbackQuery, sendChatAction, setWebhook, ...
+        return True
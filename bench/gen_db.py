@@ -0,0 +1,71 @@
+import argparse
+import random
+import string
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.db import DB  # noqa: E402
+from bench.stub_waifu import TAGS  # noqa: E402
+
+FIRST_USER_ID = 100_000_000
+
+### --- Synthetic database with the bot's real schema --- ###
+def generate(path: str, users: int, images: int = 0, banned_ratio: float = 0.01, blocked_ratio: float = 0.05, seed: int = 0, chunk: int = 50_000) -> DB:
+    rng = random.Random(seed)
+    db = DB(path)
+    now = int(time.time())
+    with db._connect() as con:
+        for start in range(0, users, chunk):
+            rows = []
+            for n in range(start, min(users, start + chunk)):
+                user_id = FIRST_USER_ID + n * 7
+                created = now - rng.randrange(365 * 86400)
+                roll = rng.random()
+                rows.append((
+                    user_id,
+                    "".join(rng.choices(string.ascii_lowercase, k=8)) if rng.random() < 0.7 else None,
+                    f"User {n}",
+                    "".join(rng.choices(string.ascii_letters + string.digits, k=12)),
+                    created,
+                    rng.randint(created, now),
+                    1 if roll < banned_ratio else 0,
+                    0 if roll > 1 - blocked_ratio else 1,
+                ))
+            con.executemany(
+                "INSERT OR IGNORE INTO users (user_id, username, full_name, user_hash, created_at, last_active, banned, pm_state) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+    for start in range(0, images, chunk):
+        rows = []
+        for n in range(start, min(images, start + chunk)):
+            width, height = rng.choice([(800, 1200), (1200, 800)])
+            rows.append((f"https://cdn.bench/{n}.jpg", ", ".join(rng.sample(TAGS, 3)), "Portrait" if height > width else "Landscape", width, height, 1 if rng.random() < 0.3 else 0))
+        db.add_images(rows, now)
+    db.reconcile_stats()
+    db.save_stats()
+    return db
+
+def user_ids(db_path: str, limit: int = 0) -> list:
+    import sqlite3
+    con = sqlite3.connect(db_path)
+    query = "SELECT user_id FROM users WHERE banned=0"
+    rows = con.execute(query + (f" LIMIT {int(limit)}" if limit else "")).fetchall()
+    con.close()
+    return [row[0] for row in rows]
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic bot database")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--images", type=int, default=0, help="catalog entries to add")
+    parser.add_argument("--out", default="bench_data/bench.db")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    started = time.perf_counter()
+    generate(args.out, args.users, args.images, seed=args.seed).close()
+    print(f"{args.out}: {args.users} users, {args.images} images in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
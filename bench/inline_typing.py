@@ -0,0 +1,49 @@
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench import env  # noqa: E402
+
+# setting -> overrides; the pools are off in every run, so a query that is not shared or dropped reaches upstream
+SETTINGS = {
+    "all_on": {},
+    "no_supersede_debounce": {"INLINE.SUPERSEDE": False, "INLINE.DEBOUNCE_MS": 0},
+    "no_singleflight": {"INLINE.SINGLEFLIGHT": False},
+    "all_off": {"INLINE.SUPERSEDE": False, "INLINE.DEBOUNCE_MS": 0, "INLINE.SINGLEFLIGHT": False},
+}
+
+### --- The typing scenario through bench.run, one process per setting --- ###
+def run(args, overrides: dict) -> dict:
+    command = [sys.executable, "-m", "bench.run", "typing", "--updates", str(args.updates), "--rate", str(args.rate),
+               "--keystroke-gap", str(args.keystroke_gap), "--active-users", str(args.active_users), "--seed", str(args.seed),
+               "--upstream-latency", str(args.upstream_latency),
+               "--set", "IMAGE_POOL.ENABLED=false", "--set", "RATE_LIMIT.ENABLED=false"]
+    for key, value in overrides.items():
+        command += ["--set", f"{key}={json.dumps(value)}"]
+    report = json.loads(subprocess.run(command, cwd=env.ROOT, capture_output=True, text=True, check=True).stdout)
+    return {
+        "upstream_requests_per_update": report["upstream_requests_per_update"],
+        "answers_per_update": round(report["api_calls"].get("answerInlineQuery", 0) / report["updates"], 3),
+        "latency_ms": report["latency_ms"],
+        "errors": report["errors"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Upstream calls per inline query while users type, with supersede/debounce and singleflight on and off")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=100, help="inline queries per second, all typists together")
+    parser.add_argument("--keystroke-gap", type=float, default=0.05)
+    parser.add_argument("--active-users", type=int, default=1000)
+    parser.add_argument("--upstream-latency", type=float, default=0.03)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = {name: run(args, overrides) for name, overrides in SETTINGS.items()}
+    print(json.dumps({"updates": args.updates, "rate": args.rate, "keystroke_gap": args.keystroke_gap, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.db import DB, AsyncDB  # noqa: E402
+from bench import gen_db  # noqa: E402
+from bench.run import latency_summary  # noqa: E402
+
+MODES = ("sync", "async")
+
+### --- Handlers and a bulk writer sharing one loop; a sampler measures how late the loop wakes up --- ###
+async def run_mode(mode: str, db_path: str, ids: list, args) -> dict:
+    db = DB(db_path, cache_size=args.cache_size)
+    adb = AsyncDB(db)
+    rng = random.Random(args.seed)
+    stop = asyncio.Event()
+    lags, ops = [], 0
+
+    async def call(name: str, *call_args):
+        # sync: what the handlers did before, the sqlite call blocks the loop
+        if mode == "sync":
+            return getattr(db, name)(*call_args)
+        return await getattr(adb, name)(*call_args)
+
+    async def sampler():
+        loop = asyncio.get_running_loop()
+        while not stop.is_set():
+            expected = loop.time() + args.interval
+            await asyncio.sleep(args.interval)
+            lags.append(max(0.0, loop.time() - expected) * 1000)
+
+    async def handler():
+        nonlocal ops
+        while not stop.is_set():
+            user_id = rng.choice(ids)
+            row = await call("get_user", user_id)
+            await call("upsert_user", user_id, f"u{user_id}", f"User {user_id}", row["user_hash"] if row else "-", int(time.time()))
+            ops += 1
+            await asyncio.sleep(0)
+
+    async def writer():
+        # write pressure: large batches, like a broadcast recording reachability or an import
+        while not stop.is_set():
+            await call("set_pm_state", rng.sample(ids, min(args.write_batch, len(ids))), 1)
+            await call("flush")
+            await asyncio.sleep(0)
+
+    tasks = [asyncio.create_task(sampler()), *(asyncio.create_task(handler()) for _ in range(args.handlers))]
+    tasks += [asyncio.create_task(writer()) for _ in range(args.writers)]
+    await asyncio.sleep(args.seconds)
+    stop.set()
+    await asyncio.gather(*tasks)
+    adb.close()
+    db.close()
+    return {
+        "mode": mode,
+        "loop_lag_ms": latency_summary(lags),
+        "handler_ops_per_s": round(ops / args.seconds),
+    }
+
+async def run(args) -> dict:
+    work = Path(args.workdir or tempfile.mkdtemp(prefix="zbbench-lag-"))
+    source = str(work / "source.db")
+    gen_db.generate(source, args.users, seed=args.seed).close()
+    ids = gen_db.user_ids(source)
+    results = []
+    for mode in args.modes:
+        db_path = str(work / f"{mode}.db")
+        shutil.copy(source, db_path)
+        results.append(await run_mode(mode, db_path, ids, args))
+    return {"users": args.users, "handlers": args.handlers, "writers": args.writers, "write_batch": args.write_batch, "results": results}
+
+def main():
+    parser = argparse.ArgumentParser(description="Event loop lag under DB write pressure: sqlite calls on the loop vs through AsyncDB")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--seconds", type=float, default=5.0, help="per mode")
+    parser.add_argument("--handlers", type=int, default=32, help="concurrent get_user + upsert_user loops")
+    parser.add_argument("--writers", type=int, default=1)
+    parser.add_argument("--write-batch", type=int, default=5000, help="users per set_pm_state write")
+    parser.add_argument("--cache-size", type=int, default=0, help="user cache size (0: every get_user reads SQLite)")
+    parser.add_argument("--interval", type=float, default=0.01, help="lag sampler period, seconds")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+if __name__ == "__main__":
+    main()
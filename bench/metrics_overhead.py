@@ -0,0 +1,74 @@
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench import env  # noqa: E402
+
+def _ns_per_call(fn, calls: int) -> float:
+    started = time.perf_counter_ns()
+    for _ in range(calls):
+        fn()
+    return round((time.perf_counter_ns() - started) / calls, 1)
+
+async def _ns_per_await(fn, calls: int) -> float:
+    started = time.perf_counter_ns()
+    for _ in range(calls):
+        await fn(None, None)
+    return round((time.perf_counter_ns() - started) / calls, 1)
+
+### --- What one wrapped call costs: handler wrapper and DB method timer, bare vs instrumented --- ###
+def micro(workdir: Path, calls: int) -> dict:
+    env.prepare(str(workdir), str(workdir / "micro.db"), "http://127.0.0.1:9/images")
+
+    from core.db import DB
+    from core.metrics import instrument_db, instrument_handler
+
+    async def handler(update, context):
+        return None
+
+    db = DB(str(workdir / "micro-instrumented.db"))
+    db.upsert_user(1, "u1", "User 1", "h1", int(time.time()))
+    bare_get_user = db.get_user
+    instrument_db(db, {"get_user"})
+    # cache hits: the cheapest DB call, where a fixed timer cost shows the most
+    result = {
+        "handler_bare_ns": asyncio.run(_ns_per_await(handler, calls)),
+        "handler_instrumented_ns": asyncio.run(_ns_per_await(instrument_handler(handler), calls)),
+        "db_get_user_bare_ns": _ns_per_call(lambda: bare_get_user(1), calls),
+        "db_get_user_instrumented_ns": _ns_per_call(lambda: db.get_user(1), calls),
+    }
+    db.close()
+    return result
+
+def end_to_end(args, enabled: bool) -> dict:
+    # the real handlers through bench.run, each in its own process; port 0 so runs never clash
+    command = [sys.executable, "-m", "bench.run", args.scenario, "--users", str(args.users), "--updates", str(args.updates),
+               "--concurrency", str(args.concurrency), "--seed", str(args.seed),
+               "--set", f"METRICS.ENABLED={json.dumps(enabled)}", "--set", "METRICS.PORT=0"]
+    report = json.loads(subprocess.run(command, cwd=env.ROOT, capture_output=True, text=True, check=True).stdout)
+    return {"metrics": enabled, "throughput": report["throughput"], "latency_ms": report["latency_ms"]}
+
+def main():
+    parser = argparse.ArgumentParser(description="Cost of the Prometheus instrumentation: per wrapped call, and on bench.run throughput/latency")
+    parser.add_argument("--calls", type=int, default=200_000, help="calls per micro measurement")
+    parser.add_argument("--scenario", default="inline", choices=("inline", "start", "callback", "mixed"))
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--updates", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--rounds", type=int, default=2, help="end-to-end runs per setting, alternating off/on")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    runs = [end_to_end(args, enabled) for _ in range(args.rounds) for enabled in (False, True)]
+    result = {"micro": micro(Path(tempfile.mkdtemp(prefix="zbbench-metrics-")), args.calls), "end_to_end": runs}
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+import argparse
+import asyncio
+import json
+import logging
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional
+
+try:
+    import resource
+except ImportError:
+    # Windows: no getrusage, peak_rss_mb is reported as null
+    resource = None
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench import env, gen_db, trace as traces  # noqa: E402
+from bench.fake_bot import FakeRequest  # noqa: E402
+from bench.stub_waifu import WaifuStub  # noqa: E402
+
+SCENARIOS = ("inline", "start", "callback", "mixed", "replay", "broadcast", "flood", "webhook", "typing")
+
+def _git_rev() -> Optional[str]:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=env.ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=env.ROOT, capture_output=True, text=True).stdout.strip()
+        return rev + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _percentile(ordered: List[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(q * len(ordered) + 0.5)) - 1))
+    return round(ordered[index], 3)
+
+def latency_summary(samples_ms: List[float]) -> dict:
+    ordered = sorted(samples_ms)
+    return {
+        "p50": _percentile(ordered, 0.50),
+        "p95": _percentile(ordered, 0.95),
+        "p99": _percentile(ordered, 0.99),
+        "max": round(ordered[-1], 3) if ordered else None,
+        "mean": round(sum(ordered) / len(ordered), 3) if ordered else None,
+    }
+
+### --- Counters that are reset after warm-up, so only the measured window is reported --- ###
+class Probe:
+    def __init__(self, request: FakeRequest, stub: WaifuStub):
+        self.request = request
+        self.stub = stub
+        self.reset()
+
+    def reset(self):
+        from core.media_cache import MEDIA_BYTES
+        from core.outbound import OUTBOUND_EVENTS
+        from core.throttle import RATE_LIMITED
+
+        OUTBOUND_EVENTS.values.clear()
+        self.request.calls.clear()
+        self.request.errors.clear()
+        self.stub.requests = 0
+        self.stub.image_requests = 0
+        self.stub.peers.clear()
+        env.QUERIES.count = 0
+        self.rate_limited_base = dict(RATE_LIMITED.values)
+        self.media_bytes_base = MEDIA_BYTES.values.get((), 0)
+        self.errors: dict = {}
+
+    def media_bytes(self) -> int:
+        # image bytes the media cache pulled from upstream in the window
+        from core.media_cache import MEDIA_BYTES
+
+        return int(MEDIA_BYTES.values.get((), 0) - self.media_bytes_base)
+
+    def rate_limited_by(self) -> dict:
+        # "kind:scope" -> updates dropped; scope "global" means a shared budget ran out
+        from core.throttle import RATE_LIMITED
+
+        return {f"{kind}:{scope}": int(count - self.rate_limited_base.get((kind, scope), 0))
+                for (kind, scope), count in sorted(RATE_LIMITED.values.items()) if count > self.rate_limited_base.get((kind, scope), 0)}
+
+    def rate_limited(self) -> int:
+        return sum(self.rate_limited_by().values())
+
+    async def on_error(self, update, context):
+        name = type(context.error).__name__
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+def _per_update(value: float, updates: int) -> Optional[float]:
+    return round(value / updates, 3) if updates else None
+
+### --- Drive updates through the application the way the updater would --- ###
+async def replay(app, items, concurrency: int, abuser: Optional[int] = None) -> dict:
+    from telegram import Update
+
+    processor = app.update_processor
+    shed_before = processor.shed
+    gate = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    # the flooding user's own updates, kept out of everyone else's latency
+    abuser_latencies: List[float] = []
+    pending = set()
+
+    async def handle(update: Update, due: float):
+        finished = False
+
+        async def timed():
+            nonlocal finished
+            await app.process_update(update)
+            finished = True
+
+        try:
+            await processor.process_update(update, timed())
+        finally:
+            gate.release()
+            if finished:
+                own = abuser is not None and update.effective_user and update.effective_user.id == abuser
+                (abuser_latencies if own else latencies).append((time.perf_counter() - due) * 1000)
+
+    started = time.perf_counter()
+    count = 0
+    for offset, data in items:
+        due = started + offset
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await gate.acquire()
+        # Closed loop (offset 0): latency counts from when the update could be sent
+        due = max(due, time.perf_counter()) if offset == 0 else due
+        task = asyncio.create_task(handle(Update.de_json(data, app.bot), due))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+        count += 1
+    if pending:
+        await asyncio.gather(*pending)
+    wall = time.perf_counter() - started
+    return {"updates": count, "wall_s": wall, "latencies": latencies, "abuser_latencies": abuser_latencies, "shed": processor.shed - shed_before}
+
+### --- Updates POSTed to the webhook endpoint, the way Telegram delivers them --- ###
+async def webhook(app, items, concurrency: int) -> dict:
+    import aiohttp
+    from aiohttp import web
+    from core.webhook import SECRET_HEADER, build_webhook_app, webhook_settings
+
+    processor = app.update_processor
+    shed_before = processor.shed
+    due_at: dict = {}
+    latencies: List[float] = []
+    http_latencies: List[float] = []
+    http_errors: dict = {}
+
+    # Handlers finish in the update workers, after the endpoint answered: time them there
+    original = processor.do_process_update
+
+    async def timed_process_update(update, coroutine):
+        started = False
+
+        async def timed():
+            nonlocal started
+            started = True
+            await coroutine
+            latencies.append((time.perf_counter() - due_at.pop(update.update_id)) * 1000)
+
+        try:
+            await original(update, timed())
+        finally:
+            if not started:
+                coroutine.close()
+                due_at.pop(update.update_id, None)
+
+    processor.do_process_update = timed_process_update
+    settings = webhook_settings()
+    runner = web.AppRunner(build_webhook_app(app, "/telegram", settings["SECRET_TOKEN"]), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    url = f"http://{host}:{port}/telegram"
+    await app.start()
+
+    # Telegram keeps up to WEBHOOK.MAX_CONNECTIONS requests open; --concurrency plays that part
+    session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency))
+    gate = asyncio.Semaphore(concurrency)
+    pending = set()
+
+    async def post(data: dict, due: float):
+        try:
+            due_at[data["update_id"]] = due
+            sent = time.perf_counter()
+            async with session.post(url, json=data, headers={SECRET_HEADER: settings["SECRET_TOKEN"]}) as response:
+                if response.status != 200:
+                    http_errors[response.status] = http_errors.get(response.status, 0) + 1
+                    due_at.pop(data["update_id"], None)
+            http_latencies.append((time.perf_counter() - sent) * 1000)
+        except aiohttp.ClientError as e:
+            http_errors[type(e).__name__] = http_errors.get(type(e).__name__, 0) + 1
+            due_at.pop(data["update_id"], None)
+        finally:
+            gate.release()
+
+    started = time.perf_counter()
+    count = 0
+    try:
+        for offset, data in items:
+            due = started + offset
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await gate.acquire()
+            due = max(due, time.perf_counter()) if offset == 0 else due
+            task = asyncio.create_task(post(data, due))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            count += 1
+        if pending:
+            await asyncio.gather(*pending)
+        # accepted updates still queued or running
+        while due_at:
+            await asyncio.sleep(0.01)
+        wall = time.perf_counter() - started
+    finally:
+        await session.close()
+        await app.stop()
+        await runner.cleanup()
+        processor.do_process_update = original
+    return {"updates": count, "wall_s": wall, "latencies": latencies, "shed": processor.shed - shed_before,
+            "http_latencies": http_latencies, "http_errors": http_errors}
+
+async def broadcast(app, total_users: int) -> dict:
+    from core.broadcast import start_job
+    from core.config_loader import ADB
+
+    total = await ADB.count_broadcast_targets()
+    job_id = await ADB.create_broadcast_job(-1001, 1, total, int(time.time()))
+    started = time.perf_counter()
+    task = await start_job(app.bot, job_id)
+    await task
+    wall = time.perf_counter() - started
+    job = await ADB.get_broadcast_job(job_id)
+    return {
+        "updates": total,
+        "wall_s": wall,
+        "latencies": [],
+        "shed": 0,
+        "job": {
+            **{key: job[key] for key in ("status", "success", "failed", "blocked")},
+            # delivered messages over the whole job, RetryAfter waits included
+            "messages_per_s": round(job["success"] / wall, 2) if wall else None,
+        },
+    }
+
+async def run(args) -> dict:
+    stub = WaifuStub(latency=args.upstream_latency, jitter=args.upstream_jitter, error_rate=args.upstream_error_rate,
+                     stall_rate=args.upstream_stall_rate, seed=args.seed)
+    upstream_url = await stub.start()
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="zbbench-"))
+    db_path = args.db
+    if not db_path:
+        db_path = str(workdir / "bench.db")
+        gen_db.generate(db_path, args.users, args.images, seed=args.seed).close()
+    env.prepare(str(workdir), db_path, upstream_url, env.parse_overrides(args.set))
+
+    import main
+
+    request = FakeRequest(latency=args.api_latency, jitter=args.api_jitter, forbidden_rate=args.forbidden_rate,
+                          retry_after_every=args.retry_after_every, member_status=args.member_status,
+                          enforce_limits=args.enforce_limits, seed=args.seed)
+    app = main.build_application(request)
+    probe = Probe(request, stub)
+    app.add_error_handler(probe.on_error)
+
+    await app.initialize()
+    await main.on_startup(app)
+    try:
+        # Let the image pools fill and startup calls settle before measuring
+        await asyncio.sleep(args.warmup)
+        probe.reset()
+        if args.scenario == "broadcast":
+            result = await broadcast(app, args.users)
+        else:
+            abuser = None
+            if args.scenario == "replay":
+                items = list(traces.load(args.trace))
+            elif args.scenario == "webhook":
+                items = list(traces.load(args.trace)) if args.trace else traces.synthetic(
+                    "mixed", gen_db.user_ids(db_path), args.updates, rate=args.rate, active_users=args.active_users, seed=args.seed)
+            elif args.scenario == "typing":
+                items = traces.typing(gen_db.user_ids(db_path), args.updates, rate=args.rate, gap=args.keystroke_gap,
+                                      active_users=args.active_users, seed=args.seed)
+            elif args.scenario == "flood":
+                items, abuser = traces.flood(gen_db.user_ids(db_path), args.updates, args.rate, args.abuser_rate,
+                                             active_users=args.active_users, seed=args.seed)
+            else:
+                items = traces.synthetic(args.scenario, gen_db.user_ids(db_path), args.updates, rate=args.rate,
+                                         active_users=args.active_users, seed=args.seed)
+            # Optionally with a broadcast competing for the same send budget
+            job = asyncio.create_task(broadcast(app, args.users)) if args.with_broadcast else None
+            if args.scenario == "webhook":
+                result = await webhook(app, items, args.concurrency)
+            else:
+                result = await replay(app, items, args.concurrency, abuser)
+            if abuser is not None:
+                result["abuser"] = {"user_id": abuser, "updates": sum(1 for _, data in items if data["inline_query"]["from"]["id"] == abuser)}
+            if job:
+                result["job"] = (await job)["job"]
+    finally:
+        await main.on_shutdown(app)
+        await app.shutdown()
+        await stub.stop()
+
+    updates = result["updates"]
+    report = {
+        "scenario": args.scenario,
+        "git_rev": _git_rev(),
+        "params": {key: value for key, value in vars(args).items() if key not in ("out", "workdir")},
+        "updates": updates,
+        "wall_s": round(result["wall_s"], 3),
+        "throughput": round(updates / result["wall_s"], 2) if result["wall_s"] else None,
+        "latency_ms": latency_summary(result["latencies"]),
+        "api_calls_per_update": _per_update(request.total_calls(), updates),
+        "api_calls": dict(sorted((method, count) for method, count in request.calls.items() if method != "getMe")),
+        "api_errors_injected": dict(request.errors),
+        "db_queries_per_update": _per_update(env.QUERIES.count, updates),
+        "upstream_requests_per_update": _per_update(stub.requests, updates),
+        "upstream_connections": stub.connections,
+        "rate_limited": probe.rate_limited(),
+        "rate_limited_by": probe.rate_limited_by(),
+        "shed": result["shed"],
+        "media_bytes": probe.media_bytes(),
+        # the process high-water mark (ru_maxrss is KiB on Linux), warm-up and the generated database included
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1) if resource else None,
+        "errors": probe.errors,
+    }
+    from core.outbound import OUTBOUND_EVENTS
+    report["outbound_events"] = {f"{event}:{priority}": int(count) for (event, priority), count in OUTBOUND_EVENTS.values.items()}
+    if "job" in result:
+        report["job"] = result["job"]
+    if "http_latencies" in result:
+        # time until the endpoint answered Telegram, separate from the handlers' latency above
+        report["http_latency_ms"] = latency_summary(result["http_latencies"])
+        report["http_errors"] = result["http_errors"]
+    if "abuser" in result:
+        # updates/latency above are everyone else's; these are the flooding user's
+        report["abuser"] = {**result["abuser"], "finished": len(result["abuser_latencies"]), "latency_ms": latency_summary(result["abuser_latencies"])}
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay updates through the real handlers against a fake Bot API and a stub waifu.im")
+    parser.add_argument("scenario", choices=SCENARIOS)
+    parser.add_argument("--trace", help="JSONL of updates, for the replay scenario")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64, help="updates in flight at once")
+    parser.add_argument("--rate", type=float, default=0.0, help="updates per second (open loop); 0 = as fast as possible")
+    parser.add_argument("--active-users", type=int, default=1000)
+    parser.add_argument("--abuser-rate", type=float, default=200, help="flood: inline queries per second from the one abusive user")
+    parser.add_argument("--keystroke-gap", type=float, default=0.05, help="typing: seconds between one user's keystrokes")
+    parser.add_argument("--users", type=int, default=10_000, help="users in the generated database")
+    parser.add_argument("--images", type=int, default=0, help="catalog entries in the generated database")
+    parser.add_argument("--db", help="use an existing database instead of generating one (it is written to)")
+    parser.add_argument("--warmup", type=float, default=1.0)
+    parser.add_argument("--api-latency", type=float, default=0.02)
+    parser.add_argument("--api-jitter", type=float, default=0.01)
+    parser.add_argument("--forbidden-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after-every", type=int, default=0, help="answer every Nth call of a method with 429")
+    parser.add_argument("--enforce-limits", action="store_true", help="answer 429 past 30 msg/s, ~1/s per private chat, 20/min per group")
+    parser.add_argument("--with-broadcast", action="store_true", help="run a broadcast to every user while replaying")
+    parser.add_argument("--member-status", default="member", help="getChatMember status for required chats")
+    parser.add_argument("--upstream-latency", type=float, default=0.03)
+    parser.add_argument("--upstream-jitter", type=float, default=0.02)
+    parser.add_argument("--upstream-error-rate", type=float, default=0.0)
+    parser.add_argument("--upstream-stall-rate", type=float, default=0.0)
+    parser.add_argument("--set", action="append", metavar="KEY.SUB=JSON", help="config override, e.g. --set IMAGE_POOL.ENABLED=false")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="where config and the generated database go (default: a temp dir)")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+    if args.scenario == "replay" and not args.trace:
+        parser.error("replay needs --trace")
+    if args.scenario == "flood" and args.rate <= 0:
+        parser.error("flood needs --rate (updates per second from everyone else)")
+    if args.trace:
+        args.trace = str(Path(args.trace).resolve())
+    if args.db:
+        args.db = str(Path(args.db).resolve())
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import asyncio
+import os
+import random
+from typing import Optional
+
+from aiohttp import web
+
+TAGS = ["waifu", "maid", "uniform", "selfies", "oppai", "marin-kitagawa", "mori-calliope", "raiden-shogun", "kamisato-ayaka", "ero", "ecchi", "milf"]
+
+### --- Local stand-in for api.waifu.im/images, with latency and fault injection --- ###
+class WaifuStub:
+    def __init__(self, latency: float = 0.03, jitter: float = 0.02, error_rate: float = 0.0, stall_rate: float = 0.0,
+                 stall: float = 3.0, connect_latency: float = 0.0, image_bytes: int = 50_000, catalog_size: int = 100_000, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall = stall
+        # extra delay on a connection's first request, standing in for TCP+TLS setup to a remote host
+        self.connect_latency = connect_latency
+        self.image_bytes = image_bytes
+        self.catalog_size = catalog_size
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.image_requests = 0
+        # client (host, port) seen, one per TCP connection the clients opened
+        self.peers = set()
+        self.base_url: Optional[str] = None
+        self._runner: Optional[web.AppRunner] = None
+
+    def _item(self, n: int, orientation: Optional[str], nsfw: bool) -> dict:
+        width, height = (800, 1200) if orientation == "Portrait" else (1200, 800) if orientation == "Landscape" else self.random.choice([(800, 1200), (1200, 800)])
+        return {
+            "url": f"{self.base_url}/img/{n}.jpg",
+            "width": width,
+            "height": height,
+            "is_nsfw": nsfw,
+            "tags": [{"name": name} for name in self.random.sample(TAGS, 3)],
+        }
+
+    @property
+    def connections(self) -> int:
+        return len(self.peers)
+
+    async def _seen(self, request: web.Request):
+        peer = request.transport.get_extra_info("peername") if request.transport is not None else None
+        if peer not in self.peers:
+            self.peers.add(peer)
+            if self.connect_latency:
+                await asyncio.sleep(self.connect_latency)
+
+    async def images(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        await self._seen(request)
+        roll = self.random.random()
+        if roll < self.error_rate:
+            await asyncio.sleep(self.latency)
+            return web.Response(status=503)
+        if roll < self.error_rate + self.stall_rate:
+            await asyncio.sleep(self.stall)
+        else:
+            await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+
+        query = request.query
+        count = int(query.get("PageSize", 1))
+        orientation = query.get("Orientation")
+        nsfw = query.get("IsNsfw") == "True"
+        items = [self._item(self.random.randrange(self.catalog_size), orientation, nsfw) for _ in range(count)]
+        return web.json_response({"items": items})
+
+    async def image(self, request: web.Request) -> web.Response:
+        self.image_requests += 1
+        await self._seen(request)
+        return web.Response(body=os.urandom(self.image_bytes), content_type="image/jpeg")
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_get("/images", self.images)
+        app.router.add_get("/img/{name}", self.image)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound = self._runner.addresses[0]
+        self.base_url = f"http://{bound[0]}:{bound[1]}"
+        return f"{self.base_url}/images"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
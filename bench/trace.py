@@ -0,0 +1,123 @@
+import json
+import random
+from typing import Iterator, List, Tuple
+
+# (offset in seconds from the start of the trace, raw Update JSON)
+TraceItem = Tuple[float, dict]
+
+INLINE_QUERIES = ["", "", "", "maid", "waifu landscape", "uniform v", "raiden-shogun", "mar", "nsfw", "random h"]
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}", "username": f"u{user_id}"}
+
+def _private_chat(user_id: int) -> dict:
+    return {"id": user_id, "type": "private", "first_name": f"User {user_id}"}
+
+### --- Synthetic updates, shaped like what Telegram sends --- ###
+def inline_update(update_id: int, user_id: int, query: str = "", offset: str = "") -> dict:
+    return {"update_id": update_id, "inline_query": {"id": str(update_id), "from": _user(user_id), "query": query, "offset": offset}}
+
+def command_update(update_id: int, user_id: int, command: str = "/start") -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": _private_chat(user_id),
+            "from": _user(user_id),
+            "text": command,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command.split()[0])}],
+        },
+    }
+
+def callback_update(update_id: int, user_id: int, data: str = "emptycallback") -> dict:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {"message_id": update_id, "date": 0, "chat": _private_chat(user_id), "text": "menu"},
+        },
+    }
+
+# scenario -> (inline, command, callback) weights
+MIXES = {
+    "inline": (1, 0, 0),
+    "start": (0, 1, 0),
+    "callback": (0, 0, 1),
+    "mixed": (0.8, 0.15, 0.05),
+}
+
+def synthetic(kind: str, user_ids: List[int], count: int, rate: float = 0.0, active_users: int = 1000, seed: int = 0) -> List[TraceItem]:
+    # rate 0 means "as fast as possible": every offset is 0 and concurrency decides the pace
+    rng = random.Random(seed)
+    users = rng.sample(user_ids, min(active_users, len(user_ids)))
+    weights = MIXES[kind]
+    trace = []
+    for n in range(count):
+        update_id = n + 1
+        user_id = rng.choice(users)
+        roll = rng.choices(("inline", "command", "callback"), weights)[0]
+        if roll == "inline":
+            update = inline_update(update_id, user_id, rng.choice(INLINE_QUERIES))
+        elif roll == "command":
+            update = command_update(update_id, user_id)
+        else:
+            update = callback_update(update_id, user_id)
+        trace.append((n / rate if rate else 0.0, update))
+    return trace
+
+def flood(user_ids: List[int], count: int, rate: float, abuser_rate: float, active_users: int = 1000, seed: int = 0) -> Tuple[List[TraceItem], int]:
+    # Inline traffic from ordinary users at `rate`, plus one user sending `abuser_rate` per second over the same stretch
+    good = synthetic("inline", user_ids, count, rate=rate, active_users=active_users, seed=seed)
+    rng = random.Random(seed + 1)
+    seen = {update["inline_query"]["from"]["id"] for _, update in good}
+    abuser = rng.choice([user_id for user_id in user_ids if user_id not in seen] or user_ids)
+    duration = count / rate
+    abuse = [(n / abuser_rate, inline_update(0, abuser, rng.choice(INLINE_QUERIES))) for n in range(int(duration * abuser_rate))]
+    trace = sorted(good + abuse, key=lambda item: item[0])
+    for n, (_, update) in enumerate(trace, start=1):
+        update["update_id"] = n
+        update["inline_query"]["id"] = str(n)
+    return trace, abuser
+
+def typing(user_ids: List[int], count: int, rate: float = 0.0, gap: float = 0.05, active_users: int = 1000, seed: int = 0) -> List[TraceItem]:
+    # Users typing a query: one inline query per keystroke (growing prefixes), `gap` seconds apart (+-40%).
+    # Typing sessions start so that all of them together send about `rate` updates per second (0: all at once).
+    rng = random.Random(seed)
+    users = rng.sample(user_ids, min(active_users, len(user_ids)))
+    phrases = [query for query in INLINE_QUERIES if len(query) > 1]
+    trace, start = [], 0.0
+    while len(trace) < count:
+        user_id, phrase = rng.choice(users), rng.choice(phrases)
+        at = start
+        for end in range(1, min(len(phrase), count - len(trace)) + 1):
+            trace.append((at, inline_update(0, user_id, phrase[:end])))
+            at += gap * rng.uniform(0.6, 1.4)
+        start += len(phrase) / rate if rate else 0.0
+    trace.sort(key=lambda item: item[0])
+    for n, (_, update) in enumerate(trace, start=1):
+        update["update_id"] = n
+        update["inline_query"]["id"] = str(n)
+    return trace
+
+### --- Recorded traces: one JSON object per line --- ###
+def load(path: str) -> Iterator[TraceItem]:
+    # Either a raw Update ({"update_id": ...}) or {"t": seconds, "update": {...}}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if "update" in item:
+                yield float(item.get("t", 0.0)), item["update"]
+            else:
+                yield 0.0, item
+
+def dump(path: str, trace: List[TraceItem]):
+    with open(path, "w", encoding="utf-8") as f:
+        for offset, update in trace:
+            f.write(json.dumps({"t": round(offset, 4), "update": update}, ensure_ascii=False) + "\n")
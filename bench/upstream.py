@@ -0,0 +1,92 @@
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import aiohttp
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench import env  # noqa: E402
+from bench.run import latency_summary  # noqa: E402
+from bench.stub_waifu import WaifuStub  # noqa: E402
+
+MODES = ("per_request", "shared")
+PARAMS = {"IsNsfw": "False", "PageSize": "1"}
+
+### --- waifu.im requests at a fixed concurrency, one mode at a time --- ###
+async def _get(session: aiohttp.ClientSession, url: str):
+    async with session.get(url, params=PARAMS) as response:
+        response.raise_for_status()
+        await response.json()
+
+async def run_mode(mode: str, url: str, stub: WaifuStub, requests: int, concurrency: int) -> dict:
+    from core.http_client import close_http_session, get_http_session
+
+    stub.peers.clear()
+    stub.requests = 0
+    gate = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one():
+        nonlocal errors
+        async with gate:
+            started = time.perf_counter()
+            try:
+                if mode == "per_request":
+                    # what fetch_waifu_image did before: a fresh session (and connection) per call
+                    async with aiohttp.ClientSession() as session:
+                        await _get(session, url)
+                else:
+                    await _get(get_http_session(), url)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                errors += 1
+                return
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    wall = time.perf_counter() - started
+    await close_http_session()
+    return {
+        "mode": mode,
+        "requests": stub.requests,
+        "connections": stub.connections,
+        "requests_per_connection": round(stub.requests / stub.connections, 1) if stub.connections else None,
+        "throughput": round(requests / wall, 2),
+        "latency_ms": latency_summary(latencies),
+        "errors": errors,
+    }
+
+async def run(args) -> dict:
+    stub = WaifuStub(latency=args.upstream_latency, jitter=args.upstream_jitter, connect_latency=args.connect_latency, seed=args.seed)
+    url = await stub.start()
+    workdir = tempfile.mkdtemp(prefix="zbbench-http-")
+    # only HTTP.* matters here; the database is never opened
+    env.prepare(workdir, str(Path(workdir) / "unused.db"), url, env.parse_overrides(args.set))
+    try:
+        results = [await run_mode(mode, url, stub, args.requests, args.concurrency) for mode in args.modes]
+    finally:
+        await stub.stop()
+    return {"requests": args.requests, "concurrency": args.concurrency, "upstream_latency": args.upstream_latency,
+            "connect_latency": args.connect_latency, "results": results}
+
+def main():
+    parser = argparse.ArgumentParser(description="Connections opened and latency of waifu.im calls: a session per request vs the shared pool")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16, help="above HTTP.POOL_LIMIT_PER_HOST (20) shared requests queue for a connection")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--upstream-latency", type=float, default=0.03)
+    parser.add_argument("--upstream-jitter", type=float, default=0.02)
+    parser.add_argument("--connect-latency", type=float, default=0.1, help="cost of a new connection (loopback has no TLS or RTT)")
+    parser.add_argument("--set", action="append", metavar="KEY.SUB=JSON", help="config override, e.g. --set HTTP.POOL_LIMIT_PER_HOST=8")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+if __name__ == "__main__":
+    main()
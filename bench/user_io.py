@@ -0,0 +1,92 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.db import DB  # noqa: E402
+from core import user_io  # noqa: E402
+from bench import gen_db  # noqa: E402
+
+def _peak_rss() -> int:
+    # VmHWM starts over on exec; ru_maxrss would carry the parent's peak (the generator) into each phase
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+### --- One phase per process, so each peak RSS is its own --- ###
+def run_phase(phase: str, db_path: str, file_path: str, fmt: str, mmap_size: int) -> dict:
+    # With mmap on, database pages read through the mapping count as RSS (shared page cache, not heap)
+    db = DB(db_path, pragmas={"mmap_size": mmap_size})
+    baseline = _peak_rss()
+    started = time.perf_counter()
+    if phase == "export":
+        rows = user_io.export_users(db, file_path, fmt)
+    elif phase == "import":
+        rows = user_io.import_users(db, file_path)["added"]
+    else:
+        # what the old DB.get_all_users did, for reference
+        with db._connect(write=False) as con:
+            rows = len(con.execute("SELECT * FROM users").fetchall())
+    seconds = time.perf_counter() - started
+    db.close()
+    return {
+        "phase": phase,
+        "format": fmt,
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_s": round(rows / seconds) if seconds else None,
+        "peak_rss_mb": round(_peak_rss() / 2 ** 20, 1),
+        "peak_rss_growth_mb": round((_peak_rss() - baseline) / 2 ** 20, 1),
+        "file_mb": round(os.path.getsize(file_path) / 2 ** 20, 1) if phase != "fetchall" else None,
+    }
+
+def _child(*args) -> dict:
+    out = subprocess.run([sys.executable, "-m", "bench.user_io", "--phase", *map(str, args)], cwd=Path(__file__).resolve().parent.parent,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out)
+
+def main():
+    parser = argparse.ArgumentParser(description="Rows/s and peak RSS of the users export and import")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--db", help="existing database to export (default: generate one)")
+    parser.add_argument("--workdir")
+    parser.add_argument("--mmap-size", type=int, default=0, help="PRAGMA mmap_size for the runs (the bot's default is 256 MiB)")
+    parser.add_argument("--phase", nargs=5, metavar=("PHASE", "DB", "FILE", "FORMAT", "MMAP"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase:
+        phase, db_path, file_path, fmt, mmap_size = args.phase
+        print(json.dumps(run_phase(phase, db_path, file_path, fmt, int(mmap_size))))
+        return
+
+    work = Path(args.workdir or tempfile.mkdtemp(prefix="zbbench-io-"))
+    source = args.db
+    if not source:
+        source = str(work / "source.db")
+        if not Path(source).exists():
+            gen_db.generate(source, args.users).close()
+
+    results = [_child("fetchall", source, "-", "-", args.mmap_size)]
+    for fmt in user_io.FORMATS:
+        export_file = str(work / f"users.{fmt}.gz")
+        results.append(_child("export", source, export_file, fmt, args.mmap_size))
+        target = work / f"import-{fmt}.db"
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{target}{suffix}").unlink(missing_ok=True)
+        results.append(_child("import", target, export_file, fmt, args.mmap_size))
+    print(json.dumps({"users": args.users if not args.db else None, "mmap_size": args.mmap_size, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
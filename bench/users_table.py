@@ -0,0 +1,85 @@
+import argparse
+import json
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.db import DB  # noqa: E402
+from bench import gen_db  # noqa: E402
+
+# added by migration 1; the primary key on user_id stays
+USER_INDEXES = ("idx_users_created_at", "idx_users_username_nocase", "idx_users_last_active", "idx_users_banned")
+# where in the list the admin pages are, as a share of all users
+DEPTHS = (0.001, 0.1, 0.9)
+PAGE = 10
+
+def _timed(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 3)
+
+### --- The admin panel's queries on one database, median ms over --repeat runs --- ###
+def measure(db_path: str, users: int, repeat: int, seed: int) -> dict:
+    db = DB(db_path)
+    rng = random.Random(seed)
+    timings = {}
+    for depth in DEPTHS:
+        offset = max(1, int(users * depth))
+        # the edge row a keyset button carries, looked up outside the timing
+        edge = db.get_users_page(1, offset - 1)[0]
+        timings[f"offset_page@{depth:g}"] = _timed(lambda: db.get_users_page(PAGE, offset), repeat)
+        timings[f"keyset_page@{depth:g}"] = _timed(lambda: db.get_users_after(edge["created_at"], edge["user_id"], PAGE), repeat)
+
+    with db._connect(write=False) as con:
+        names = [row[0] for row in con.execute("SELECT username FROM users WHERE username IS NOT NULL LIMIT 1000")]
+    # Telegram usernames are case-insensitive, so lookups come in any case
+    timings["username_lookup"] = _timed(lambda: db.find_user_by_any("@" + rng.choice(names).upper()), repeat)
+    timings["count_banned"] = _timed(db.count_banned, repeat)
+    since = int(time.time()) - 86400
+    timings["count_active_24h"] = _timed(lambda: db.count_active_since(since), repeat)
+    timings["count_users"] = _timed(db.count_users, repeat)
+    db.close()
+    return timings
+
+def drop_indexes(db_path: str):
+    con = sqlite3.connect(db_path)
+    for name in USER_INDEXES:
+        con.execute(f"DROP INDEX IF EXISTS {name}")
+    con.execute("VACUUM")
+    con.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Admin user-list queries on a large users table: OFFSET vs keyset pages, lookups and counts, with and without indexes")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", help="existing database to copy (default: generate one)")
+    parser.add_argument("--workdir")
+    args = parser.parse_args()
+
+    work = Path(args.workdir or tempfile.mkdtemp(prefix="zbbench-users-"))
+    source = args.db or str(work / "source.db")
+    if not args.db and not Path(source).exists():
+        gen_db.generate(source, args.users, seed=args.seed).close()
+    users = sqlite3.connect(source).execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    indexed, bare = str(work / "indexed.db"), str(work / "no-indexes.db")
+    shutil.copy(source, indexed)
+    shutil.copy(source, bare)
+    # user_version stays at the latest migration, so opening it does not put the indexes back
+    drop_indexes(bare)
+    results = {"indexed": measure(indexed, users, args.repeat, args.seed), "no_indexes": measure(bare, users, args.repeat, args.seed)}
+    print(json.dumps({"users": users, "page": PAGE, "repeat": args.repeat, "median_ms": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
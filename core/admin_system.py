@@ -1,21 +1,46 @@
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram.constants import ChatAction
+from telegram.error import TelegramError
 from telegram.ext import ContextTypes
 
-from core.config_loader import DBH, TEXTS, reload_config, reload_texts
+import asyncio
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from typing import Optional
+
+from core.config_loader import ADB, STATE, TEXTS, reload_config, reload_texts, render
 from core.utils import check_user, is_admin, is_owner, now_ts, fmt_ts, human_ago
+from core.broadcast import start_job, progress_text
+from core.user_io import FORMATS, export_users, import_users_async
+
+log = logging.getLogger(__name__)
+
+# Users per /users page
+PAGE_SIZE = 20
+# Bot API limit for files a bot downloads
+IMPORT_MAX_BYTES = 20 * 1024 * 1024
 
-# Admin panel settings:
+# Admin panel settings (defaults), current values live in the shared state
 ADMIN_PANEL = {
     "notify_new_user": True
 }
-PAGE_SIZE = 20
+
+# The shared state may be a file on disk: read and written on a thread, never on the loop
+async def panel_settings() -> dict:
+    return await asyncio.to_thread(lambda: {name: STATE.get(f"admin_panel:{name}", default) for name, default in ADMIN_PANEL.items()})
+
+async def set_panel_setting(name: str, value):
+    await asyncio.to_thread(STATE.set, f"admin_panel:{name}", value)
 
 ### ---------------------------- Admin Panel ---------------------------- ###
-def admin_panel_keyboard():
+def admin_panel_keyboard(settings: dict):
     rows = [
         [
             InlineKeyboardButton(
-                TEXTS["admin"]["panel_keyboard"]["new_user_active"] if ADMIN_PANEL["notify_new_user"] else TEXTS["admin"]["panel_keyboard"]["new_user_inactive"],
+                TEXTS["admin"]["panel_keyboard"]["new_user_active"] if settings["notify_new_user"] else TEXTS["admin"]["panel_keyboard"]["new_user_inactive"],
                 callback_data="toggle_user_notify"
             )
         ],
@@ -31,21 +56,22 @@ def admin_panel_keyboard():
     ]
     return InlineKeyboardMarkup(rows)
 
-def admin_panel_text():
-    return TEXTS["admin"]["panel_text"].format(user_notify_status='فعال ✅' if ADMIN_PANEL['notify_new_user'] else 'غیرفعال ❌')
+def admin_panel_text(settings: dict):
+    return render("admin.panel_text", user_notify_status='فعال ✅' if settings['notify_new_user'] else 'غیرفعال ❌')
 
 async def adminpanel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if await check_user(update, context, check_force_join=False) < 0:
         return
-    if not is_admin(update.effective_user.id):
+    if not await is_admin(update.effective_user.id):
         return
-    await update.effective_chat.send_message(admin_panel_text(), reply_markup=admin_panel_keyboard(), parse_mode="HTML")
+    settings = await panel_settings()
+    await update.effective_chat.send_message(admin_panel_text(settings), reply_markup=admin_panel_keyboard(settings), parse_mode="HTML")
 
 ### --- Broadcast Command --- ###
 async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if await check_user(update, context, check_force_join=False) < 0:
         return
-    if not is_owner(update.effective_user.id):
+    if not await is_owner(update.effective_user.id):
         return
     
     # If not a reply, show usage help
@@ -57,53 +83,111 @@ async def broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     target = None
     if context.args:
         key = context.args[0]
-        user = DBH.find_user_by_any(key)
+        user = await ADB.find_user_by_any(key)
         if not user:
             await update.effective_chat.send_message(TEXTS["errors"]["user_notfound"], parse_mode="HTML")
             return
         target = user["user_id"]
 
-    # Get all target chat IDs
-    chat_ids = []
-    if target:
-        chat_ids = [target]
-    else:
-        with DBH._connect() as con:
-            cur = con.cursor()
-            # Add all active user IDs
-            user_ids = [row[0] for row in cur.execute(
-                "SELECT user_id FROM users WHERE banned=0"
-            ).fetchall()]
-        
-        # Merge lists and remove duplicates
-        chat_ids = list(set(user_ids))
-    
-    # Forward message
     message = update.message.reply_to_message
-    success = 0
-    failed = 0
-    for chat_id in chat_ids:
+
+    # Single user: send right away
+    if target:
         try:
-            await context.bot.copy_message(
-                chat_id=chat_id,
-                from_chat_id=message.chat_id,
-                message_id=message.message_id
-            )
-            success += 1
+            await context.bot.copy_message(chat_id=target, from_chat_id=message.chat_id, message_id=message.message_id)
+            success, failed = 1, 0
         except Exception:
-            failed += 1
-    
-    await update.effective_chat.send_message(
-        TEXTS["admin"]["broadcast"]["result"].format(success=success, failed=failed),
-        parse_mode="HTML"
-    )
+            success, failed = 0, 1
+        await update.effective_chat.send_message(
+            render("admin.broadcast.result", success=success, failed=failed, blocked=0),
+            parse_mode="HTML"
+        )
+        return
+
+    # Everyone: hand off to a background job and report progress on a status message
+    total = await ADB.count_broadcast_targets()
+    job_id = await ADB.create_broadcast_job(message.chat_id, message.message_id, total, now_ts())
+    job = await ADB.get_broadcast_job(job_id)
+    status = await update.effective_chat.send_message(progress_text(job), parse_mode="HTML")
+    await ADB.update_broadcast_job(job_id, status_chat_id=status.chat_id, status_message_id=status.message_id)
+    await start_job(context.bot, job_id)
+
+### --- Export / import the users table (owner) --- ###
+# Both run on a DB executor thread and stream through a temp file, memory does not grow with the table
+async def admin_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if await check_user(update, context, check_force_join=False) < 0:
+        return
+    if not await is_owner(update.effective_user.id):
+        return
+
+    fmt = context.args[0].lower() if context.args else "csv"
+    if fmt not in FORMATS:
+        await update.effective_chat.send_message(TEXTS["admin"]["export"]["usage"], parse_mode="HTML")
+        return
+
+    await update.effective_chat.send_chat_action(ChatAction.UPLOAD_DOCUMENT)
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}.gz")
+    os.close(fd)
+    try:
+        # Pending last_active updates belong in the export
+        await ADB.flush()
+        rows = await ADB.run(export_users, ADB.db, path, fmt, write=False)
+        with open(path, "rb") as f:
+            await update.effective_chat.send_document(
+                f, filename=f"users-{time.strftime('%Y%m%d-%H%M%S')}.{fmt}.gz",
+                caption=render("admin.export.caption", rows=rows), write_timeout=300, read_timeout=300
+            )
+    except (OSError, sqlite3.Error, TelegramError) as e:
+        log.error("User export failed: %r", e)
+        await update.effective_chat.send_message(TEXTS["admin"]["export"]["failed"])
+    finally:
+        os.remove(path)
+
+async def admin_import(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if await check_user(update, context, check_force_join=False) < 0:
+        return
+    if not await is_owner(update.effective_user.id):
+        return
+
+    reply = update.message.reply_to_message if update.message else None
+    document = reply.document if reply else None
+    if not document:
+        await update.effective_chat.send_message(TEXTS["admin"]["import"]["usage"], parse_mode="HTML")
+        return
+    if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+        await update.effective_chat.send_message(render("admin.import.too_big", max_mb=IMPORT_MAX_BYTES // (1024 * 1024)))
+        return
+
+    fd, path = tempfile.mkstemp(suffix=".import")
+    os.close(fd)
+    try:
+        file = await document.get_file()
+        await file.download_to_drive(path, read_timeout=300)
+        counts = await import_users_async(ADB, path)
+    except (OSError, sqlite3.Error, TelegramError) as e:
+        log.error("User import failed: %r", e)
+        await update.effective_chat.send_message(TEXTS["admin"]["import"]["failed"])
+        return
+    finally:
+        os.remove(path)
+
+    # Other workers may have cached "unknown user" for ids that exist now, and their counters are off
+    await asyncio.to_thread(STATE.publish, "user", None)
+    await asyncio.to_thread(STATE.publish, "stats")
+    await update.effective_chat.send_message(render("admin.import.result", **counts), parse_mode="HTML")
 
 ### --- Admin view list of all users Command --- ###
-async def show_all_users(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 1):
-    if not is_owner(update.effective_user.id):
+def parse_users_cursor(parts) -> Optional[tuple]:
+    # ["n"|"p", created_at, user_id] from a show_users button; anything else pages by OFFSET
+    if len(parts) != 3 or parts[0] not in ("n", "p") or not all(part.lstrip("-").isdigit() for part in parts[1:]):
+        return None
+    return parts[0], int(parts[1]), int(parts[2])
+
+async def show_all_users(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 1, cursor: tuple = None):
+    if not await is_owner(update.effective_user.id):
         return
 
-    total = DBH.count_users()
+    total = ADB.db.stats.total
     if total == 0:
         if update.callback_query:
             await update.callback_query.edit_message_text(TEXTS["errors"]["user_notfound"])
@@ -113,9 +197,29 @@ async def show_all_users(update: Update, context: ContextTypes.DEFAULT_TYPE, pag
 
     max_page = max(1, (total + PAGE_SIZE - 1) // PAGE_SIZE)
     page = max(1, min(page, max_page))
-    offset = (page - 1) * PAGE_SIZE
 
-    users = DBH.get_users_page(PAGE_SIZE, offset)
+    # cursor = (direction, created_at, user_id) of the neighbouring page's edge row
+    users = []
+    if cursor:
+        direction, created_at, edge_user_id = cursor
+        if direction == "n":
+            users = await ADB.get_users_after(created_at, edge_user_id, PAGE_SIZE)
+        else:
+            users = await ADB.get_users_before(created_at, edge_user_id, PAGE_SIZE)
+    if not users:
+        # first page, or buttons from before keyset paging
+        page = page if not cursor else 1
+        users = await ADB.get_users_page(PAGE_SIZE, (page - 1) * PAGE_SIZE)
+    if not users and page > 1:
+        # the counter ran ahead of the table (users deleted since the last reconcile)
+        page = 1
+        users = await ADB.get_users_page(PAGE_SIZE, 0)
+    if not users:
+        if update.callback_query:
+            await update.callback_query.edit_message_text(TEXTS["errors"]["user_notfound"])
+        else:
+            await update.message.reply_text(TEXTS["errors"]["user_notfound"])
+        return
 
     message = (
         f"📊 تعداد کل کاربران: {total}\n"
@@ -124,10 +228,11 @@ async def show_all_users(update: Update, context: ContextTypes.DEFAULT_TYPE, pag
     )
 
     buttons = []
+    first, last = users[0], users[-1]
     if page > 1:
-        buttons.append(InlineKeyboardButton("⬅️ قبلی", callback_data=f"show_users:{page-1}"))
+        buttons.append(InlineKeyboardButton("⬅️ قبلی", callback_data=_users_button(page - 1, "p", first)))
     if page < max_page:
-        buttons.append(InlineKeyboardButton("➡️ بعدی", callback_data=f"show_users:{page+1}"))
+        buttons.append(InlineKeyboardButton("➡️ بعدی", callback_data=_users_button(page + 1, "n", last)))
 
     markup = InlineKeyboardMarkup([buttons]) if buttons else None
 
@@ -136,11 +241,17 @@ async def show_all_users(update: Update, context: ContextTypes.DEFAULT_TYPE, pag
     else:
         await update.message.reply_text(message[:4096], reply_markup=markup, parse_mode="HTML")
 
+def _users_button(page: int, direction: str, edge) -> str:
+    # A row without created_at can't be a keyset edge, that button pages by OFFSET
+    if edge["created_at"] is None:
+        return f"show_users:{page}"
+    return f"show_users:{page}:{direction}:{edge['created_at']}:{edge['user_id']}"
+
 ### --- Admin view user information Command --- ###
 async def admin_userinfo(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int = None):
     if await check_user(update, context, check_force_join=False) < 0:
         return
-    if not is_admin(update.effective_user.id):
+    if not await is_admin(update.effective_user.id):
         return
     
     is_edit = update.callback_query is not None
@@ -156,7 +267,7 @@ async def admin_userinfo(update: Update, context: ContextTypes.DEFAULT_TYPE, use
     target_user_id = None
     if context.args:
         key = context.args[0]
-        row = DBH.find_user_by_any(key)
+        row = await ADB.find_user_by_any(key)
         if row:
             target_user_id = row["user_id"]
         else:
@@ -165,7 +276,7 @@ async def admin_userinfo(update: Update, context: ContextTypes.DEFAULT_TYPE, use
     elif is_edit:
         if user_id:
             target_user_id = user_id
-            row = DBH.get_user(target_user_id)
+            row = await ADB.get_user(target_user_id)
             if not row:
                 await update.effective_chat.send_message(TEXTS["errors"]["user_notfound"], parse_mode="HTML")
                 return
@@ -192,10 +303,10 @@ async def admin_userinfo(update: Update, context: ContextTypes.DEFAULT_TYPE, use
 # Generate userinfo text from user_id
 async def generate_userinfo_text(user_id: int) -> str:
     # Get user stats from DB
-    user_stats = DBH.stats_for_user(user_id)
-    banned = DBH.get_user(user_id)["banned"]
+    user_stats = await ADB.stats_for_user(user_id)
+    banned = (await ADB.get_user(user_id))["banned"]
     now = now_ts()
-    text = TEXTS["admin"]["user_info"].format(
+    text = render("admin.user_info",
         user_id=user_id,
         username=user_stats["username"] or "بدون یوزرنیم",
         full_name=user_stats["full_name"] or "بدون نام",
@@ -217,18 +328,19 @@ async def admin_callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE):
     data = query.data or ""
     user_id = update.effective_user.id
 
-    if not is_admin(user_id):
+    if not await is_admin(user_id):
         await query.answer(TEXTS["errors"]["access_denied"], show_alert=True)
         return
     
     elif data.startswith("show_users:"):
-        page = int(data.split(":")[1])
-        await show_all_users(update, context, page=page)
+        parts = data.split(":")
+        page = int(parts[1]) if parts[1].isdigit() else 1
+        await show_all_users(update, context, page=page, cursor=parse_users_cursor(parts[2:]))
         return
     
     elif data.startswith("admin_banuser:"):
         target_user_id = int(data.split(":")[1])
-        user = DBH.get_user(target_user_id)
+        user = await ADB.get_user(target_user_id)
 
         # Check ban yourself
         if user_id == target_user_id:
@@ -240,27 +352,31 @@ async def admin_callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.answer(TEXTS["errors"]["user_notfound"], show_alert=True)
             return
         
-        DBH.set_ban(target_user_id, not user["banned"])
+        await ADB.set_ban(target_user_id, not user["banned"])
+        # Other workers drop their cached copy of this user
+        await asyncio.to_thread(STATE.publish, "user", target_user_id)
         await query.answer(TEXTS["admin"]["ban_state_changed"], show_alert=True)
         await admin_userinfo(update, context, target_user_id)
         return
 
     elif data == "toggle_user_notify":
-        ADMIN_PANEL["notify_new_user"] = not ADMIN_PANEL["notify_new_user"]
+        await set_panel_setting("notify_new_user", not (await panel_settings())["notify_new_user"])
         await query.answer(TEXTS["admin"]["setting_saved"], show_alert=True)
 
     elif data == "status_panel":
-        with DBH._connect() as con:
-            cur = con.cursor()
-            total_users = cur.execute("SELECT COUNT(*) FROM users").fetchone()[0]
-            banned_users = cur.execute("SELECT COUNT(*) FROM users WHERE banned=1").fetchone()[0]
-            import datetime
-            today = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            today_ts = int(today.timestamp())
-            today_active = cur.execute("SELECT COUNT(*) FROM users WHERE last_active >= ?", (today_ts,)).fetchone()[0]
+        # Counters are maintained incrementally, no COUNT(*) here
+        stats = ADB.db.stats
+        daily_active = "\n".join(f"• {time.strftime('%m-%d', time.localtime(day))}: {count}" for day, count in stats.daily_histogram(7))
+        hourly_active = "\n".join(f"• {time.strftime('%H:00', time.localtime(hour))}: {count}" for hour, count in stats.hourly_histogram(12))
 
         await query.edit_message_text(
-            TEXTS["admin"]["status_result"].format(total_users=total_users, banned_users=banned_users, today_active=today_active),
+            render("admin.status_result",
+                total_users=stats.total,
+                banned_users=stats.banned,
+                today_active=stats.today_active(),
+                daily_active=daily_active,
+                hourly_active=hourly_active,
+            ),
             reply_markup=InlineKeyboardMarkup([
                 [InlineKeyboardButton(TEXTS["admin"]["backtomenu"], callback_data="adminpanel")]
             ]),
@@ -270,6 +386,7 @@ async def admin_callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     elif data == "reload_config":
         if reload_config():
+            await asyncio.to_thread(STATE.publish, "reload_config")
             await query.answer(TEXTS["admin"]["reload_config"]["success"])
         else:
             await query.answer(TEXTS["admin"]["reload_config"]["error"])
@@ -277,14 +394,17 @@ async def admin_callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     elif data == "reload_texts":
         if reload_texts():
+            await asyncio.to_thread(STATE.publish, "reload_texts")
             await query.answer(TEXTS["admin"]["reload_texts"]["success"])
         else:
             await query.answer(TEXTS["admin"]["reload_texts"]["error"])
         return
     
     elif data == "adminpanel":
-        await query.edit_message_text(admin_panel_text(), reply_markup=admin_panel_keyboard(), parse_mode="HTML")
+        settings = await panel_settings()
+        await query.edit_message_text(admin_panel_text(settings), reply_markup=admin_panel_keyboard(settings), parse_mode="HTML")
         return
 
-    await query.edit_message_text(admin_panel_text(), reply_markup=admin_panel_keyboard(), parse_mode="HTML")
+    settings = await panel_settings()
+    await query.edit_message_text(admin_panel_text(settings), reply_markup=admin_panel_keyboard(settings), parse_mode="HTML")
     return
\ No newline at end of file
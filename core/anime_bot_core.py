@@ -1,11 +1,25 @@
-from telegram import Update, InlineQueryResultPhoto, InlineQueryResultsButton
+from telegram import Update, InlineQueryResultCachedPhoto, InlineQueryResultPhoto, InlineQueryResultsButton
 from telegram.ext import ContextTypes
-import uuid
 import aiohttp
-from io import BytesIO
+import asyncio
+import logging
+import secrets
+import time
+import uuid
+import weakref
+from typing import Dict
 
 from core.utils import has_active_private_chat, check_user
-from core.config_loader import TEXTS
+from core.config_loader import CFG, snapshot
+from core.http_client import get_http_session
+from core.image_pool import ImagePools
+from core.cache import TTLCache
+from core.catalog import catalog_enabled, parse_tags, record_images, sample as catalog_sample, search as catalog_search
+from core.media_cache import MEDIA, media_enabled
+from core.metrics import Gauge, observe_upstream, register
+from core.resilience import CircuitOpen, UpstreamError, build_upstream_call
+
+log = logging.getLogger(__name__)
 
 ### --- waifu argument parser --- ###
 def parse_waifu_args_from_text(text: str):
@@ -28,8 +42,29 @@ def parse_waifu_args_from_text(text: str):
 
 
 ### --- fetch image helper --- ###
+# Deadline, jittered retries, hedging and a circuit breaker around the waifu.im API call
+UPSTREAM = build_upstream_call()
+register(Gauge("bot_upstream_breaker_open", "1 while the waifu.im circuit breaker is open", lambda: {(): int(UPSTREAM.breaker.state != "closed")}))
+
+async def _request_images(url: str, params: dict):
+    session = get_http_session()
+    started = time.perf_counter()
+    status = "error"
+    try:
+        async with session.get(url, params=params) as resp:
+            status = resp.status
+            if resp.status >= 500 or resp.status == 429:
+                raise UpstreamError(f"HTTP {resp.status}")
+            if resp.status != 200:
+                return None
+            return await resp.json()
+    except aiohttp.ClientError as e:
+        raise UpstreamError(repr(e))
+    finally:
+        observe_upstream(status, time.perf_counter() - started)
+
 async def fetch_waifu_image(orientation=None, is_nsfw=None, min_height=None, limit=1, download=False):
-    url = "https://api.waifu.im/images"
+    url = CFG.get("UPSTREAM", {}).get("URL", "https://api.waifu.im/images")
     params = {}
 
     if orientation:
@@ -41,33 +76,150 @@ async def fetch_waifu_image(orientation=None, is_nsfw=None, min_height=None, lim
     if limit > 1:
         params["PageSize"] = str(int(limit))
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, params=params) as resp:
-            if resp.status != 200:
-                return None
-            data = await resp.json()
-            if not data.get("items"):
-                return None
+    try:
+        data = await UPSTREAM(lambda: _request_images(url, params))
+    except UpstreamError as e:
+        log.warning("waifu.im request failed: %r", e)
+        return None
+    except CircuitOpen:
+        # Callers fall back to the pools and the local catalog
+        return None
 
-            results = []
-            for image_data in data["items"]:
-                image_url = image_data["url"]
-                tags = ", ".join([t["name"] for t in image_data.get("tags", [])])
+    if not data or not data.get("items"):
+        return None
 
-                img_bytes = None
-                if download:
-                    async with session.get(image_url) as img_resp:
-                        if img_resp.status != 200:
-                            continue
-                        img_bytes = BytesIO(await img_resp.read())
-                        img_bytes.name = "waifu" + (".png" if image_url.endswith(".png") else ".jpg")
+    # Every upstream answer also grows the local catalog
+    try:
+        await record_images(data["items"], is_nsfw)
+    except Exception as e:
+        log.warning("Catalog update failed: %r", e)
 
-                results.append((img_bytes, tags, image_url))
+    results = []
+    for image_data in data["items"]:
+        image_url = image_data["url"]
+        tags = ", ".join([t["name"] for t in image_data.get("tags", [])])
+
+        img_path = None
+        if download:
+            # Streamed into the on-disk media cache; the path can be passed to send_photo as is
+            img_path = await MEDIA.fetch(image_url)
+            if img_path is None:
+                continue
+
+        results.append((img_path, tags, image_url))
 
     return results
 
+### --- singleflight: concurrent identical fetches share one upstream call --- ###
+UPSTREAM_FETCHES: Dict[tuple, asyncio.Task] = {}
+
+async def fetch_shared(orientation, is_nsfw, limit):
+    if not CFG.get("INLINE", {}).get("SINGLEFLIGHT", True):
+        return await fetch_waifu_image(orientation=orientation, is_nsfw=is_nsfw, limit=limit, download=False)
+    key = (orientation, is_nsfw, limit)
+    task = UPSTREAM_FETCHES.get(key)
+    if task is None:
+        task = asyncio.create_task(fetch_waifu_image(orientation=orientation, is_nsfw=is_nsfw, limit=limit, download=False))
+        UPSTREAM_FETCHES[key] = task
+        task.add_done_callback(lambda _: UPSTREAM_FETCHES.pop(key, None))
+    # shield: a superseded waiter must not cancel the fetch for everyone else
+    return await asyncio.shield(task)
+
+### --- prefetched image pools --- ###
+POOLS = ImagePools(fetch_waifu_image)
+register(Gauge(
+    "bot_image_pool_size", "Prefetched images waiting per filter",
+    lambda: {(str(key[0]), str(key[1]), str(pool.stale)): len(pool.items) for key, pool in POOLS.pools.items()},
+    ("orientation", "nsfw", "stale"),
+))
+
+async def get_inline_images(orientation, is_nsfw, limit=10):
+    images = POOLS.take(orientation, is_nsfw, limit)
+    if images:
+        return images
+
+    # Pool still cold: the catalog holds everything fetched so far, the pools keep refilling it
+    if POOLS.enabled:
+        images = await catalog_sample(orientation, is_nsfw, limit)
+        if images:
+            return images
+
+    # Pool disabled or nothing local yet: fall back to a live upstream call
+    fetched = await fetch_shared(orientation, is_nsfw, limit)
+    if fetched:
+        return [(image_url, tags) for _, tags, image_url in fetched]
+    return await catalog_sample(orientation, is_nsfw, limit)
+
+### --- inline pagination: one cursor per inline session --- ###
+# token -> {"user_id", "orientation", "is_nsfw", "tags", "seen", "pages"}; MAX_SESSIONS applies on restart
+INLINE_SESSIONS = TTLCache(CFG.get("INLINE", {}).get("MAX_SESSIONS", 20000), CFG.get("INLINE", {}).get("SESSION_TTL", 600))
+
+def get_inline_session(offset: str, user_id: int, orientation, is_nsfw, tags=()):
+    token, _, page = offset.partition(":")
+    session = INLINE_SESSIONS.get(token, None) if token else None
+    if session is None or session["user_id"] != user_id or not page.isdigit():
+        # First page, or the cursor expired: start a new stream
+        token = secrets.token_urlsafe(6)
+        session = {"token": token, "user_id": user_id, "orientation": orientation, "is_nsfw": is_nsfw, "tags": list(tags), "seen": set(), "pages": {}}
+        INLINE_SESSIONS.set(token, session, CFG.get("INLINE", {}).get("SESSION_TTL", 600))
+        return session, 0
+    return session, int(page)
+
+async def inline_page(session, page_no: int, limit: int):
+    # Same offset asked twice (Telegram retries) gets the same slice
+    if page_no in session["pages"]:
+        return session["pages"][page_no]
+
+    if session["tags"]:
+        # Tag queries are answered from the local catalog
+        page = await catalog_search(session["tags"], session["orientation"], session["is_nsfw"], limit, exclude=session["seen"])
+        if page or page_no > 0:
+            session["seen"].update(image_url for image_url, _ in page)
+            session["pages"][page_no] = page
+            return page
+        # Nothing in the catalog for these words (typo, Persian, a tag not seen yet): random images as before
+        session["tags"] = []
+
+    page = []
+    for _ in range(3):
+        for image_url, tags in await get_inline_images(session["orientation"], session["is_nsfw"], limit):
+            if image_url not in session["seen"] and len(page) < limit:
+                session["seen"].add(image_url)
+                page.append((image_url, tags))
+        if len(page) >= limit:
+            break
+    session["pages"][page_no] = page
+    return page
+
+### --- supersede: only the newest inline query of a user keeps running --- ###
+INFLIGHT: Dict[int, asyncio.Task] = {}
+# Tasks cancelled by supersede_previous; any other cancellation (shutdown) must propagate
+SUPERSEDED: "weakref.WeakSet[asyncio.Task]" = weakref.WeakSet()
+# user_id -> monotonic time of the last inline query, to tell typing from a single query
+LAST_QUERY = TTLCache(CFG.get("INLINE", {}).get("MAX_SESSIONS", 20000), 10)
+
+def supersede_previous(user_id: int):
+    current = asyncio.current_task()
+    previous = INFLIGHT.get(user_id)
+    if previous is not None and previous is not current and not previous.done():
+        SUPERSEDED.add(previous)
+        previous.cancel()
+    INFLIGHT[user_id] = current
+
+def is_typing(user_id: int, window: float) -> bool:
+    now = time.monotonic()
+    last = LAST_QUERY.get(user_id, None)
+    LAST_QUERY.set(user_id, now)
+    return last is not None and now - last < window
+
+def release_inflight(user_id: int):
+    if INFLIGHT.get(user_id) is asyncio.current_task():
+        del INFLIGHT[user_id]
+
 ### --- random character inline --- ###
 async def random_inline(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Config and texts for this whole answer, taken once (and consistent across a reload)
+    snap = snapshot()
     check = await check_user(update, context)
 
     # user is banned
@@ -78,7 +230,7 @@ async def random_inline(update: Update, context: ContextTypes.DEFAULT_TYPE):
             cache_time=0,
             is_personal=True,
             button=InlineQueryResultsButton(
-                text=TEXTS["errors"]["banned"],
+                text=snap.texts["errors"]["banned"],
                 start_parameter="ban"
             )
         )
@@ -101,32 +253,64 @@ async def random_inline(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     query = update.inline_query.query.strip()
     orientation, is_nsfw = parse_waifu_args_from_text(query)
+    tags = parse_tags(query) if catalog_enabled(snap.cfg) else []
+    inline_cfg = snap.cfg.get("INLINE", {})
+    cache_time = inline_cfg.get("CACHE_TIME", 5)
+    page_size = inline_cfg.get("PAGE_SIZE", 10)
+    user_id = update.effective_user.id
+    session, page_no = get_inline_session(update.inline_query.offset, user_id, orientation, is_nsfw, tags)
 
-    images = await fetch_waifu_image(
-        orientation=orientation,
-        is_nsfw=is_nsfw,
-        limit=10,
-        download=False
-    )
+    # While typing, every keystroke is a new query: let the newest one win
+    if inline_cfg.get("SUPERSEDE", True):
+        supersede_previous(user_id)
+    try:
+        debounce = inline_cfg.get("DEBOUNCE_MS", 300) / 1000
+        # A lone query is answered at once; only a query that follows another within the window
+        # waits, so a burst of keystrokes collapses into its last one. Scrolling is never debounced.
+        if debounce and page_no == 0 and is_typing(user_id, debounce):
+            await asyncio.sleep(debounce)
+        images = await inline_page(session, page_no, page_size)
+    except asyncio.CancelledError:
+        task = asyncio.current_task()
+        if task not in SUPERSEDED:
+            raise
+        # A newer query from the same user took over
+        SUPERSEDED.discard(task)
+        return
+    finally:
+        release_inflight(user_id)
 
     if not images:
         await update.inline_query.answer([], cache_time=0, is_personal=True)
         return
 
+    # Images already uploaded once are sent by file_id, Telegram does not fetch them again
+    media_on = media_enabled(snap.cfg)
+    file_ids = await MEDIA.file_ids([image_url for image_url, _ in images]) if media_on else {}
+    # bound str.format of the template, looked up once per answer
+    caption_format = snap.templates["animebot.message"]
     results = []
-    for img_bytes, tags, image_url in images:
+    for image_url, tags in images:
+        caption = caption_format(tags=tags)
+        if image_url in file_ids:
+            results.append(InlineQueryResultCachedPhoto(id=str(uuid.uuid4()), photo_file_id=file_ids[image_url], caption=caption, parse_mode="HTML"))
+            continue
+        if media_on:
+            MEDIA.schedule_upload(image_url)
         results.append(
             InlineQueryResultPhoto(
                 id=str(uuid.uuid4()),
                 photo_url=image_url,
                 thumbnail_url=image_url,
-                caption=TEXTS["animebot"]["message"].format(tags=tags),
+                caption=caption,
                 parse_mode="HTML",
             )
         )
 
+    has_more = page_no + 1 < inline_cfg.get("MAX_PAGES", 20)
     await update.inline_query.answer(
         results,
-        cache_time=0,
-        is_personal=True
+        cache_time=cache_time,
+        is_personal=True,
+        next_offset=f"{session['token']}:{page_no + 1}" if has_more else ""
     )
\ No newline at end of file
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import time
+from itertools import takewhile
+from typing import Dict, Optional
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError, TimedOut
+
+from core.config_loader import ADB, CFG, STATE, render
+from core.outbound import ALERT, BULK, outbound_args
+from core.ratelimit import TokenBucket, retry_after_seconds
+from core.state import WORKER_ID
+
+log = logging.getLogger(__name__)
+
+# job_id -> running task (one per job per process)
+RUNNING: Dict[int, asyncio.Task] = {}
+
+SENT, FAILED, BLOCKED = "sent", "failed", "blocked"
+
+def _settings() -> dict:
+    return CFG.get("BROADCAST", {})
+
+### --- One worker per job: a lease in the shared state, renewed while sending --- ###
+def _lease_key(job_id: int) -> str:
+    return f"broadcast_lease:{job_id}"
+
+def _lease_ttl() -> float:
+    return _settings().get("LEASE_TTL", 120)
+
+### --- Send a single copy, honouring RetryAfter --- ###
+async def _send_one(bot: Bot, job: dict, chat_id: int, limiter: Optional[TokenBucket], max_retries: int) -> str:
+    # The retries live here; the outbound scheduler paces BULK sends but doesn't retry them
+    for attempt in range(max_retries + 1):
+        if limiter:
+            await limiter.acquire()
+        try:
+            await bot.copy_message(chat_id=chat_id, from_chat_id=job["from_chat_id"], message_id=job["message_id"], **outbound_args(bot, BULK))
+            return SENT
+        except RetryAfter as e:
+            # Flood limit is global for the bot: stop every sender, not only this one
+            # (the outbound scheduler has already paused its own bucket)
+            if limiter:
+                limiter.pause(retry_after_seconds(e))
+        except Forbidden:
+            return BLOCKED
+        except (TimedOut, NetworkError):
+            await asyncio.sleep(min(2 ** attempt, 30))
+        except TelegramError:
+            return FAILED
+    return FAILED
+
+### --- Progress message --- ###
+def progress_text(job: dict) -> str:
+    done = job["success"] + job["failed"] + job["blocked"]
+    key = "progress" if job["status"] == "running" else "result"
+    return render(f"admin.broadcast.{key}",
+        done=done, total=job["total"], success=job["success"], failed=job["failed"], blocked=job["blocked"]
+    )
+
+async def _report(bot: Bot, job: dict):
+    if not job.get("status_message_id"):
+        return
+    try:
+        await bot.edit_message_text(progress_text(job), chat_id=job["status_chat_id"], message_id=job["status_message_id"], parse_mode="HTML", **outbound_args(bot, ALERT))
+    except BadRequest:
+        # "message is not modified" or the status message was deleted
+        pass
+    except TelegramError as e:
+        log.warning("Broadcast %s progress update failed: %r", job["job_id"], e)
+
+### --- Job runner --- ###
+async def _commit(job: dict, user_ids: list, results: Dict[int, str]):
+    # Record a run of finished sends, starting at the cursor: a restart resumes after the last one
+    blocked = [user_id for user_id in user_ids if results[user_id] == BLOCKED]
+    reached = [user_id for user_id in user_ids if results[user_id] == SENT]
+    await ADB.set_pm_state(blocked, 0)
+    await ADB.set_pm_state(reached, 1)
+    job["cursor"] = user_ids[-1]
+    job["success"] += len(reached)
+    job["blocked"] += len(blocked)
+    job["failed"] += len(user_ids) - len(reached) - len(blocked)
+    await ADB.update_broadcast_job(job["job_id"], cursor=job["cursor"], success=job["success"], failed=job["failed"], blocked=job["blocked"])
+
+async def _send_all(bot: Bot, job: dict):
+    settings = _settings()
+    concurrency = settings.get("CONCURRENCY", 20)
+    chunk_size = settings.get("CHUNK_SIZE", 200)
+    max_retries = settings.get("MAX_RETRIES", 3)
+    progress_interval = settings.get("PROGRESS_INTERVAL", 5)
+    # With the outbound scheduler on, its global bucket paces the job; a second bucket would only slow it down
+    limiter = TokenBucket(rate=settings.get("RATE", 25), capacity=settings.get("BURST", 25)) if bot.rate_limiter is None else None
+    semaphore = asyncio.Semaphore(concurrency)
+    job_id = job["job_id"]
+
+    last_report = 0.0
+    while job["status"] == "running":
+        user_ids = await ADB.get_user_ids_after(job["cursor"], chunk_size)
+        if not user_ids:
+            job["status"] = "done"
+            job["finished_at"] = int(time.time())
+            break
+
+        results: Dict[int, str] = {}
+
+        async def send(chat_id: int):
+            async with semaphore:
+                results[chat_id] = await _send_one(bot, job, chat_id, limiter, max_retries)
+
+        try:
+            await asyncio.gather(*(send(user_id) for user_id in user_ids))
+        except asyncio.CancelledError:
+            # Stopped mid-chunk: keep what is confirmed so a restart re-sends at most the sends that were in flight
+            confirmed = list(takewhile(results.__contains__, user_ids))
+            if confirmed:
+                await _commit(job, confirmed, results)
+            raise
+        await _commit(job, user_ids, results)
+
+        # Renew only while the lease is still ours; if it ran out and another worker took the job, stop here
+        if not await asyncio.to_thread(STATE.set_if, _lease_key(job_id), WORKER_ID, WORKER_ID, ttl=_lease_ttl()):
+            log.warning("Broadcast %s: lease lost to another worker, stopping", job_id)
+            return
+
+        if time.monotonic() - last_report >= progress_interval:
+            last_report = time.monotonic()
+            await _report(bot, job)
+
+    await ADB.update_broadcast_job(job_id, status=job["status"], finished_at=job.get("finished_at"))
+    await _report(bot, job)
+
+async def run_job(bot: Bot, job_id: int):
+    try:
+        job = await ADB.get_broadcast_job(job_id)
+        if job is None:
+            log.warning("Broadcast %s does not exist", job_id)
+            return
+        try:
+            await _send_all(bot, job)
+        except Exception:
+            # A bug or a database error must not leave the job 'running' forever with nobody sending it
+            log.exception("Broadcast %s failed", job_id)
+            job["status"] = "failed"
+            job["finished_at"] = int(time.time())
+            await ADB.update_broadcast_job(job_id, status=job["status"], finished_at=job["finished_at"])
+            await _report(bot, job)
+    finally:
+        await _release_lease(job_id)
+
+async def _release_lease(job_id: int):
+    # Let another worker pick the job up right away instead of waiting for the lease to expire,
+    # unless the lease already belongs to someone else. Shielded: on shutdown the job is cancelled first
+    try:
+        await asyncio.shield(asyncio.to_thread(STATE.delete_if, _lease_key(job_id), WORKER_ID))
+    except Exception as e:
+        log.warning("Broadcast %s: releasing the lease failed, it expires on its own: %r", job_id, e)
+
+def _job_done(job_id: int, task: asyncio.Task):
+    RUNNING.pop(job_id, None)
+
+async def start_job(bot: Bot, job_id: int) -> Optional[asyncio.Task]:
+    if job_id in RUNNING and not RUNNING[job_id].done():
+        return RUNNING[job_id]
+    if not await asyncio.to_thread(STATE.add_once, _lease_key(job_id), WORKER_ID, ttl=_lease_ttl()):
+        # Another worker is sending this job
+        return None
+    task = asyncio.create_task(run_job(bot, job_id), name=f"broadcast:{job_id}")
+    RUNNING[job_id] = task
+    task.add_done_callback(lambda t: _job_done(job_id, t))
+    return task
+
+### --- Resume unfinished jobs after a restart --- ###
+async def resume_jobs(bot: Bot):
+    for job in await ADB.get_running_broadcast_jobs():
+        if job["job_id"] in RUNNING:
+            continue
+        if await start_job(bot, job["job_id"]):
+            log.info("Resuming broadcast %s from user_id > %s", job["job_id"], job["cursor"])
+
+async def resume_periodically(bot: Bot):
+    # Picks up jobs whose worker died and whose lease ran out
+    while True:
+        await asyncio.sleep(_lease_ttl())
+        try:
+            await resume_jobs(bot)
+        except Exception as e:
+            log.warning("Broadcast resume check failed: %r", e)
+
+async def stop_jobs():
+    # Jobs stay 'running' in the DB and resume on the next start
+    tasks = list(RUNNING.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,58 @@
+import random
+import re
+import time
+from typing import List, Mapping, Optional, Tuple
+
+from core.config_loader import ADB, CFG
+
+# Words parse_waifu_args_from_text already understands, everything else is a tag
+KEYWORDS = {"nsfw", "portrait", "vertical", "v", "landscape", "horizontal", "h", "random"}
+
+def _settings() -> dict:
+    return CFG.get("CATALOG", {})
+
+def catalog_enabled(cfg: Mapping = CFG) -> bool:
+    return cfg.get("CATALOG", {}).get("ENABLED", True)
+
+### --- Free-text tags ("maid landscape" -> ["maid"]) --- ###
+def parse_tags(text: str) -> List[str]:
+    words = re.findall(r"[\w-]+", text.lower())
+    return [word for word in words if word not in KEYWORDS]
+
+def match_expression(tags: List[str], prefix: bool = False) -> str:
+    # every tag must match; quoted so FTS syntax can't leak in
+    return " ".join(f'"{tag}"*' if prefix else f'"{tag}"' for tag in tags)
+
+def orientation_of(width: Optional[int], height: Optional[int]) -> Optional[str]:
+    if not width or not height:
+        return None
+    return "Portrait" if height >= width else "Landscape"
+
+### --- Populated from every upstream response --- ###
+async def record_images(items: List[dict], is_nsfw: Optional[bool]) -> int:
+    if not catalog_enabled():
+        return 0
+    rows = []
+    for item in items:
+        width, height = item.get("width"), item.get("height")
+        nsfw = item.get("is_nsfw", item.get("isNsfw", is_nsfw))
+        tags = ", ".join(t["name"] for t in item.get("tags", []))
+        rows.append((item["url"], tags, orientation_of(width, height), width, height, 1 if nsfw else 0))
+    return await ADB.add_images(rows, int(time.time()))
+
+### --- Queries --- ###
+async def search(tags: List[str], orientation: Optional[str], is_nsfw: bool, limit: int, exclude=()) -> List[Tuple[str, str]]:
+    # Ranked candidates, then a random pick among them so the same query doesn't always show the same images
+    wanted = _settings().get("CANDIDATES", 200) + len(exclude)
+    candidates = await ADB.search_images(match_expression(tags), orientation, is_nsfw, wanted)
+    if not candidates:
+        # Half-typed tag ("mari" for "marin"): prefix queries are much slower, so only as a fallback
+        candidates = await ADB.search_images(match_expression(tags, prefix=True), orientation, is_nsfw, wanted)
+    candidates = [item for item in candidates if item[0] not in exclude]
+    picked = sorted(random.sample(range(len(candidates)), min(limit, len(candidates))))
+    return [candidates[index] for index in picked]
+
+async def sample(orientation: Optional[str], is_nsfw: bool, limit: int) -> List[Tuple[str, str]]:
+    if not catalog_enabled():
+        return []
+    return await ADB.sample_images(orientation, is_nsfw, limit)
@@ -1,28 +1,196 @@
+import asyncio
 import json
+import logging
+import sqlite3
+from collections.abc import Mapping
 from pathlib import Path
-from core.db import DB
+from string import Formatter
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Optional
+
+from core.db import DB, AsyncDB
+from core.state import build_state
+
+log = logging.getLogger(__name__)
 
 # Paths
 CONFIG_PATH = Path("config/config.json")
 TEXTS_PATH = Path("config/texts.json")
 
-# Initial
-CFG = json.loads(CONFIG_PATH.read_text(encoding="utf-8"))
-TEXTS = json.loads(TEXTS_PATH.read_text(encoding="utf-8"))
-DBH = DB(CFG["DB_PATH"])
-
-def reload_config():
-    global CFG, DBH
-    new_cfg = json.loads(CONFIG_PATH.read_text(encoding="utf-8"))
-    CFG.clear()
-    CFG.update(new_cfg)
-    DBH = DB(CFG["DB_PATH"])
-    return CFG
-
-
-def reload_texts():
-    global TEXTS
-    new_texts = json.loads(TEXTS_PATH.read_text(encoding="utf-8"))
-    TEXTS.clear()
-    TEXTS.update(new_texts)
-    return TEXTS
\ No newline at end of file
+class ConfigError(ValueError):
+    pass
+
+### --- Compiled, read-only snapshot of config + texts --- ###
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+def _thaw(value):
+    if isinstance(value, Mapping):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+def _compile_templates(texts: dict, prefix: str = "") -> Dict[str, Callable[..., str]]:
+    # "admin.panel_text" -> bound str.format; a template with broken braces fails here, not in a handler
+    templates = {}
+    for key, value in texts.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            templates.update(_compile_templates(value, f"{name}."))
+        elif isinstance(value, str):
+            try:
+                list(Formatter().parse(value))
+            except ValueError as e:
+                raise ConfigError(f"texts: {name}: {e}")
+            templates[name] = value.format
+    return templates
+
+def _validate_config(cfg: Any):
+    if not isinstance(cfg, dict):
+        raise ConfigError("config: top level must be an object")
+    for key in ("BOT_TOKEN", "DB_PATH"):
+        if not isinstance(cfg.get(key), str) or not cfg[key]:
+            raise ConfigError(f"config: {key} must be a non-empty string")
+    for key in ("ADMINS", "OWNERS"):
+        if not isinstance(cfg.get(key, []), list) or not all(isinstance(user_id, int) for user_id in cfg.get(key, [])):
+            raise ConfigError(f"config: {key} must be a list of user ids")
+    chats = cfg.get("REQUIRED_CHATS", [])
+    if not isinstance(chats, list):
+        raise ConfigError("config: REQUIRED_CHATS must be a list")
+    for number, item in enumerate(chats):
+        if not isinstance(item, dict) or not isinstance(item.get("chat_id"), (int, str)) or not item.get("title") or not item.get("join_link"):
+            raise ConfigError(f"config: REQUIRED_CHATS[{number}] needs chat_id, title and join_link")
+
+class Snapshot:
+    __slots__ = ("cfg", "texts", "admins", "owners", "staff", "required_chats", "templates")
+
+    def __init__(self, cfg: dict, texts: dict):
+        _validate_config(cfg)
+        if not isinstance(texts, dict):
+            raise ConfigError("texts: top level must be an object")
+        self.templates = MappingProxyType(_compile_templates(texts))
+        self.cfg = _freeze(cfg)
+        self.texts = _freeze(texts)
+        self.owners = frozenset(cfg.get("OWNERS", []))
+        self.admins = frozenset(cfg.get("ADMINS", []))
+        # admins + owners, what is_admin and the admin update lane check
+        self.staff = self.admins | self.owners
+        self.required_chats = self.cfg.get("REQUIRED_CHATS", ())
+
+def _read_json(path: Path):
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        raise ConfigError(f"{path}: {e}")
+
+# Replaced as a whole on reload (one assignment), never mutated
+_SNAPSHOT = Snapshot(_read_json(CONFIG_PATH), _read_json(TEXTS_PATH))
+
+def snapshot() -> Snapshot:
+    return _SNAPSHOT
+
+def render(name: str, **values) -> str:
+    return _SNAPSHOT.templates[name](**values)
+
+### --- CFG / TEXTS: read-only views that always follow the current snapshot --- ###
+class _LiveView(Mapping):
+    __slots__ = ("_attr",)
+
+    def __init__(self, attr: str):
+        self._attr = attr
+
+    def __getitem__(self, key):
+        return getattr(_SNAPSHOT, self._attr)[key]
+
+    def get(self, key, default=None):
+        return getattr(_SNAPSHOT, self._attr).get(key, default)
+
+    def __contains__(self, key):
+        return key in getattr(_SNAPSHOT, self._attr)
+
+    def __iter__(self):
+        return iter(getattr(_SNAPSHOT, self._attr))
+
+    def __len__(self):
+        return len(getattr(_SNAPSHOT, self._attr))
+
+CFG = _LiveView("cfg")
+TEXTS = _LiveView("texts")
+
+def _make_db(cfg: Mapping = CFG) -> DB:
+    cache_cfg = cfg.get("USER_CACHE", {})
+    return DB(
+        cfg["DB_PATH"],
+        cache_size=cache_cfg.get("MAX_SIZE", 10000),
+        cache_ttl=cache_cfg.get("TTL", 300),
+        pragmas=cfg.get("DB_PRAGMAS"),
+        flush_max_batch=cfg.get("WRITE_BEHIND", {}).get("MAX_BATCH", 500),
+    )
+
+# Use ADB.db rather than DBH elsewhere: it follows a DB_PATH change on reload
+DBH = _make_db()
+# Called with a database opened by a reload, before it is swapped in (e.g. metrics wrappers)
+DB_SETUP_HOOKS: List[Callable[[DB], None]] = []
+ADB = AsyncDB(DBH, readers=CFG.get("DB_READERS", 4))
+# Settings, dedup keys and cross-worker events; "sqlite" lets several workers share them
+STATE = build_state(CFG)
+
+### --- Reload: build and validate first, then swap; a bad edit keeps the old snapshot --- ###
+def _swap(load: Callable[[], Snapshot], what: str) -> bool:
+    global _SNAPSHOT, DBH
+    try:
+        new = load()
+        # Open a moved database before switching, so a bad DB_PATH is rejected too
+        db = _make_db(new.cfg) if new.cfg["DB_PATH"] != DBH.path else None
+    except (ConfigError, OSError, sqlite3.Error) as e:
+        log.error("%s reload rejected: %s", what, e)
+        return False
+    _SNAPSHOT = new
+    # Cached rows may no longer match what admins expect after a config edit
+    DBH.invalidate_cache()
+    if db is not None:
+        for hook in DB_SETUP_HOOKS:
+            hook(db)
+        old, DBH = DBH, db
+        ADB.db = db
+        ADB.retire(old)
+    return True
+
+def reload_config() -> Optional[Mapping]:
+    if _swap(lambda: Snapshot(_read_json(CONFIG_PATH), _thaw(_SNAPSHOT.texts)), "Config"):
+        return CFG
+    return None
+
+def reload_texts() -> Optional[Mapping]:
+    if _swap(lambda: Snapshot(_thaw(_SNAPSHOT.cfg), _read_json(TEXTS_PATH)), "Texts"):
+        return TEXTS
+    return None
+
+### --- Optional file watcher: reload after the files stop changing --- ###
+async def watch_config_files(interval: float = 2.0, debounce: float = 1.0):
+    def mtimes():
+        return tuple(path.stat().st_mtime_ns if path.exists() else 0 for path in (CONFIG_PATH, TEXTS_PATH))
+
+    seen = mtimes()
+    while True:
+        await asyncio.sleep(interval)
+        current = mtimes()
+        if current == seen:
+            continue
+        # Editors save in several writes; wait until the files are quiet
+        while True:
+            await asyncio.sleep(debounce)
+            settled = mtimes()
+            if settled == current:
+                break
+            current = settled
+        if current[0] != seen[0] and reload_config():
+            log.info("Config reloaded from %s", CONFIG_PATH)
+        if current[1] != seen[1] and reload_texts():
+            log.info("Texts reloaded from %s", TEXTS_PATH)
+        seen = current
@@ -1,18 +1,153 @@
+import asyncio
+import logging
+import random
 import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from itertools import islice
 from pathlib import Path
-from typing import Optional, Any, Dict, Tuple, List
+from typing import Optional, Any, Dict, Iterable, Iterator, Tuple, List
+
+from core.cache import TTLCache, MISSING
+from core.stats import Stats
+
+log = logging.getLogger(__name__)
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version
+# Tag search for the image catalog; skipped on SQLite builds without FTS5, and added once FTS5 shows up
+CATALOG_FTS = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS images_fts USING fts5(tags, content='images', content_rowid='image_id')",
+    """CREATE TRIGGER IF NOT EXISTS images_ai AFTER INSERT ON images BEGIN
+        INSERT INTO images_fts(rowid, tags) VALUES (new.image_id, new.tags);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS images_ad AFTER DELETE ON images BEGIN
+        INSERT INTO images_fts(images_fts, rowid, tags) VALUES ('delete', old.image_id, old.tags);
+    END""",
+]
+
+MIGRATIONS = [
+    # 1: indexes for the admin user list, lookups and status panel counts
+    [
+        "CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(created_at, user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_users_username_nocase ON users(username COLLATE NOCASE)",
+        "CREATE INDEX IF NOT EXISTS idx_users_last_active ON users(last_active)",
+        "CREATE INDEX IF NOT EXISTS idx_users_banned ON users(banned) WHERE banned=1",
+    ],
+    # 2: media cache index (url -> file on disk and/or Telegram file_id)
+    [
+        """CREATE TABLE IF NOT EXISTS media (
+            url TEXT PRIMARY KEY,
+            sha256 TEXT,
+            size INTEGER,
+            ext TEXT,
+            file_id TEXT,
+            last_used INTEGER
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_media_last_used ON media(last_used) WHERE sha256 IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS idx_media_sha256 ON media(sha256)",
+    ],
+    # 3: local image catalog with full-text tag search
+    [
+        """CREATE TABLE IF NOT EXISTS images (
+            image_id INTEGER PRIMARY KEY,
+            url TEXT UNIQUE,
+            tags TEXT,
+            orientation TEXT,
+            width INTEGER,
+            height INTEGER,
+            is_nsfw INTEGER,
+            added_at INTEGER
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_images_filter ON images(is_nsfw, orientation)",
+        *CATALOG_FTS,
+    ],
+    # 4: users imported without timestamps; a NULL created_at falls outside keyset paging
+    [
+        "UPDATE users SET created_at = COALESCE(last_active, CAST(strftime('%s', 'now') AS INTEGER)) WHERE created_at IS NULL",
+        "UPDATE users SET last_active = created_at WHERE last_active IS NULL",
+    ],
+]
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "cache_size": -16000,   # negative = KiB
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",
+}
+
+# users table columns, in the order export files and import_users use
+USER_COLUMNS = ("user_id", "username", "full_name", "user_hash", "created_at", "last_active", "banned", "pm_state")
 
 class DB:
-    def __init__(self, path: str):
+    def __init__(self, path: str, cache_size: int = 10000, cache_ttl: float = 300, pragmas: Optional[Dict[str, Any]] = None, flush_max_batch: int = 500):
         self.path = path
+        self.pragmas = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+        # user_id -> user row (as dict), None for unknown users
+        self.user_cache = TTLCache(cache_size, cache_ttl)
+
+        # Write-behind buffer: user_id -> (username, full_name, last_active), coalesced per user
+        self.flush_max_batch = flush_max_batch
+        self._dirty: Dict[int, Tuple[Optional[str], str, int]] = {}
+        # The batch a flush is writing right now, still newer than the rows on disk until it commits
+        self._inflight: Dict[int, Tuple[Optional[str], str, int]] = {}
+        self._dirty_lock = threading.Lock()
+        self.flush_stats = {"flushes": 0, "rows": 0, "last_batch": 0, "max_batch": 0, "last_latency_ms": 0.0, "max_latency_ms": 0.0}
+        # total / banned / active-user counters, kept in memory and in the stats table
+        self.stats = Stats()
         Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        # One long-lived writer shared by all threads, one reader per thread (WAL lets them run side by side)
+        self._write_lock = threading.RLock()
+        self._writer = self._open()
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
         self._init_db()
 
-    def _connect(self):
-        con = sqlite3.connect(self.path)
+    def _open(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.path, check_same_thread=False)
         con.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            con.execute(f"PRAGMA {name}={value}")
         return con
 
+    def _reader(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = self._open()
+            self._local.con = con
+            self._readers.append(con)
+        return con
+
+    @contextmanager
+    def _connect(self, write: bool = True):
+        if not write:
+            yield self._reader()
+            return
+        with self._write_lock:
+            # commits on success, rolls back on error
+            with self._writer:
+                yield self._writer
+
+    def close(self):
+        # flush() returns at once while another thread's flush is in flight; wait for that one
+        # and write what was touched meanwhile, or those rows are lost with the connection
+        while True:
+            self.flush()
+            with self._dirty_lock:
+                if not self._dirty and not self._inflight:
+                    break
+            time.sleep(0.01)
+        with self._write_lock:
+            self._writer.close()
+        for con in self._readers:
+            con.close()
+        self._readers.clear()
+
     def _init_db(self):
         with self._connect() as con:
             cur = con.cursor()
@@ -25,71 +160,320 @@ class DB:
                 user_hash TEXT UNIQUE,
                 created_at INTEGER,
                 last_active INTEGER,
-                banned INTEGER DEFAULT 0
+                banned INTEGER DEFAULT 0,
+                pm_state INTEGER
+            );""")
+            # pm_state: NULL unknown, 1 reachable in private chat, 0 bot blocked
+            columns = {row[1] for row in cur.execute("PRAGMA table_info(users)")}
+            if "pm_state" not in columns:
+                cur.execute("ALTER TABLE users ADD COLUMN pm_state INTEGER")
+
+            # broadcast jobs (progress survives restarts)
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS broadcast_jobs (
+                job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                from_chat_id INTEGER,
+                message_id INTEGER,
+                status_chat_id INTEGER,
+                status_message_id INTEGER,
+                cursor INTEGER DEFAULT 0,
+                total INTEGER DEFAULT 0,
+                success INTEGER DEFAULT 0,
+                failed INTEGER DEFAULT 0,
+                blocked INTEGER DEFAULT 0,
+                status TEXT DEFAULT 'running',
+                created_at INTEGER,
+                finished_at INTEGER
+            );""")
+
+            # incrementally maintained counters (see core/stats.py)
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS stats (
+                key TEXT PRIMARY KEY,
+                value INTEGER
             );""")
 
             con.commit()
 
+            self._migrate(cur)
+
+        self.stats.load(self._writer.execute("SELECT key, value FROM stats").fetchall())
+        if not self.stats.loaded:
+            self.reconcile_stats()
+
+    def _migrate(self, cur: sqlite3.Cursor):
+        self.fts5 = self._has_fts5(cur)
+        if not self.fts5:
+            log.warning("SQLite was built without FTS5: tag search is off, tag queries get random images")
+        version = cur.execute("PRAGMA user_version").fetchone()[0]
+        for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            for statement in statements:
+                if statement in CATALOG_FTS and not self.fts5:
+                    continue
+                cur.execute(statement)
+            cur.execute(f"PRAGMA user_version={number}")
+
+        # Migrated without FTS5 earlier, SQLite has it now: build the index from the catalog
+        if self.fts5 and not cur.execute("SELECT 1 FROM sqlite_master WHERE name='images_fts'").fetchone():
+            for statement in CATALOG_FTS:
+                cur.execute(statement)
+            cur.execute("INSERT INTO images_fts(images_fts) VALUES ('rebuild')")
+            cur.connection.commit()
+
+    @staticmethod
+    def _has_fts5(cur: sqlite3.Cursor) -> bool:
+        try:
+            cur.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts5_probe USING fts5(x)")
+            cur.execute("DROP TABLE temp.fts5_probe")
+            return True
+        except sqlite3.OperationalError:
+            return False
+
     # ——— users ———
-    def get_all_users(self) -> list:
-        with self._connect() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM users")
-            return cursor.fetchall()
-        
-    def count_users(self) -> int:
+    # Keyset scan in batches: memory stays flat and no read snapshot is held for the whole scan.
+    # Consume it on the thread that created it (one of the executor threads).
+    def iter_users(self, batch: int = 1000) -> Iterator[sqlite3.Row]:
+        last_user_id = -(2 ** 63)
+        while True:
+            with self._connect(write=False) as con:
+                rows = con.execute("SELECT * FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?", (last_user_id, batch)).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last_user_id = rows[-1]["user_id"]
+
+    def insert_users(self, rows: List[Tuple]) -> int:
+        # rows in USER_COLUMNS order; existing user_id / user_hash are kept. One transaction.
         with self._connect() as con:
+            cur = con.executemany(
+                f"INSERT OR IGNORE INTO users ({', '.join(USER_COLUMNS)}) VALUES ({', '.join('?' * len(USER_COLUMNS))})",
+                rows
+            )
+        return cur.rowcount
+
+    def users_imported(self):
+        # Cached "unknown user" answers may be stale now; counters are recounted rather than patched
+        self.invalidate_cache()
+        self.reconcile_stats()
+
+    def import_users(self, rows: Iterable[Tuple], batch: int = 5000) -> int:
+        # One transaction per batch; a failed import keeps the batches before it (re-running it skips them)
+        added = 0
+        rows = iter(rows)
+        for chunk in iter(lambda: list(islice(rows, batch)), []):
+            added += self.insert_users(chunk)
+        self.users_imported()
+        return added
+
+    def count_users(self) -> int:
+        with self._connect(write=False) as con:
             cur = con.cursor()
             return cur.execute("SELECT COUNT(*) FROM users").fetchone()[0]
 
+    def count_banned(self) -> int:
+        with self._connect(write=False) as con:
+            cur = con.cursor()
+            return cur.execute("SELECT COUNT(*) FROM users WHERE banned=1").fetchone()[0]
+
+    def count_active_since(self, ts: int) -> int:
+        with self._connect(write=False) as con:
+            cur = con.cursor()
+            return cur.execute("SELECT COUNT(*) FROM users WHERE last_active >= ?", (ts,)).fetchone()[0]
+
     def get_users_page(self, limit: int, offset: int):
-        with self._connect() as con:
+        with self._connect(write=False) as con:
             cur = con.cursor()
             cur.execute(
-                "SELECT * FROM users ORDER BY created_at ASC LIMIT ? OFFSET ?",
+                "SELECT * FROM users ORDER BY created_at ASC, user_id ASC LIMIT ? OFFSET ?",
                 (limit, offset)
             )
             return cur.fetchall()
 
-    def get_user(self, user_id: int) -> Optional[sqlite3.Row]:
-        with self._connect() as con:
+    # Keyset pagination over (created_at, user_id): cost does not grow with the page number
+    def get_users_after(self, created_at: int, user_id: int, limit: int):
+        with self._connect(write=False) as con:
             cur = con.cursor()
-            cur.execute("SELECT * FROM users WHERE user_id=?", (user_id,))
-            return cur.fetchone()
+            cur.execute(
+                "SELECT * FROM users WHERE (created_at, user_id) > (?, ?) ORDER BY created_at ASC, user_id ASC LIMIT ?",
+                (created_at, user_id, limit)
+            )
+            return cur.fetchall()
 
-    def upsert_user(self, user_id: int, username: Optional[str], full_name: str, user_hash: str, now_ts: int) -> sqlite3.Row:
+    def get_users_before(self, created_at: int, user_id: int, limit: int):
+        with self._connect(write=False) as con:
+            cur = con.cursor()
+            cur.execute(
+                "SELECT * FROM users WHERE (created_at, user_id) < (?, ?) ORDER BY created_at DESC, user_id DESC LIMIT ?",
+                (created_at, user_id, limit)
+            )
+            return cur.fetchall()[::-1]
+
+    def _fetch_user(self, cur: sqlite3.Cursor, user_id: int) -> Optional[Dict[str, Any]]:
+        cur.execute("SELECT * FROM users WHERE user_id=?", (user_id,))
+        row = cur.fetchone()
+        return dict(row) if row else None
+
+    def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        row = self.user_cache.get(user_id)
+        if row is not MISSING:
+            return row
+        # The row on disk may lag behind the write-behind buffer or a flush in progress;
+        # look before reading, so a flush committing in between can't leave a stale row
+        pending = self._dirty.get(user_id) or self._inflight.get(user_id)
+        with self._connect(write=False) as con:
+            row = self._fetch_user(con.cursor(), user_id)
+        if row and pending:
+            row.update(username=pending[0], full_name=pending[1], last_active=pending[2])
+        self.user_cache.set(user_id, row)
+        return row
+
+    def upsert_user(self, user_id: int, username: Optional[str], full_name: str, user_hash: str, now_ts: int) -> Dict[str, Any]:
+        existing = self.get_user(user_id)
+        if existing:
+            row = self.touch_user(existing, username, full_name, now_ts)
+            if self.needs_flush():
+                self.flush()
+            return row
+
+        # New users are inserted right away
         with self._connect() as con:
             cur = con.cursor()
-            existing = self.get_user(user_id)
-            if existing:
-                cur.execute("""UPDATE users SET username=?, full_name=?, last_active=?
-                               WHERE user_id=?""", (username, full_name, now_ts, user_id))
-            else:
-                cur.execute("""INSERT INTO users (user_id, username, full_name, user_hash, created_at, last_active)
-                               VALUES (?, ?, ?, ?, ?, ?)""",
-                            (user_id, username, full_name, user_hash, now_ts, now_ts))
+            cur.execute("""INSERT INTO users (user_id, username, full_name, user_hash, created_at, last_active)
+                           VALUES (?, ?, ?, ?, ?, ?)""",
+                        (user_id, username, full_name, user_hash, now_ts, now_ts))
+            row = self._fetch_user(cur, user_id)
             con.commit()
-        return self.get_user(user_id)
+        self.stats.user_added(now_ts)
+        # write-through
+        self.user_cache.set(user_id, row)
+        return row
+
+    # ——— write-behind ———
+    def touch_user(self, existing: Dict[str, Any], username: Optional[str], full_name: str, now_ts: int) -> Dict[str, Any]:
+        user_id = existing["user_id"]
+        row = {**existing, "username": username, "full_name": full_name, "last_active": now_ts}
+        with self._dirty_lock:
+            self._dirty[user_id] = (username, full_name, now_ts)
+        self.stats.user_active(existing["last_active"], now_ts)
+        self.user_cache.set(user_id, row)
+        return row
+
+    def needs_flush(self) -> bool:
+        return len(self._dirty) >= self.flush_max_batch
+
+    def flush(self) -> int:
+        if self.stats.dirty:
+            self.save_stats()
+        with self._dirty_lock:
+            if self._inflight:
+                # another thread is flushing
+                return 0
+            batch, self._dirty = self._dirty, {}
+            self._inflight = batch
+        if not batch:
+            return 0
+
+        started = time.perf_counter()
+        try:
+            with self._connect() as con:
+                con.executemany(
+                    "UPDATE users SET username=?, full_name=?, last_active=? WHERE user_id=?",
+                    [(username, full_name, last_active, user_id) for user_id, (username, full_name, last_active) in batch.items()]
+                )
+        except sqlite3.Error:
+            # Put the batch back; entries touched meanwhile are newer and win
+            with self._dirty_lock:
+                self._dirty = {**batch, **self._dirty}
+                self._inflight = {}
+            raise
+        with self._dirty_lock:
+            self._inflight = {}
+        latency_ms = (time.perf_counter() - started) * 1000
+
+        stats = self.flush_stats
+        stats["flushes"] += 1
+        stats["rows"] += len(batch)
+        stats["last_batch"] = len(batch)
+        stats["max_batch"] = max(stats["max_batch"], len(batch))
+        stats["last_latency_ms"] = latency_ms
+        stats["max_latency_ms"] = max(stats["max_latency_ms"], latency_ms)
+        return len(batch)
+
+    # ——— stats ———
+    def save_stats(self, absolute: Iterable[Tuple[str, int]] = ()):
+        # Increments, not snapshots: workers sharing the database add to the same rows instead of overwriting them
+        deltas = self.stats.take_deltas()
+        oldest_day, oldest_hour = self.stats.oldest_buckets(time.time())
+        try:
+            with self._connect() as con:
+                con.executemany("INSERT OR REPLACE INTO stats (key, value) VALUES (?, ?)", absolute)
+                con.executemany("INSERT INTO stats (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = value + excluded.value", deltas)
+                con.execute("DELETE FROM stats WHERE key LIKE 'day:%' AND CAST(substr(key, 5) AS INTEGER) < ?", (oldest_day,))
+                con.execute("DELETE FROM stats WHERE key LIKE 'hour:%' AND CAST(substr(key, 6) AS INTEGER) < ?", (oldest_hour,))
+                rows = con.execute("SELECT key, value FROM stats").fetchall()
+        except sqlite3.Error:
+            self.stats.restore_deltas(deltas)
+            raise
+        # Pick up what the other workers saved
+        self.stats.load(rows)
+
+    def load_stats(self):
+        # Counters another worker saved or reconciled
+        with self._connect(write=False) as con:
+            self.stats.load(con.execute("SELECT key, value FROM stats").fetchall())
+
+    def reconcile_stats(self):
+        self.flush()
+        now = time.time()
+        day = Stats.day_start(now)
+        hour = Stats.hour_start(now)
+        rows = self.stats.reconcile(
+            self.count_users(), self.count_banned(),
+            day, self.count_active_since(day),
+            hour, self.count_active_since(hour),
+        )
+        self.save_stats(absolute=rows)
+
+    def pending_writes(self) -> int:
+        return len(self._dirty)
 
     def set_ban(self, user_id: int, banned: bool):
         with self._connect() as con:
             cur = con.cursor()
-            cur.execute("UPDATE users SET banned=? WHERE user_id=?", (1 if banned else 0, user_id))
+            cur.execute("UPDATE users SET banned=? WHERE user_id=? AND banned IS NOT ?", (1 if banned else 0, user_id, 1 if banned else 0))
+            changed = cur.rowcount
             con.commit()
+        if changed:
+            self.stats.ban_changed(1 if banned else -1)
+        # write-through
+        cached = self.user_cache.get(user_id, None)
+        if cached:
+            self.user_cache.set(user_id, {**cached, "banned": 1 if banned else 0})
+        else:
+            self.user_cache.pop(user_id)
+
+    def invalidate_cache(self, user_id: Optional[int] = None):
+        if user_id is None:
+            self.user_cache.clear()
+        else:
+            self.user_cache.pop(user_id)
+
+    def cache_stats(self) -> Dict[str, int]:
+        return self.user_cache.stats()
 
     def find_user_by_any(self, key: str) -> Optional[sqlite3.Row]:
-        with self._connect() as con:
+        with self._connect(write=False) as con:
             cur = con.cursor()
             if key.isdigit():
                 cur.execute("SELECT * FROM users WHERE user_id=?", (int(key),))
             elif key.startswith('@'):
-                cur.execute("SELECT * FROM users WHERE username=?", (key[1:],))
+                cur.execute("SELECT * FROM users WHERE username=? COLLATE NOCASE", (key[1:],))
             else:
                 cur.execute("SELECT * FROM users WHERE user_hash=?", (key,))
             return cur.fetchone()
 
     def stats_for_user(self, user_id: int) -> Dict[str, Any]:
-        with self._connect() as con:
+        with self._connect(write=False) as con:
             cur = con.cursor()
             cur.execute("SELECT created_at, last_active, user_hash, username, full_name FROM users WHERE user_id=?", (user_id,))
             row = cur.fetchone()
@@ -100,3 +484,256 @@ class DB:
                 "username": row["username"] if row else None,
                 "full_name": row["full_name"] if row else None,
             }
+
+    def count_broadcast_targets(self) -> int:
+        with self._connect(write=False) as con:
+            cur = con.cursor()
+            return cur.execute("SELECT COUNT(*) FROM users WHERE banned=0 AND pm_state IS NOT 0").fetchone()[0]
+
+    def get_user_ids_after(self, after_user_id: int, limit: int) -> List[int]:
+        # keyset scan over non-banned users that have not blocked the bot
+        with self._connect(write=False) as con:
+            cur = con.cursor()
+            cur.execute(
+                "SELECT user_id FROM users WHERE banned=0 AND pm_state IS NOT 0 AND user_id > ? ORDER BY user_id LIMIT ?",
+                (after_user_id, limit)
+            )
+            return [row[0] for row in cur.fetchall()]
+
+    def set_pm_state(self, user_ids: List[int], state: Optional[int]):
+        if not user_ids:
+            return
+        with self._connect() as con:
+            con.executemany("UPDATE users SET pm_state=? WHERE user_id=?", [(state, user_id) for user_id in user_ids])
+        for user_id in user_ids:
+            cached = self.user_cache.get(user_id, None)
+            if cached:
+                self.user_cache.set(user_id, {**cached, "pm_state": state})
+
+    # ——— broadcast jobs ———
+    BROADCAST_JOB_FIELDS = {"status_chat_id", "status_message_id", "cursor", "total", "success", "failed", "blocked", "status", "finished_at"}
+
+    def create_broadcast_job(self, from_chat_id: int, message_id: int, total: int, now_ts: int) -> int:
+        with self._connect() as con:
+            cur = con.cursor()
+            cur.execute(
+                "INSERT INTO broadcast_jobs (from_chat_id, message_id, total, created_at) VALUES (?, ?, ?, ?)",
+                (from_chat_id, message_id, total, now_ts)
+            )
+            return cur.lastrowid
+
+    def update_broadcast_job(self, job_id: int, **fields):
+        unknown = set(fields) - self.BROADCAST_JOB_FIELDS
+        if unknown:
+            raise ValueError(f"unknown broadcast job fields: {unknown}")
+        assignments = ", ".join(f"{name}=?" for name in fields)
+        with self._connect() as con:
+            con.execute(f"UPDATE broadcast_jobs SET {assignments} WHERE job_id=?", (*fields.values(), job_id))
+
+    def get_broadcast_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self._connect(write=False) as con:
+            row = con.execute("SELECT * FROM broadcast_jobs WHERE job_id=?", (job_id,)).fetchone()
+            return dict(row) if row else None
+
+    def get_running_broadcast_jobs(self) -> List[Dict[str, Any]]:
+        with self._connect(write=False) as con:
+            rows = con.execute("SELECT * FROM broadcast_jobs WHERE status='running' ORDER BY job_id").fetchall()
+            return [dict(row) for row in rows]
+
+    # ——— media cache ———
+    def get_media(self, url: str) -> Optional[Dict[str, Any]]:
+        with self._connect(write=False) as con:
+            row = con.execute("SELECT * FROM media WHERE url=?", (url,)).fetchone()
+            return dict(row) if row else None
+
+    def get_media_file_ids(self, urls: List[str]) -> Dict[str, str]:
+        if not urls:
+            return {}
+        with self._connect(write=False) as con:
+            rows = con.execute(
+                f"SELECT url, file_id FROM media WHERE file_id IS NOT NULL AND url IN ({','.join('?' * len(urls))})", urls
+            ).fetchall()
+            return {row[0]: row[1] for row in rows}
+
+    def put_media_file(self, url: str, sha256: str, size: int, ext: str, now_ts: int):
+        with self._connect() as con:
+            con.execute(
+                """INSERT INTO media (url, sha256, size, ext, last_used) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(url) DO UPDATE SET sha256=excluded.sha256, size=excluded.size, ext=excluded.ext, last_used=excluded.last_used""",
+                (url, sha256, size, ext, now_ts)
+            )
+
+    def set_media_file_id(self, url: str, file_id: str):
+        with self._connect() as con:
+            con.execute(
+                "INSERT INTO media (url, file_id) VALUES (?, ?) ON CONFLICT(url) DO UPDATE SET file_id=excluded.file_id",
+                (url, file_id)
+            )
+
+    def touch_media(self, url: str, now_ts: int):
+        with self._connect() as con:
+            con.execute("UPDATE media SET last_used=? WHERE url=?", (now_ts, url))
+
+    def media_disk_usage(self) -> int:
+        # one file per digest, however many urls point at it
+        with self._connect(write=False) as con:
+            return con.execute("SELECT COALESCE(SUM(size), 0) FROM (SELECT sha256, MAX(size) AS size FROM media WHERE sha256 IS NOT NULL GROUP BY sha256)").fetchone()[0]
+
+    def oldest_media_files(self, limit: int) -> List[Tuple[str, str, int]]:
+        with self._connect(write=False) as con:
+            return [tuple(row) for row in con.execute(
+                "SELECT sha256, ext, MAX(size) FROM media WHERE sha256 IS NOT NULL GROUP BY sha256 ORDER BY MAX(last_used) LIMIT ?", (limit,)
+            ).fetchall()]
+
+    def drop_media_files(self, digests: List[str]):
+        # file_id rows stay: Telegram keeps the file even when our copy is gone
+        with self._connect() as con:
+            con.executemany("UPDATE media SET sha256=NULL, size=NULL WHERE sha256=?", [(digest,) for digest in digests])
+
+    # ——— image catalog ———
+    def add_images(self, rows: List[Tuple[str, str, Optional[str], Optional[int], Optional[int], int]], now_ts: int) -> int:
+        # rows: (url, tags, orientation, width, height, is_nsfw); urls already known are skipped
+        with self._connect() as con:
+            cur = con.executemany(
+                "INSERT OR IGNORE INTO images (url, tags, orientation, width, height, is_nsfw, added_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(*row, now_ts) for row in rows]
+            )
+            return cur.rowcount
+
+    def count_images(self) -> int:
+        with self._connect(write=False) as con:
+            return con.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+    @staticmethod
+    def _image_filter(orientation: Optional[str], is_nsfw: bool) -> Tuple[str, list]:
+        nsfw = 1 if is_nsfw else 0
+        if orientation in ("Portrait", "Landscape"):
+            return "i.is_nsfw=? AND i.orientation=?", [nsfw, orientation]
+        # "+" keeps idx_images_filter out: by is_nsfw alone it is not in rowid order, and the
+        # range scans below would sort the whole partition (~0.1-0.4s at 1M images)
+        return "+i.is_nsfw=?", [nsfw]
+
+    def search_images(self, match: str, orientation: Optional[str], is_nsfw: bool, limit: int) -> List[Tuple[str, str]]:
+        # A window of matches from a random rowid, ranked by bm25 inside the window: ranking every
+        # match of a common tag costs ~0.5s at 1M images, the window keeps it bounded
+        if not self.fts5:
+            return []
+        clause, params = self._image_filter(orientation, is_nsfw)
+        with self._connect(write=False) as con:
+            max_id = con.execute("SELECT COALESCE(MAX(image_id), 0) FROM images").fetchone()[0]
+            start = random.randint(0, max_id)
+            query = f"""SELECT url, tags FROM (
+                    SELECT i.url, i.tags, bm25(images_fts) AS score FROM images_fts f JOIN images i ON i.image_id = f.rowid
+                    WHERE images_fts MATCH ? AND f.rowid {{}} ? AND {clause} ORDER BY f.rowid {{}} LIMIT ?
+                ) ORDER BY score"""
+            rows = con.execute(query.format(">=", "ASC"), (match, start, *params, limit)).fetchall()
+            if len(rows) < limit:
+                rows += con.execute(query.format("<", "DESC"), (match, start, *params, limit - len(rows))).fetchall()
+            return [tuple(row) for row in rows]
+
+    def sample_images(self, orientation: Optional[str], is_nsfw: bool, limit: int) -> List[Tuple[str, str]]:
+        # random start on the rowid, then a short range scan: no ORDER BY random() over the whole table
+        clause, params = self._image_filter(orientation, is_nsfw)
+        with self._connect(write=False) as con:
+            max_id = con.execute("SELECT COALESCE(MAX(image_id), 0) FROM images").fetchone()[0]
+            if not max_id:
+                return []
+            start = random.randint(0, max_id)
+            query = f"SELECT i.url, i.tags FROM images i WHERE i.image_id {{}} ? AND {clause} ORDER BY i.image_id {{}} LIMIT ?"
+            rows = con.execute(query.format(">=", "ASC"), (start, *params, limit)).fetchall()
+            if len(rows) < limit:
+                rows += con.execute(query.format("<", "DESC"), (start, *params, limit - len(rows))).fetchall()
+            return [tuple(row) for row in rows]
+
+### --- Awaitable facade: one writer thread, a pool of reader threads --- ###
+class AsyncDB:
+    # Methods that never write and can run on any reader thread
+    READ_METHODS = {
+        "count_users", "count_banned", "count_active_since", "count_broadcast_targets",
+        "get_users_page", "get_users_after", "get_users_before", "get_user", "find_user_by_any", "stats_for_user",
+        "get_user_ids_after", "get_broadcast_job", "get_running_broadcast_jobs",
+        "get_media", "get_media_file_ids", "media_disk_usage", "oldest_media_files",
+        "count_images", "search_images", "sample_images", "load_stats",
+    }
+
+    def __init__(self, db: DB, readers: int = 4):
+        self.db = db
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+        # At most one size-triggered flush at a time
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def run(self, fn, *args, write: bool = True, **kwargs):
+        executor = self._writer if write else self._readers
+        return await asyncio.get_running_loop().run_in_executor(executor, partial(fn, *args, **kwargs))
+
+    async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
+        # Cache hits are answered on the loop without a thread hop
+        row = self.db.user_cache.get(user_id)
+        if row is not MISSING:
+            return row
+        return await self.run(self.db.get_user, user_id, write=False)
+
+    async def upsert_user(self, user_id: int, username: Optional[str], full_name: str, user_hash: str, now_ts: int) -> Dict[str, Any]:
+        existing = self.db.user_cache.get(user_id, None)
+        if not existing:
+            return await self.run(self.db.upsert_user, user_id, username, full_name, user_hash, now_ts)
+
+        # Known user: only the write-behind buffer is touched, no I/O on the hot path
+        row = self.db.touch_user(existing, username, full_name, now_ts)
+        if self.db.needs_flush() and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self._flush_full())
+        return row
+
+    async def _flush_full(self):
+        try:
+            await self.flush()
+        except sqlite3.Error as e:
+            log.warning("write-behind flush failed, retrying next round: %r", e)
+
+    async def reconcile_periodically(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reconcile_stats()
+            except sqlite3.Error as e:
+                log.warning("stats reconciliation failed: %r", e)
+
+    async def flush_periodically(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+            except sqlite3.Error as e:
+                log.warning("write-behind flush failed, retrying next round: %r", e)
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.db, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+        write = name not in self.READ_METHODS
+
+        async def call(*args, **kwargs):
+            return await self.run(attr, *args, write=write, **kwargs)
+        return call
+
+    def retire(self, db: DB, grace: float = 30):
+        # Swapped out on reload: calls already running may still use it, close it once they had time to finish
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            db.close()
+            return
+        loop.call_later(grace, self._close_retired, db)
+
+    def _close_retired(self, db: DB):
+        try:
+            # on the writer thread, after anything still queued for it
+            self._writer.submit(db.close)
+        except RuntimeError:
+            # executor already shut down
+            db.close()
+
+    def close(self):
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
@@ -0,0 +1,43 @@
+import aiohttp
+from typing import Optional
+
+from core.config_loader import CFG
+
+# Application-scoped HTTP client (created in post_init, closed in post_shutdown)
+_session: Optional[aiohttp.ClientSession] = None
+
+### --- Build session from config --- ###
+def _build_session() -> aiohttp.ClientSession:
+    http_cfg = CFG.get("HTTP", {})
+    connector = aiohttp.TCPConnector(
+        limit=http_cfg.get("POOL_LIMIT", 100),
+        limit_per_host=http_cfg.get("POOL_LIMIT_PER_HOST", 20),
+        ttl_dns_cache=http_cfg.get("DNS_CACHE_TTL", 300),
+        keepalive_timeout=http_cfg.get("KEEPALIVE_TIMEOUT", 30),
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=http_cfg.get("TOTAL_TIMEOUT", 10),
+        connect=http_cfg.get("CONNECT_TIMEOUT", 3),
+        sock_read=http_cfg.get("READ_TIMEOUT", 5),
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+### --- Lifecycle --- ###
+async def start_http_session():
+    global _session
+    if _session is None or _session.closed:
+        _session = _build_session()
+    return _session
+
+async def close_http_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+### --- Return shared session (lazily created if app hooks did not run) --- ###
+def get_http_session() -> aiohttp.ClientSession:
+    global _session
+    if _session is None or _session.closed:
+        _session = _build_session()
+    return _session
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+from core.config_loader import CFG
+
+log = logging.getLogger(__name__)
+
+# Every (orientation, is_nsfw) pair parse_waifu_args_from_text can produce
+ORIENTATIONS = (None, "Portrait", "Landscape", "All")
+POOL_KEYS = [(orientation, is_nsfw) for orientation in ORIENTATIONS for is_nsfw in (False, True)]
+
+### --- Single filter pool --- ###
+class ImagePool:
+    def __init__(self, orientation: Optional[str], is_nsfw: bool, low: int, high: int, batch: int, retry_delay: float, max_age: float = 600):
+        self.orientation = orientation
+        self.is_nsfw = is_nsfw
+        self.low = low
+        self.high = high
+        self.batch = batch
+        self.retry_delay = retry_delay
+        self.max_age = max_age
+        self.items: deque = deque()           # (url, tags) waiting to be served
+        self.urls = set()                     # urls currently in `items`
+        self.recent: deque = deque(maxlen=high)  # already served, reused when upstream is down
+        self.refreshed_at = float("-inf")     # last successful refill (monotonic)
+        self.wakeup = asyncio.Event()
+        self.wakeup.set()
+
+    @property
+    def stale(self) -> bool:
+        # Nothing new from upstream for max_age, whether the pool is empty or sitting full
+        return time.monotonic() - self.refreshed_at > self.max_age
+
+    def take(self, n: int) -> List[Tuple[str, str]]:
+        out = []
+        while self.items and len(out) < n:
+            item = self.items.popleft()
+            self.urls.discard(item[0])
+            self.recent.append(item)
+            out.append(item)
+
+        # Degraded mode: pool ran dry, serve previously seen images instead of nothing
+        if len(out) < n and self.recent:
+            served = {url for url, _ in out}
+            spare = [item for item in self.recent if item[0] not in served]
+            out.extend(random.sample(spare, min(n - len(out), len(spare))))
+
+        if len(self.items) < self.low:
+            self.wakeup.set()
+        return out
+
+    def add(self, entries: List[Tuple[str, str]]) -> int:
+        added = 0
+        for url, tags in entries:
+            if url in self.urls:
+                continue
+            self.items.append((url, tags))
+            self.urls.add(url)
+            added += 1
+        # Over the high watermark (a refresh of a full pool): the oldest entries make room
+        while len(self.items) > self.high:
+            url, _ = self.items.popleft()
+            self.urls.discard(url)
+        return added
+
+    async def run(self, fetch: Callable):
+        while True:
+            try:
+                # Woken below the low watermark, or after max_age to refresh a pool nobody drains
+                await asyncio.wait_for(self.wakeup.wait(), self.max_age)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            while len(self.items) < self.high or self.stale:
+                try:
+                    images = await fetch(orientation=self.orientation, is_nsfw=self.is_nsfw, limit=self.batch)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    log.warning("Image pool %s/%s refill failed: %r", self.orientation, self.is_nsfw, e)
+                    images = None
+
+                if not images:
+                    # Keep serving what we have, retry later
+                    await asyncio.sleep(self.retry_delay)
+                    if len(self.items) >= self.high:
+                        # full of older images, good enough until the next round
+                        break
+                    continue
+
+                self.refreshed_at = time.monotonic()
+                if not self.add([(image_url, tags) for _, tags, image_url in images]):
+                    # Upstream keeps returning what we already hold, don't spin on it
+                    break
+
+### --- Pools for all filters --- ###
+class ImagePools:
+    def __init__(self, fetch: Callable):
+        self.fetch = fetch
+        self.pools: Dict[Tuple[Optional[str], bool], ImagePool] = {}
+        self.tasks: List[asyncio.Task] = []
+
+    @property
+    def enabled(self) -> bool:
+        return CFG.get("IMAGE_POOL", {}).get("ENABLED", True)
+
+    def start(self):
+        if not self.enabled or self.tasks:
+            return
+        pool_cfg = CFG.get("IMAGE_POOL", {})
+        for orientation, is_nsfw in POOL_KEYS:
+            pool = ImagePool(
+                orientation,
+                is_nsfw,
+                low=pool_cfg.get("LOW_WATERMARK", 100),
+                high=pool_cfg.get("HIGH_WATERMARK", 300),
+                batch=pool_cfg.get("BATCH_SIZE", 30),
+                retry_delay=pool_cfg.get("RETRY_DELAY", 5),
+                max_age=pool_cfg.get("MAX_AGE", 600),
+            )
+            self.pools[(orientation, is_nsfw)] = pool
+            self.tasks.append(asyncio.create_task(pool.run(self.fetch), name=f"image_pool:{orientation}:{is_nsfw}"))
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks.clear()
+        self.pools.clear()
+
+    def take(self, orientation: Optional[str], is_nsfw: bool, n: int) -> List[Tuple[str, str]]:
+        pool = self.pools.get((orientation, is_nsfw))
+        if pool is None:
+            return []
+        return pool.take(n)
@@ -0,0 +1,218 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional
+
+from telegram import Bot
+from telegram.error import RetryAfter, TelegramError
+
+from core.cache import TTLCache, MISSING
+from core.config_loader import ADB, CFG
+from core.http_client import get_http_session
+from core.metrics import Counter, Gauge, register
+from core.outbound import BULK, outbound_args
+from core.ratelimit import TokenBucket, retry_after_seconds
+
+try:
+    import resource
+except ImportError:
+    # Windows: no getrusage, the peak RSS gauge is left out
+    resource = None
+
+log = logging.getLogger(__name__)
+
+MEDIA_BYTES = register(Counter("bot_media_downloaded_bytes_total", "Image bytes downloaded from upstream"))
+MEDIA_LOOKUPS = register(Counter("bot_media_lookups_total", "Media cache lookups", ("result",)))
+if resource is not None:
+    register(Gauge("bot_process_peak_rss_bytes", "Peak resident memory of this process", lambda: {(): resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}))
+
+def _settings() -> dict:
+    return CFG.get("MEDIA_CACHE", {})
+
+### --- Content-addressed files on disk, LRU by last use, file_ids in SQLite --- ###
+class MediaCache:
+    def __init__(self, root: str, max_bytes: int, chunk_size: int = 65536, negative_ttl: float = 60, upload_min_seen: int = 2):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.negative_ttl = negative_ttl
+        # url -> times shown without a file_id; one-off images are not worth an upload
+        self.upload_min_seen = upload_min_seen
+        self.sightings = TTLCache(50000, 86400)
+        # url -> file_id (never expires, Telegram keeps the file), None while we know there is none
+        self.file_id_cache = TTLCache(50000, float("inf"))
+        self.used: Optional[int] = None
+        self.upload_queue: Optional[asyncio.Queue] = None
+        self._queued = set()
+        self._downloads: Dict[str, asyncio.Task] = {}
+
+    def path_for(self, digest: str, ext: str) -> Path:
+        return self.root / digest[:2] / f"{digest}{ext}"
+
+    @staticmethod
+    def _ext(url: str) -> str:
+        suffix = os.path.splitext(url.split("?", 1)[0])[1].lower()
+        return suffix if suffix in (".jpg", ".jpeg", ".png", ".gif", ".webp") else ".jpg"
+
+    # ——— files ———
+    async def fetch(self, url: str) -> Optional[Path]:
+        row = await ADB.get_media(url)
+        if row and row["sha256"]:
+            path = self.path_for(row["sha256"], row["ext"])
+            if path.exists():
+                MEDIA_LOOKUPS.inc("hit")
+                await ADB.touch_media(url, int(time.time()))
+                return path
+        MEDIA_LOOKUPS.inc("miss")
+        # One download per url, however many callers want it
+        task = self._downloads.get(url)
+        if task is None:
+            task = asyncio.create_task(self._download(url))
+            self._downloads[url] = task
+            task.add_done_callback(lambda _: self._downloads.pop(url, None))
+        return await asyncio.shield(task)
+
+    async def _download(self, url: str) -> Optional[Path]:
+        tmp = self.root / "tmp" / uuid.uuid4().hex
+        tmp.parent.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with get_http_session().get(url) as resp:
+                if resp.status != 200:
+                    return None
+                # Streamed chunk by chunk, never the whole image in memory; disk writes on a thread
+                f = await asyncio.to_thread(open, tmp, "wb")
+                try:
+                    async for chunk in resp.content.iter_chunked(self.chunk_size):
+                        digest.update(chunk)
+                        await asyncio.to_thread(f.write, chunk)
+                        size += len(chunk)
+                finally:
+                    await asyncio.to_thread(f.close)
+        except Exception:
+            tmp.unlink(missing_ok=True)
+            raise
+        MEDIA_BYTES.inc(amount=size)
+
+        ext = self._ext(url)
+        path = self.path_for(digest.hexdigest(), ext)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists():
+            # Same bytes under another url
+            tmp.unlink()
+        else:
+            os.replace(tmp, path)
+            if self.used is None:
+                self.used = await ADB.media_disk_usage()
+            self.used += size
+        await ADB.put_media_file(url, digest.hexdigest(), size, ext, int(time.time()))
+        if self.used is not None and self.used > self.max_bytes:
+            await self.evict()
+        return path
+
+    async def evict(self):
+        # Oldest files first until we are 10% under the limit
+        target = self.max_bytes * 0.9
+        while self.used > target:
+            oldest = await ADB.oldest_media_files(100)
+            if not oldest:
+                self.used = 0
+                return
+            dropped = []
+            for digest, ext, size in oldest:
+                self.path_for(digest, ext).unlink(missing_ok=True)
+                dropped.append(digest)
+                self.used -= size or 0
+                if self.used <= target:
+                    break
+            await ADB.drop_media_files(dropped)
+
+    # ——— Telegram file_ids ———
+    async def file_ids(self, urls: List[str]) -> Dict[str, str]:
+        found, missing = {}, []
+        for url in urls:
+            file_id = self.file_id_cache.get(url)
+            if file_id is MISSING:
+                missing.append(url)
+            elif file_id:
+                found[url] = file_id
+        if missing:
+            stored = await ADB.get_media_file_ids(missing)
+            for url in missing:
+                if url in stored:
+                    found[url] = stored[url]
+                    self.file_id_cache.set(url, stored[url])
+                else:
+                    # may get uploaded by another worker meanwhile, ask again later
+                    self.file_id_cache.set(url, None, self.negative_ttl)
+        MEDIA_LOOKUPS.inc("file_id", amount=len(found))
+        return found
+
+    def schedule_upload(self, url: str):
+        if self.upload_queue is None or url in self._queued:
+            return
+        seen = self.sightings.get(url, 0) + 1
+        if seen < self.upload_min_seen:
+            self.sightings.set(url, seen)
+            return
+        self.sightings.pop(url)
+        try:
+            self.upload_queue.put_nowait(url)
+            self._queued.add(url)
+        except asyncio.QueueFull:
+            pass
+
+    async def _upload(self, bot: Bot, chat_id: int, url: str):
+        path = await self.fetch(url)
+        if path is None:
+            return
+        message = await bot.send_photo(chat_id, photo=path, disable_notification=True, **outbound_args(bot, BULK))
+        file_id = message.photo[-1].file_id
+        await ADB.set_media_file_id(url, file_id)
+        self.file_id_cache.set(url, file_id)
+
+    async def run_uploader(self, bot: Bot, chat_id: int, rate: float, queue_size: int):
+        # Uploads go to a storage chat once; afterwards the image is re-sent by file_id
+        self.upload_queue = asyncio.Queue(queue_size)
+        limiter = TokenBucket(rate=rate, capacity=1)
+        while True:
+            url = await self.upload_queue.get()
+            await limiter.acquire()
+            try:
+                await self._upload(bot, chat_id, url)
+            except RetryAfter as e:
+                limiter.pause(retry_after_seconds(e))
+            except (TelegramError, OSError) as e:
+                log.warning("Media upload failed for %s: %r", url, e)
+            except Exception as e:
+                log.warning("Media download failed for %s: %r", url, e)
+            finally:
+                self._queued.discard(url)
+
+def build_media_cache() -> MediaCache:
+    settings = _settings()
+    return MediaCache(
+        settings.get("DIR", "data/media"),
+        settings.get("MAX_BYTES", 1 << 30),
+        chunk_size=settings.get("CHUNK_SIZE", 65536),
+        negative_ttl=settings.get("NEGATIVE_TTL", 60),
+        upload_min_seen=settings.get("UPLOAD_MIN_SEEN", 2),
+    )
+
+MEDIA = build_media_cache()
+
+def media_enabled(cfg: Mapping = CFG) -> bool:
+    return cfg.get("MEDIA_CACHE", {}).get("ENABLED", False)
+
+def start_uploader(bot: Bot) -> Optional[asyncio.Task]:
+    settings = _settings()
+    if not media_enabled() or not settings.get("STORAGE_CHAT_ID"):
+        return None
+    return asyncio.create_task(MEDIA.run_uploader(
+        bot, settings["STORAGE_CHAT_ID"], settings.get("UPLOAD_RATE", 0.3), settings.get("QUEUE_SIZE", 1000)
+    ))
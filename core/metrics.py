@@ -0,0 +1,183 @@
+import asyncio
+import functools
+import logging
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+from telegram.ext import ApplicationHandlerStop
+from telegram.request import HTTPXRequest
+
+from core.config_loader import ADB, CFG
+
+log = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def metrics_enabled() -> bool:
+    return CFG.get("METRICS", {}).get("ENABLED", False)
+
+def _labels(names: Tuple[str, ...], values: Tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, values)) + "}"
+
+### --- Metric types (Prometheus text exposition) --- ###
+class Counter:
+    def __init__(self, name: str, doc: str, labels: Tuple[str, ...] = ()):
+        self.name, self.doc, self.label_names = name, doc, labels
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.label_names, key)} {value}" for key, value in self.values.items()]
+        return lines
+
+class Gauge:
+    # Value is read at scrape time, so nothing is paid on the hot path
+    def __init__(self, name: str, doc: str, read: Callable[[], Dict[Tuple, float]], labels: Tuple[str, ...] = ()):
+        self.name, self.doc, self.read, self.label_names = name, doc, read, labels
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} gauge"]
+        lines += [f"{self.name}{_labels(self.label_names, key)} {value}" for key, value in self.read().items()]
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name, self.doc, self.label_names, self.buckets = name, doc, labels, buckets
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self.values: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, *labels):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        for key, series in self.values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series):
+                cumulative += count
+                le_names = (*self.label_names, "le")
+                lines.append(f"{self.name}_bucket{_labels(le_names, (*key, bound))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {series[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+REGISTRY: List = []
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+def render_all() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+### --- Metrics --- ###
+HANDLER_LATENCY = register(Histogram("bot_handler_seconds", "Handler latency", ("handler",)))
+HANDLER_ERRORS = register(Counter("bot_handler_errors_total", "Handler exceptions", ("handler",)))
+TELEGRAM_CALLS = register(Counter("bot_telegram_api_calls_total", "Telegram Bot API calls", ("method", "code")))
+TELEGRAM_LATENCY = register(Histogram("bot_telegram_api_seconds", "Telegram Bot API call latency", ("method",)))
+UPSTREAM_LATENCY = register(Histogram("bot_upstream_seconds", "waifu.im request latency", ("status",)))
+DB_LATENCY = register(Histogram("bot_db_seconds", "SQLite time per DB method", ("method",)))
+LOOP_LAG = register(Histogram("bot_event_loop_lag_seconds", "Event loop scheduling delay"))
+register(Gauge("bot_users", "Users by counter", lambda: {("total",): ADB.db.stats.total, ("banned",): ADB.db.stats.banned, ("active_today",): ADB.db.stats.today_active()}, ("kind",)))
+register(Gauge("bot_user_cache", "User row cache", lambda: {(key,): value for key, value in ADB.db.cache_stats().items()}, ("stat",)))
+register(Gauge("bot_write_behind", "Write-behind flush stats", lambda: {**{(key,): value for key, value in ADB.db.flush_stats.items()}, ("pending",): ADB.db.pending_writes()}, ("stat",)))
+
+def observe_upstream(status, seconds: float):
+    UPSTREAM_LATENCY.observe(seconds, status)
+
+### --- Handler instrumentation --- ###
+def instrument_handler(callback: Callable, name: Optional[str] = None) -> Callable:
+    name = name or callback.__name__
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            # control flow (rate limiter), not an error
+            raise
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, name)
+    return wrapper
+
+def instrument_application(app):
+    for handlers in app.handlers.values():
+        for handler in handlers:
+            handler.callback = instrument_handler(handler.callback)
+
+### --- Telegram API calls (every bot method goes through do_request) --- ###
+class InstrumentedRequest(HTTPXRequest):
+    async def do_request(self, url: str, method: str, request_data=None, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        code = "error"
+        try:
+            code, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+            return code, payload
+        finally:
+            TELEGRAM_LATENCY.observe(time.perf_counter() - started, api_method)
+            TELEGRAM_CALLS.inc(api_method, code)
+
+### --- SQLite time per DB method --- ###
+def _timed_db_method(method: Callable, name: str) -> Callable:
+    @functools.wraps(method)
+    def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            DB_LATENCY.observe(time.perf_counter() - started, name)
+    return timed
+
+DB_WRITE_METHODS = {
+    "upsert_user", "set_ban", "set_pm_state", "flush", "save_stats", "reconcile_stats",
+    "create_broadcast_job", "update_broadcast_job",
+    "put_media_file", "set_media_file_id", "touch_media", "drop_media_files",
+    "add_images",
+}
+
+def instrument_db(db, methods=None):
+    # Instance attributes shadow the class methods, AsyncDB picks them up through getattr
+    for name in methods or (ADB.READ_METHODS | DB_WRITE_METHODS):
+        setattr(db, name, _timed_db_method(getattr(db, name), name))
+
+### --- Event loop lag --- ###
+async def watch_loop_lag(interval: float = 0.5):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, loop.time() - expected))
+
+### --- /metrics endpoint --- ###
+async def start_metrics_server() -> web.AppRunner:
+    metrics_cfg = CFG.get("METRICS", {})
+
+    async def handle(request):
+        return web.Response(text=render_all(), content_type="text/plain", charset="utf-8")
+
+    server = web.Application()
+    server.router.add_get("/metrics", handle)
+    runner = web.AppRunner(server, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, metrics_cfg.get("HOST", "127.0.0.1"), metrics_cfg.get("PORT", 9100)).start()
+    log.info("Metrics served on %s:%s/metrics", metrics_cfg.get("HOST", "127.0.0.1"), metrics_cfg.get("PORT", 9100))
+    return runner
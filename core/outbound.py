@@ -0,0 +1,180 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from typing import Any, Callable, Coroutine, Dict, List, Mapping, Optional, Tuple
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from core.cache import TTLCache, MISSING
+from core.config_loader import CFG, snapshot
+from core.metrics import Counter, Gauge, Histogram, register
+from core.ratelimit import KeyedPacer, TokenBucket, retry_after_seconds
+
+log = logging.getLogger(__name__)
+
+# Priority classes, lower goes first
+INTERACTIVE, INLINE, ALERT, BULK = range(4)
+PRIORITY_NAMES = ("interactive", "inline", "alert", "bulk")
+
+OUTBOUND_WAIT = register(Histogram("bot_outbound_wait_seconds", "Time a Bot API call waited for its send slot", ("priority",)))
+OUTBOUND_EVENTS = register(Counter("bot_outbound_events_total", "RetryAfter responses and coalesced duplicate calls", ("event", "priority")))
+
+def _settings() -> dict:
+    return CFG.get("OUTBOUND", {})
+
+def outbound_enabled() -> bool:
+    return _settings().get("ENABLED", True)
+
+def _is_message(endpoint: str) -> bool:
+    # What Telegram's per-chat and 30 msg/s limits count; answers, lookups and chat actions are not messages
+    return endpoint.startswith(("send", "copyMessage", "forwardMessage", "editMessage")) and endpoint != "sendChatAction"
+
+def outbound_args(bot, priority: int, coalesce: Optional[str] = None) -> dict:
+    # ExtBot rejects rate_limit_args when no rate limiter is set (OUTBOUND disabled)
+    if getattr(bot, "rate_limiter", None) is None:
+        return {}
+    args: Dict[str, Any] = {"priority": priority}
+    if coalesce:
+        args["coalesce"] = coalesce
+    return {"rate_limit_args": args}
+
+### --- Every Bot API call goes through here (ExtBot.rate_limiter) --- ###
+# Messages wait for their chat's pace, then for a global token handed out by priority.
+# Inline/callback answers and lookups are not rate limited by Telegram and are sent right away.
+class OutboundScheduler(BaseRateLimiter[Dict[str, Any]]):
+    def __init__(self, global_rate: float = 25, global_burst: float = 25, chat_rate: float = 1, chat_burst: float = 3,
+                 group_rate: float = 20 / 60, group_burst: float = 3, max_retries: int = 2, max_retry_wait: float = 30,
+                 coalesce_window: float = 60, follow_config: bool = False):
+        self.bucket = TokenBucket(global_rate, global_burst)
+        self.private_chats = KeyedPacer(chat_rate, chat_burst)
+        self.group_chats = KeyedPacer(group_rate, group_burst)
+        self.max_retries = max_retries
+        self.max_retry_wait = max_retry_wait
+        # coalesce key -> task of the first call; later duplicates share its result
+        self.coalesced = TTLCache(maxsize=10000, ttl=coalesce_window)
+        # (priority, seq, future) of calls waiting for a global token
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._gate: Optional[asyncio.Task] = None
+        # calls waiting (chat pace or global token), per priority
+        self.waiting = [0] * len(PRIORITY_NAMES)
+        # Take OUTBOUND from the current config, and again after every reload (ENABLED needs a restart)
+        self.follow_config = follow_config
+        self._config = None
+        self._check_config()
+
+    def configure(self, settings: Mapping):
+        self.bucket.set_rate(settings.get("GLOBAL_RATE", 25), settings.get("GLOBAL_BURST", 25))
+        self.private_chats.set_rate(settings.get("CHAT_RATE", 1), settings.get("CHAT_BURST", 3))
+        self.group_chats.set_rate(settings.get("GROUP_RATE", 20 / 60), settings.get("GROUP_BURST", 3))
+        self.max_retries = settings.get("MAX_RETRIES", 2)
+        self.max_retry_wait = settings.get("MAX_RETRY_WAIT", 30)
+        self.coalesced.ttl = settings.get("COALESCE_WINDOW", 60)
+
+    def _check_config(self):
+        current = snapshot()
+        if self.follow_config and current is not self._config:
+            self._config = current
+            self.configure(current.cfg.get("OUTBOUND", {}))
+
+    async def initialize(self) -> None:
+        if self._gate is None:
+            self._gate = asyncio.create_task(self._run_gate(), name="outbound_gate")
+
+    async def shutdown(self) -> None:
+        if self._gate is not None:
+            self._gate.cancel()
+            self._gate = None
+        for _, _, future in self._waiters:
+            future.cancel()
+        self._waiters.clear()
+
+    ### --- Global token, highest priority first --- ###
+    async def _run_gate(self):
+        while True:
+            if not self._waiters:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await self.bucket.acquire()
+            # whoever is most urgent now, not when the wait for the token began
+            while self._waiters:
+                _, _, future = heapq.heappop(self._waiters)
+                if not future.done():
+                    future.set_result(None)
+                    break
+            else:
+                # everyone gave up meanwhile; put the token back
+                self.bucket.release()
+
+    def _pacer(self, chat_id) -> KeyedPacer:
+        # Groups and channels are negative ids or @usernames
+        if isinstance(chat_id, int) and chat_id > 0:
+            return self.private_chats
+        return self.group_chats
+
+    async def _admit(self, priority: int, chat_id):
+        started = asyncio.get_running_loop().time()
+        self.waiting[priority] += 1
+        try:
+            if chat_id is not None:
+                delay = self._pacer(chat_id).reserve(chat_id)
+                if delay:
+                    await asyncio.sleep(delay)
+            if self._waiters or not self.bucket.try_acquire():
+                future = asyncio.get_running_loop().create_future()
+                heapq.heappush(self._waiters, (priority, next(self._seq), future))
+                self._wakeup.set()
+                await future
+        finally:
+            self.waiting[priority] -= 1
+        OUTBOUND_WAIT.observe(asyncio.get_running_loop().time() - started, PRIORITY_NAMES[priority])
+
+    async def _send(self, callback: Callable[..., Coroutine], args: Any, kwargs: Dict[str, Any], endpoint: str, data: Dict[str, Any], priority: int):
+        message = _is_message(endpoint)
+        chat_id = data.get("chat_id")
+        for attempt in range(self.max_retries + 1):
+            if message:
+                await self._admit(priority, chat_id)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                seconds = retry_after_seconds(e)
+                OUTBOUND_EVENTS.inc("retry_after", PRIORITY_NAMES[priority])
+                # Flood control is per bot: stop every sender, not only this call
+                self.bucket.pause(seconds)
+                if chat_id is not None:
+                    self._pacer(chat_id).pause(chat_id, seconds)
+                # An inline answer is useless seconds later, long waits are the caller's decision,
+                # and bulk senders (broadcast) retry on their own: one retry layer, not two
+                if not message or priority == BULK or attempt == self.max_retries or seconds > self.max_retry_wait:
+                    raise
+                log.info("%s got RetryAfter %.0fs, retrying (%d/%d)", endpoint, seconds, attempt + 1, self.max_retries)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        self._check_config()
+        rate_limit_args = rate_limit_args or {}
+        priority = rate_limit_args.get("priority", INLINE if endpoint == "answerInlineQuery" else INTERACTIVE)
+
+        key = rate_limit_args.get("coalesce")
+        if key is None:
+            return await self._send(callback, args, kwargs, endpoint, data, priority)
+
+        # Same alert already sent or on its way: share that result instead of sending it again
+        task = self.coalesced.get(key)
+        if task is MISSING:
+            task = asyncio.ensure_future(self._send(callback, args, kwargs, endpoint, data, priority))
+            self.coalesced.set(key, task)
+        else:
+            OUTBOUND_EVENTS.inc("coalesced", PRIORITY_NAMES[priority])
+        # shielded: one caller giving up must not cancel the send for the others
+        return await asyncio.shield(task)
+
+def build_outbound_scheduler() -> OutboundScheduler:
+    return OutboundScheduler(follow_config=True)
+
+OUTBOUND = build_outbound_scheduler()
+register(Gauge("bot_outbound_queue_depth", "Bot API calls waiting for a send slot", lambda: {(name,): OUTBOUND.waiting[n] for n, name in enumerate(PRIORITY_NAMES)}, ("priority",)))
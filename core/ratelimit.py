@@ -0,0 +1,137 @@
+import asyncio
+import time
+from datetime import timedelta
+from typing import Dict, Hashable, Tuple
+
+from telegram.error import RetryAfter
+
+### --- RetryAfter value in seconds (int or timedelta depending on PTB settings) --- ###
+def retry_after_seconds(error: RetryAfter) -> float:
+    value = error.retry_after
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+### --- Async token bucket --- ###
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, n: float = 1) -> bool:
+        now = time.monotonic()
+        if now < self.paused_until:
+            return False
+        self._refill(now)
+        if self.tokens >= n:
+            self.tokens -= n
+            return True
+        return False
+
+    async def acquire(self, n: float = 1):
+        # The lock keeps waiters in FIFO order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                await asyncio.sleep((n - self.tokens) / self.rate)
+
+    def release(self, n: float = 1):
+        # Hand back a token that was taken but not used
+        self.tokens = min(self.capacity, self.tokens + n)
+
+    def set_rate(self, rate: float, capacity: float = None):
+        self._refill(time.monotonic())
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = min(self.tokens, self.capacity)
+
+    def pause(self, seconds: float):
+        # Telegram asked us to back off: nobody gets a token until then
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+### --- One token bucket per key (user), for admission checks --- ###
+class KeyedBuckets:
+    def __init__(self, rate: float, capacity: float, sweep_every: int = 4096):
+        self.rate = rate
+        self.capacity = capacity
+        # key -> (tokens, last refill); a bucket idle long enough to be full again is dropped
+        self.buckets: Dict[Hashable, Tuple[float, float]] = {}
+        self.idle_after = capacity / rate
+        self.sweep_every = sweep_every
+        self._calls = 0
+
+    def allow(self, key: Hashable, n: float = 1) -> bool:
+        now = time.monotonic()
+        entry = self.buckets.get(key)
+        if entry is None:
+            tokens = self.capacity
+        else:
+            tokens = min(self.capacity, entry[0] + (now - entry[1]) * self.rate)
+        allowed = tokens >= n
+        self.buckets[key] = (tokens - n if allowed else tokens, now)
+
+        self._calls += 1
+        if self._calls >= self.sweep_every:
+            self._calls = 0
+            self.sweep(now)
+        return allowed
+
+    def sweep(self, now: float):
+        cutoff = now - self.idle_after
+        for key in [key for key, (_, last) in self.buckets.items() if last < cutoff]:
+            del self.buckets[key]
+
+    def __len__(self) -> int:
+        return len(self.buckets)
+
+### --- Per-key pacing (GCRA): reserve a send slot, get back how long to wait for it --- ###
+class KeyedPacer:
+    def __init__(self, rate: float, burst: float = 1, sweep_every: int = 4096):
+        self.set_rate(rate, burst)
+        # key -> theoretical arrival time of its next send
+        self.slots: Dict[Hashable, float] = {}
+        self.sweep_every = sweep_every
+        self._calls = 0
+
+    def set_rate(self, rate: float, burst: float = 1):
+        self.interval = 1 / rate
+        # how far ahead of schedule a key may run, i.e. the burst
+        self.tolerance = (burst - 1) * self.interval
+
+    def reserve(self, key: Hashable) -> float:
+        now = time.monotonic()
+        slot = max(self.slots.get(key, now), now)
+        self.slots[key] = slot + self.interval
+
+        self._calls += 1
+        if self._calls >= self.sweep_every:
+            self._calls = 0
+            self.sweep(now)
+        return max(0.0, slot - self.tolerance - now)
+
+    def pause(self, key: Hashable, seconds: float):
+        now = time.monotonic()
+        self.slots[key] = max(self.slots.get(key, now), now + seconds + self.tolerance)
+
+    def sweep(self, now: float):
+        # a key whose next slot has passed is back to a full burst, same as a new key
+        for key in [key for key, slot in self.slots.items() if slot < now]:
+            del self.slots[key]
+
+    def __len__(self) -> int:
+        return len(self.slots)
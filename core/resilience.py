@@ -0,0 +1,175 @@
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from core.config_loader import CFG
+from core.metrics import Counter, register
+
+UPSTREAM_EVENTS = register(Counter("bot_upstream_events_total", "Retries, hedges and breaker decisions", ("event",)))
+
+class UpstreamError(Exception):
+    """Failure worth retrying (timeout, connection error, 5xx, 429)."""
+
+class CircuitOpen(Exception):
+    pass
+
+### --- Circuit breaker --- ###
+class CircuitBreaker:
+    def __init__(self, failures: int = 5, reset_timeout: float = 30):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failed = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+        # half open: exactly one probe request at a time
+        if self.state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failed = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.failed += 1
+        self.probing = False
+        if self.state == "half_open" or self.failed >= self.failures:
+            if self.state != "open":
+                UPSTREAM_EVENTS.inc("breaker_open")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+### --- Recent latencies, for the hedge delay --- ###
+class LatencyWindow:
+    def __init__(self, size: int = 200):
+        self.samples: deque = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def quantile(self, q: float, default: float) -> float:
+        if len(self.samples) < 20:
+            return default
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+### --- Deadline + jittered retries + hedging + breaker around one async call --- ###
+class ResilientCall:
+    def __init__(self, deadline: float = 4.0, attempt_timeout: float = 2.5, retries: int = 2,
+                 backoff_base: float = 0.2, backoff_max: float = 1.5, hedge: bool = True,
+                 hedge_min_delay: float = 0.15, hedge_max_delay: float = 1.5, breaker: Optional[CircuitBreaker] = None):
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_delay = hedge_max_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyWindow()
+
+    def hedge_delay(self) -> float:
+        # Send the duplicate once the first request is slower than ~95% of recent ones
+        p95 = self.latency.quantile(0.95, self.hedge_max_delay)
+        return min(max(p95, self.hedge_min_delay), self.hedge_max_delay)
+
+    async def _attempt(self, call: Callable[[], Awaitable], timeout: float):
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(call(), timeout)
+        except asyncio.TimeoutError:
+            raise UpstreamError("timeout")
+        self.latency.add(time.monotonic() - started)
+        return result
+
+    async def _hedged(self, call: Callable[[], Awaitable], timeout: float):
+        if not self.hedge:
+            return await self._attempt(call, timeout)
+        first = asyncio.ensure_future(self._attempt(call, timeout))
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=min(self.hedge_delay(), timeout))
+            if not done:
+                UPSTREAM_EVENTS.inc("hedge")
+                tasks.add(asyncio.ensure_future(self._attempt(call, max(0.01, timeout - self.hedge_delay()))))
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            UPSTREAM_EVENTS.inc("hedge_won")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def __call__(self, call: Callable[[], Awaitable]):
+        probe = False
+
+        def admit() -> bool:
+            nonlocal probe
+            if not self.breaker.allow():
+                return False
+            # half open: allow() just handed this call the one probe slot
+            probe = probe or self.breaker.state == "half_open"
+            return True
+
+        if not admit():
+            UPSTREAM_EVENTS.inc("short_circuit")
+            raise CircuitOpen()
+        end = time.monotonic() + self.deadline
+        try:
+            for attempt in range(self.retries + 1):
+                remaining = end - time.monotonic()
+                try:
+                    result = await self._hedged(call, min(self.attempt_timeout, remaining))
+                except UpstreamError:
+                    self.breaker.record_failure()
+                    # full jitter: sleep anywhere up to the exponential backoff
+                    backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                    if attempt == self.retries or end - time.monotonic() <= backoff + 0.05 or not admit():
+                        UPSTREAM_EVENTS.inc("gave_up")
+                        raise
+                    UPSTREAM_EVENTS.inc("retry")
+                    await asyncio.sleep(backoff)
+                    continue
+                except Exception:
+                    # Upstream answered (e.g. 4xx), it is not down
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_success()
+                return result
+        finally:
+            # Caller cancelled mid-probe: let the next request probe instead. Only the probe
+            # gives the slot back; calls from before the breaker opened must not
+            if probe:
+                self.breaker.probing = False
+
+def build_upstream_call() -> ResilientCall:
+    upstream_cfg = CFG.get("UPSTREAM", {})
+    return ResilientCall(
+        deadline=upstream_cfg.get("DEADLINE", 4.0),
+        attempt_timeout=upstream_cfg.get("ATTEMPT_TIMEOUT", 2.5),
+        retries=upstream_cfg.get("RETRIES", 2),
+        backoff_base=upstream_cfg.get("BACKOFF_BASE", 0.2),
+        backoff_max=upstream_cfg.get("BACKOFF_MAX", 1.5),
+        hedge=upstream_cfg.get("HEDGE", True),
+        hedge_min_delay=upstream_cfg.get("HEDGE_MIN_DELAY", 0.15),
+        hedge_max_delay=upstream_cfg.get("HEDGE_MAX_DELAY", 1.5),
+        breaker=CircuitBreaker(upstream_cfg.get("BREAKER_FAILURES", 5), upstream_cfg.get("BREAKER_RESET", 30)),
+    )
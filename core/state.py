@@ -0,0 +1,169 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+
+# Identifies this process in shared events and leases
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+### --- In-process backend (single worker) --- ###
+class MemoryState:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}  # key -> (value, expires_at or None)
+        self._events: List[Tuple[int, str, Any, str]] = []
+        self._seq = 0
+
+    def _alive(self, key: str, now: float):
+        entry = self._data.get(key)
+        if entry and entry[1] is not None and entry[1] < now:
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._alive(key, time.time())
+            return entry[0] if entry else default
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl if ttl else None)
+
+    def add_once(self, key: str, value: Any = True, ttl: Optional[float] = None) -> bool:
+        # True only for the first caller until the key expires
+        with self._lock:
+            now = time.time()
+            if self._alive(key, now):
+                return False
+            self._data[key] = (value, now + ttl if ttl else None)
+            return True
+
+    def set_if(self, key: str, expected: Any, value: Any, ttl: Optional[float] = None) -> bool:
+        # Compare-and-set: only while the key is alive and still holds `expected`
+        with self._lock:
+            entry = self._alive(key, time.time())
+            if not entry or entry[0] != expected:
+                return False
+            self._data[key] = (value, time.time() + ttl if ttl else None)
+            return True
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_if(self, key: str, expected: Any) -> bool:
+        with self._lock:
+            entry = self._alive(key, time.time())
+            if not entry or entry[0] != expected:
+                return False
+            del self._data[key]
+            return True
+
+    def publish(self, channel: str, payload: Any = None):
+        with self._lock:
+            self._seq += 1
+            self._events.append((self._seq, channel, payload, WORKER_ID))
+            del self._events[:-1000]
+
+    def events_since(self, seq: int) -> List[Tuple[int, str, Any, str]]:
+        with self._lock:
+            return [event for event in self._events if event[0] > seq]
+
+    def last_event_id(self) -> int:
+        return self._seq
+
+### --- SQLite file shared by every worker on the host --- ###
+class SQLiteState:
+    def __init__(self, path: str, event_retention: float = 3600):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.event_retention = event_retention
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=NORMAL")
+        self._con.execute("PRAGMA busy_timeout=5000")
+        self._con.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+        self._con.execute("""CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT, payload TEXT, origin TEXT, created_at REAL)""")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._con.execute(
+                "SELECT value FROM kv WHERE key=? AND (expires_at IS NULL OR expires_at >= ?)", (key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._con.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl if ttl else None)
+            )
+
+    def add_once(self, key: str, value: Any = True, ttl: Optional[float] = None) -> bool:
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two workers can't both win
+            self._con.execute("BEGIN IMMEDIATE")
+            try:
+                self._con.execute("DELETE FROM kv WHERE key=? AND expires_at IS NOT NULL AND expires_at < ?", (key, now))
+                cur = self._con.execute(
+                    "INSERT OR IGNORE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), now + ttl if ttl else None)
+                )
+                self._con.execute("COMMIT")
+            except Exception:
+                self._con.execute("ROLLBACK")
+                raise
+        return cur.rowcount == 1
+
+    def set_if(self, key: str, expected: Any, value: Any, ttl: Optional[float] = None) -> bool:
+        # Compare-and-set in one statement: only while the key is alive and still holds `expected`
+        now = time.time()
+        with self._lock:
+            cur = self._con.execute(
+                "UPDATE kv SET value=?, expires_at=? WHERE key=? AND value=? AND (expires_at IS NULL OR expires_at >= ?)",
+                (json.dumps(value), now + ttl if ttl else None, key, json.dumps(expected), now)
+            )
+        return cur.rowcount == 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._con.execute("DELETE FROM kv WHERE key=?", (key,))
+
+    def delete_if(self, key: str, expected: Any) -> bool:
+        with self._lock:
+            cur = self._con.execute(
+                "DELETE FROM kv WHERE key=? AND value=? AND (expires_at IS NULL OR expires_at >= ?)",
+                (key, json.dumps(expected), time.time())
+            )
+        return cur.rowcount == 1
+
+    def publish(self, channel: str, payload: Any = None):
+        now = time.time()
+        with self._lock:
+            self._con.execute(
+                "INSERT INTO events (channel, payload, origin, created_at) VALUES (?, ?, ?, ?)",
+                (channel, json.dumps(payload), WORKER_ID, now)
+            )
+            self._con.execute("DELETE FROM events WHERE created_at < ?", (now - self.event_retention,))
+
+    def events_since(self, seq: int) -> List[Tuple[int, str, Any, str]]:
+        with self._lock:
+            rows = self._con.execute("SELECT id, channel, payload, origin FROM events WHERE id > ? ORDER BY id", (seq,)).fetchall()
+        return [(row[0], row[1], json.loads(row[2]), row[3]) for row in rows]
+
+    def last_event_id(self) -> int:
+        with self._lock:
+            return self._con.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+
+def build_state(cfg: dict):
+    state_cfg = cfg.get("STATE", {})
+    if state_cfg.get("BACKEND", "memory") == "sqlite":
+        return SQLiteState(state_cfg.get("PATH", "state.db"), state_cfg.get("EVENT_RETENTION", 3600))
+    return MemoryState()
@@ -0,0 +1,125 @@
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+### --- Incrementally maintained user counters --- ###
+class Stats:
+    def __init__(self, keep_days: int = 30, keep_hours: int = 48):
+        self.keep_days = keep_days
+        self.keep_hours = keep_hours
+        self._lock = threading.Lock()
+        self.total = 0
+        self.banned = 0
+        # bucket start timestamp -> distinct users active in that bucket
+        self.daily: Dict[int, int] = {}
+        self.hourly: Dict[int, int] = {}
+        # Changes not saved yet, as increments: several workers add to the same rows
+        self._delta: Dict[str, int] = {}
+        self.loaded = False
+        self.dirty = False
+
+    @staticmethod
+    def day_start(ts: float) -> int:
+        # local midnight, same boundary the status panel always used
+        t = time.localtime(ts)
+        return int(time.mktime((t.tm_year, t.tm_mon, t.tm_mday, 0, 0, 0, 0, 0, -1)))
+
+    @staticmethod
+    def hour_start(ts: float) -> int:
+        # local hour, so half-hour offsets (e.g. UTC+3:30) get the same boundaries the panel shows
+        return int(ts - (ts + time.localtime(ts).tm_gmtoff) % 3600)
+
+    def oldest_buckets(self, now_ts: float) -> Tuple[int, int]:
+        return self.day_start(now_ts - self.keep_days * 86400), self.hour_start(now_ts - self.keep_hours * 3600)
+
+    def _add(self, key: str, delta: int):
+        self._delta[key] = self._delta.get(key, 0) + delta
+        self.dirty = True
+
+    def _prune(self, now_ts: int):
+        oldest_day, oldest_hour = self.oldest_buckets(now_ts)
+        for bucket in [b for b in self.daily if b < oldest_day]:
+            del self.daily[bucket]
+        for bucket in [b for b in self.hourly if b < oldest_hour]:
+            del self.hourly[bucket]
+
+    # ——— events ———
+    def user_added(self, now_ts: int):
+        with self._lock:
+            self.total += 1
+            self._add("total", 1)
+        self.user_active(None, now_ts)
+
+    def ban_changed(self, delta: int):
+        with self._lock:
+            self.banned += delta
+            self._add("banned", delta)
+
+    def user_active(self, previous_ts: Optional[int], now_ts: int):
+        # A user counts once per bucket: only the first activity inside a bucket moves the counter
+        day = self.day_start(now_ts)
+        hour = self.hour_start(now_ts)
+        with self._lock:
+            if previous_ts is None or previous_ts < day:
+                self.daily[day] = self.daily.get(day, 0) + 1
+                self._add(f"day:{day}", 1)
+            if previous_ts is None or previous_ts < hour:
+                self.hourly[hour] = self.hourly.get(hour, 0) + 1
+                self._add(f"hour:{hour}", 1)
+                self._prune(now_ts)
+
+    # ——— persistence ———
+    def load(self, rows: Iterable[Tuple[str, int]]):
+        # Saved values, plus whatever this worker has not saved yet
+        with self._lock:
+            for key, value in rows:
+                value += self._delta.get(key, 0)
+                if key == "total":
+                    self.total = value
+                elif key == "banned":
+                    self.banned = value
+                elif key.startswith("day:"):
+                    self.daily[int(key[4:])] = value
+                elif key.startswith("hour:"):
+                    self.hourly[int(key[5:])] = value
+                self.loaded = True
+
+    def take_deltas(self) -> List[Tuple[str, int]]:
+        # Hand the unsaved increments to the caller, who adds them to the stored rows
+        with self._lock:
+            deltas, self._delta = self._delta, {}
+            self.dirty = False
+            return [(key, delta) for key, delta in deltas.items() if delta]
+
+    def restore_deltas(self, deltas: Iterable[Tuple[str, int]]):
+        # A save failed: keep its increments for the next one
+        with self._lock:
+            for key, delta in deltas:
+                self._add(key, delta)
+
+    def reconcile(self, total: int, banned: int, day: int, day_active: int, hour: int, hour_active: int) -> List[Tuple[str, int]]:
+        # Periodic ground truth from COUNT(*) queries, corrects any drift; returns the rows to store as they are
+        rows = [("total", total), ("banned", banned), (f"day:{day}", day_active), (f"hour:{hour}", hour_active)]
+        with self._lock:
+            self.total = total
+            self.banned = banned
+            self.daily[day] = day_active
+            self.hourly[hour] = hour_active
+            for key, _ in rows:
+                # already counted by the queries
+                self._delta.pop(key, None)
+            self.loaded = True
+        return rows
+
+    # ——— reads ———
+    def today_active(self, now_ts: Optional[float] = None) -> int:
+        return self.daily.get(self.day_start(now_ts or time.time()), 0)
+
+    def daily_histogram(self, days: int = 7) -> List[Tuple[int, int]]:
+        today = self.day_start(time.time())
+        buckets = [self.day_start(today - i * 86400 + 3600) for i in range(days)]
+        return [(bucket, self.daily.get(bucket, 0)) for bucket in reversed(buckets)]
+
+    def hourly_histogram(self, hours: int = 24) -> List[Tuple[int, int]]:
+        current = self.hour_start(time.time())
+        return [(current - i * 3600, self.hourly.get(current - i * 3600, 0)) for i in reversed(range(hours))]
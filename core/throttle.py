@@ -0,0 +1,91 @@
+import logging
+from typing import Dict, Optional, Tuple
+
+from telegram import InlineQueryResultsButton, Update
+from telegram.error import TelegramError
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+from core.config_loader import CFG, TEXTS, snapshot
+from core.metrics import Counter, Gauge, register
+from core.ratelimit import KeyedBuckets, TokenBucket
+
+log = logging.getLogger(__name__)
+
+RATE_LIMITED = register(Counter("bot_rate_limited_total", "Updates dropped by the rate limiter", ("kind", "scope")))
+
+# kind -> (user defaults, global defaults) as (rate per second, burst)
+DEFAULTS = {
+    "inline": ((2, 10), (100, 200)),
+    "command": ((0.5, 5), (30, 60)),
+    "callback": ((2, 10), (60, 120)),
+}
+
+def _settings() -> dict:
+    return CFG.get("RATE_LIMIT", {})
+
+def update_kind(update: Update) -> Optional[str]:
+    if update.inline_query:
+        return "inline"
+    if update.callback_query:
+        return "callback"
+    message = update.effective_message
+    if message and message.text and message.text.startswith("/"):
+        return "command"
+    return None
+
+### --- Buckets per kind: one per user, one shared (limits apply on restart) --- ###
+def build_limits() -> Dict[str, Tuple[KeyedBuckets, TokenBucket]]:
+    settings = _settings()
+    limits = {}
+    for kind, (user, shared) in DEFAULTS.items():
+        prefix = kind.upper()
+        limits[kind] = (
+            KeyedBuckets(settings.get(f"{prefix}_RATE", user[0]), settings.get(f"{prefix}_BURST", user[1])),
+            TokenBucket(settings.get(f"GLOBAL_{prefix}_RATE", shared[0]), settings.get(f"GLOBAL_{prefix}_BURST", shared[1])),
+        )
+    return limits
+
+LIMITS = build_limits()
+# at most one "slow down" reply per user per NOTICE_INTERVAL, so the notice can't be abused either
+NOTICES = KeyedBuckets(1 / _settings().get("NOTICE_INTERVAL", 30), 1)
+register(Gauge("bot_rate_limit_tracked_users", "Users with a live bucket", lambda: {(kind,): len(buckets) for kind, (buckets, _) in LIMITS.items()}, ("kind",)))
+
+async def _notify(update: Update, kind: str):
+    text = TEXTS["errors"]["rate_limited"]
+    try:
+        if kind == "inline":
+            await update.inline_query.answer([], cache_time=0, is_personal=True, button=InlineQueryResultsButton(text=text, start_parameter="slowdown"))
+        elif kind == "callback":
+            await update.callback_query.answer(text)
+        else:
+            await update.effective_message.reply_text(text)
+    except TelegramError as e:
+        log.debug("Rate limit notice failed: %r", e)
+
+### --- Runs before every handler (group -1) --- ###
+async def rate_limit_guard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # one snapshot for the whole check, the live CFG view costs a lookup per access
+    snap = snapshot()
+    if not snap.cfg.get("RATE_LIMIT", {}).get("ENABLED", True):
+        return
+    kind = update_kind(update)
+    user = update.effective_user
+    if kind is None or user is None or user.id in snap.staff:
+        return
+
+    user_buckets, shared = LIMITS[kind]
+    # Global first: a user must not lose a token for an update the global limit drops anyway
+    if not shared.try_acquire():
+        scope = "global"
+    elif not user_buckets.allow(user.id):
+        # and the global token goes back when the user's own limit drops it
+        shared.release()
+        scope = "user"
+    else:
+        return
+
+    RATE_LIMITED.inc(kind, scope)
+    if scope == "user" and NOTICES.allow(user.id):
+        await _notify(update, kind)
+    # Nothing else runs for this update
+    raise ApplicationHandlerStop
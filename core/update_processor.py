@@ -0,0 +1,106 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from core.config_loader import CFG, snapshot
+from core.metrics import Counter, register
+
+log = logging.getLogger(__name__)
+
+UPDATES_SHED = register(Counter("bot_updates_shed_total", "Updates dropped because the queue was too long", ("kind",)))
+
+### --- Concurrent processing, in order per user, with a separate admin lane --- ###
+# Different users run in parallel on a bounded worker pool, updates of one user run one after
+# another. PTB's own semaphore (max_pending) caps how many updates are admitted at all.
+# Inline queries skip the per-user order: each keystroke is a new query and the handler cancels
+# the user's older one (supersede), which only works if the newer one can start right away.
+class UserOrderedUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, workers: int = 32, admin_workers: int = 4, max_pending: int = 1024, shed_inline_at: int = 256, shed_users_at: int = 768):
+        super().__init__(max_concurrent_updates=max_pending)
+        self.workers = asyncio.Semaphore(workers)
+        self.admin_workers = asyncio.Semaphore(admin_workers)
+        # inline goes first, other user work (commands, callbacks) later; admins are never shed
+        self.shed_inline_at = shed_inline_at
+        self.shed_users_at = shed_users_at
+        # user_id -> [lock, number of updates holding or waiting for it]
+        self._user_locks: Dict[int, list] = {}
+        # admitted but not started yet (waiting for their user's turn or a worker)
+        self.pending = 0
+        self.shed = 0
+
+    @staticmethod
+    def _user_id(update: Any) -> Optional[int]:
+        if isinstance(update, Update):
+            if update.effective_user:
+                return update.effective_user.id
+            if update.effective_chat:
+                return update.effective_chat.id
+        return None
+
+    @staticmethod
+    def _is_admin_lane(user_id: Optional[int]) -> bool:
+        return user_id is not None and user_id in snapshot().staff
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        user_id = self._user_id(update)
+        admin_lane = self._is_admin_lane(user_id)
+
+        # Overloaded: inline queries are the cheapest thing to drop, Telegram asks again on the next keystroke
+        shed_kind = None
+        if not admin_lane and isinstance(update, Update):
+            if self.pending >= self.shed_inline_at and update.inline_query:
+                shed_kind = "inline"
+            elif self.pending >= self.shed_users_at and (update.callback_query or update.message):
+                shed_kind = "callback" if update.callback_query else "message"
+        if shed_kind:
+            self.shed += 1
+            UPDATES_SHED.inc(shed_kind)
+            coroutine.close()
+            return
+
+        self.pending += 1
+        started = False
+        lane = self.admin_workers if admin_lane else self.workers
+        entry = None
+        inline = isinstance(update, Update) and update.inline_query is not None
+        if user_id is not None and not inline:
+            entry = self._user_locks.setdefault(user_id, [asyncio.Lock(), 0])
+            entry[1] += 1
+        try:
+            if entry:
+                await entry[0].acquire()
+            try:
+                async with lane:
+                    self.pending -= 1
+                    started = True
+                    await coroutine
+            finally:
+                if entry:
+                    entry[0].release()
+        finally:
+            if not started:
+                self.pending -= 1
+                coroutine.close()
+            if entry:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._user_locks[user_id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+def build_update_processor() -> UserOrderedUpdateProcessor:
+    updates_cfg = CFG.get("UPDATES", {})
+    return UserOrderedUpdateProcessor(
+        workers=updates_cfg.get("WORKERS", 32),
+        admin_workers=updates_cfg.get("ADMIN_WORKERS", 4),
+        max_pending=updates_cfg.get("MAX_PENDING", 1024),
+        shed_inline_at=updates_cfg.get("SHED_INLINE_AT", 256),
+        shed_users_at=updates_cfg.get("SHED_USERS_AT", 768),
+    )
@@ -0,0 +1,106 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import time
+from itertools import islice
+from typing import Dict, Iterator, Optional, Tuple
+
+from core.db import DB, AsyncDB, USER_COLUMNS
+
+FORMATS = ("csv", "jsonl")
+GZIP_MAGIC = b"\x1f\x8b"
+
+### --- Export: rows are streamed from DB.iter_users straight into a gzip file --- ###
+# gzip keeps 1M users well under the 50 MB bot upload limit
+def export_users(db: DB, path: str, fmt: str = "csv", batch: int = 1000) -> int:
+    count = 0
+    with gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=6) as f:
+        if fmt == "csv":
+            writer = csv.writer(f)
+            writer.writerow(USER_COLUMNS)
+            for row in db.iter_users(batch):
+                writer.writerow(tuple(row))
+                count += 1
+        else:
+            for row in db.iter_users(batch):
+                f.write(json.dumps(dict(zip(USER_COLUMNS, row)), ensure_ascii=False) + "\n")
+                count += 1
+    return count
+
+### --- Import: what export_users writes, gzipped or not --- ###
+def _open_text(path: str) -> io.TextIOBase:
+    with open(path, "rb") as f:
+        compressed = f.read(2) == GZIP_MAGIC
+    if compressed:
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, "r", encoding="utf-8", newline="")
+
+def _int_or_none(value) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    return int(value)
+
+def _user_row(record: dict, now_ts: int) -> Tuple:
+    # user_id and user_hash are required; missing timestamps become the import time, as for a user seen now
+    user_id = int(record["user_id"])
+    user_hash = record.get("user_hash")
+    if not user_hash:
+        raise ValueError("missing user_hash")
+    created_at = _int_or_none(record.get("created_at")) or now_ts
+    return (
+        user_id,
+        record.get("username") or None,
+        record.get("full_name") or None,
+        str(user_hash),
+        created_at,
+        _int_or_none(record.get("last_active")) or created_at,
+        _int_or_none(record.get("banned")) or 0,
+        _int_or_none(record.get("pm_state")),
+    )
+
+def _records(f: io.TextIOBase) -> Iterator[Optional[dict]]:
+    first = f.read(1)
+    f.seek(0)
+    if first == "{":
+        for line in f:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None
+    else:
+        yield from csv.DictReader(f)
+
+def _user_rows(f: io.TextIOBase, counts: Dict[str, int]) -> Iterator[Tuple]:
+    now_ts = int(time.time())
+    for record in _records(f):
+        counts["read"] += 1
+        try:
+            yield _user_row(record, now_ts)
+        except (KeyError, TypeError, ValueError):
+            counts["invalid"] += 1
+
+def import_users(db: DB, path: str, batch: int = 5000) -> Dict[str, int]:
+    counts = {"read": 0, "added": 0, "invalid": 0}
+    with _open_text(path) as f:
+        counts["added"] = db.import_users(_user_rows(f, counts), batch)
+    counts["skipped"] = counts["read"] - counts["added"] - counts["invalid"]
+    return counts
+
+### --- Import from the bot: one writer job per batch --- ###
+# The writer thread is shared; between batches new users and write-behind flushes get their turn
+async def import_users_async(adb: AsyncDB, path: str, batch: int = 1000) -> Dict[str, int]:
+    counts = {"read": 0, "added": 0, "invalid": 0}
+    with await asyncio.to_thread(_open_text, path) as f:
+        rows = _user_rows(f, counts)
+        while True:
+            # parsing on a thread of its own, not on the writer
+            chunk = await asyncio.to_thread(lambda: list(islice(rows, batch)))
+            if not chunk:
+                break
+            counts["added"] += await adb.insert_users(chunk)
+    await adb.users_imported()
+    counts["skipped"] = counts["read"] - counts["added"] - counts["invalid"]
+    return counts
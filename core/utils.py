@@ -2,11 +2,19 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from telegram.error import Forbidden, BadRequest
 
+import asyncio
+import logging
+from collections.abc import Mapping
 import random
 import string
 import time
 
-from core.config_loader import DBH, CFG, TEXTS
+from core.cache import TTLCache, MISSING
+from core.state import WORKER_ID
+from core.config_loader import ADB, CFG, STATE, TEXTS, reload_config, reload_texts, render, snapshot
+from core.outbound import ALERT, outbound_args
+
+log = logging.getLogger(__name__)
 
 ### --- Generate Hash --- ###
 def gen_hash(n: int = 12) -> str:
@@ -42,24 +50,24 @@ def fmt_ts(ts: int) -> str:
     return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))
 
 ### --- Check is user admin or not --- ###
-def is_admin(user_id: int) -> bool:
+async def is_admin(user_id: int) -> bool:
     # Check ban status
-    row = DBH.get_user(user_id)
+    row = await ADB.get_user(user_id)
     if row and row["banned"]:
         return False
 
     # Check role
-    return user_id in set(CFG.get("ADMINS", []) + CFG.get("OWNERS", []))
+    return user_id in snapshot().staff
 
 ### --- Check is user owner or not --- ###
-def is_owner(user_id: int) -> bool:
+async def is_owner(user_id: int) -> bool:
     # Check ban status
-    row = DBH.get_user(user_id)
+    row = await ADB.get_user(user_id)
     if row and row["banned"]:
         return False
 
     # Check role
-    return user_id in set(CFG.get("OWNERS", []))
+    return user_id in snapshot().owners
 
 ### --- create or update user --- ###
 async def ensure_user(update: Update, update_last_active: bool = True) -> int:
@@ -70,7 +78,7 @@ async def ensure_user(update: Update, update_last_active: bool = True) -> int:
 
     full_name = (user.full_name or "").strip()
     username = user.username
-    db_user = DBH.get_user(user.id)
+    db_user = await ADB.get_user(user.id)
     if not db_user:
         # first-time: new user_hash
         user_hash = gen_hash(12)
@@ -81,7 +89,11 @@ async def ensure_user(update: Update, update_last_active: bool = True) -> int:
 
     now = now_ts() if update_last_active else (db_user["last_active"] if db_user else now_ts())
     try:
-        DBH.upsert_user(user.id, username, full_name, user_hash, now)
+        row = await ADB.upsert_user(user.id, username, full_name, user_hash, now)
+        # Any update from the private chat proves the bot can message this user
+        chat = update.effective_chat
+        if chat and chat.type == "private" and row and row.get("pm_state") != PM_REACHABLE:
+            await ADB.set_pm_state([user.id], PM_REACHABLE)
     except Exception:
         return 2  # error
 
@@ -92,7 +104,7 @@ async def banned_guard(update: Update) -> bool:
     user = update.effective_user
     if not user:
         return False
-    row = DBH.get_user(user.id)
+    row = await ADB.get_user(user.id)
     if row and row["banned"]:
         if update.callback_query:
             await update.callback_query.answer(TEXTS["errors"]["banned"])
@@ -102,61 +114,89 @@ async def banned_guard(update: Update) -> bool:
     return True
 
 ### --- Check is user joined channel/group or not --- ###
-reported_missing_chats = set()
+def _membership_cfg() -> Mapping:
+    # read per call so TTL edits apply on reload (MAX_SIZE needs a restart)
+    return CFG.get("MEMBERSHIP_CACHE", {})
+
+# (chat_id, user_id) -> joined; positive and negative results expire separately
+MEMBER_CACHE = TTLCache(_membership_cfg().get("MAX_SIZE", 50000), _membership_cfg().get("POSITIVE_TTL", 600))
+# chat_id -> "ok" | "not_joined" | "no_access" for the bot itself
+BOT_STATUS_CACHE = TTLCache(1000, _membership_cfg().get("BOT_STATUS_TTL", 3600))
+
+async def bot_chat_status(bot, chat_id) -> str:
+    status = BOT_STATUS_CACHE.get(chat_id)
+    if status is not MISSING:
+        return status
+    try:
+        bot_member = await bot.get_chat_member(chat_id, bot.id)
+        status = "not_joined" if bot_member.status in ["left", "kicked"] else "ok"
+    except BadRequest:
+        status = "no_access"
+    BOT_STATUS_CACHE.set(chat_id, status, _membership_cfg().get("BOT_STATUS_TTL", 3600))
+    return status
 
 async def is_user_joined(bot, chat_id, user_id):
+    joined = MEMBER_CACHE.get((chat_id, user_id))
+    if joined is not MISSING:
+        return joined
     try:
         member = await bot.get_chat_member(chat_id, user_id)
-        return member.status in ["member", "administrator", "creator"]
+        joined = member.status in ["member", "administrator", "creator"]
     except Forbidden:
         # Bot cannot access member info (maybe not an admin in channel/group)
-        return False
-    
-async def check_required_chats(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    not_joined_user = []
+        joined = False
+    settings = _membership_cfg()
+    MEMBER_CACHE.set((chat_id, user_id), joined, settings.get("POSITIVE_TTL", 600) if joined else settings.get("NEGATIVE_TTL", 30))
+    return joined
 
-    for item in CFG["REQUIRED_CHATS"]:
-        title = item["title"]
-        join_link = item["join_link"]
-        chat_id = item["chat_id"]
+### --- Forget cached membership (e.g. user says they just joined) --- ###
+def invalidate_membership(user_id: int):
+    for item in snapshot().required_chats:
+        MEMBER_CACHE.pop((item["chat_id"], user_id))
 
+async def report_missing_chat(bot, item, status):
+    chat_id = item["chat_id"]
+    # Claimed before sending, so only one worker alerts the owners
+    if not await asyncio.to_thread(STATE.add_once, f"missing_chat:{chat_id}", ttl=CFG.get("STATE", {}).get("REPORT_TTL", 86400)):
+        return
+    text_key = "bot_not_joined" if status == "not_joined" else "bot_no_access"
+    text = render(f"required_chat.{text_key}", chat_id=chat_id, title=item["title"])
+    # All owners at once; the scheduler paces them and merges repeats of the same alert
+    results = await asyncio.gather(*(
+        bot.send_message(owner_id, text=text, **outbound_args(bot, ALERT, coalesce=f"missing_chat:{chat_id}:{owner_id}"))
+        for owner_id in snapshot().owners
+    ), return_exceptions=True)
+    for owner_id, result in zip(snapshot().owners, results):
+        if isinstance(result, Exception):
+            log.warning("Missing chat alert to %s failed: %r", owner_id, result)
 
-        try:
-            bot_member = await context.bot.get_chat_member(chat_id, context.bot.id)
-            if bot_member.status in ["left", "kicked"]:
-                if chat_id not in reported_missing_chats:
-                    for admin_id in CFG["OWNERS"]:
-                        await context.bot.send_message(
-                            admin_id,
-                            text=TEXTS["required_chat"]["bot_not_joined"].format(chat_id=chat_id, title=title)
-                        )
-                    reported_missing_chats.add(chat_id)
-                return True
-        except BadRequest:
-            if chat_id not in reported_missing_chats:
-                for admin_id in CFG["OWNERS"]:
-                    await context.bot.send_message(
-                        admin_id,
-                        text=TEXTS["required_chat"]["bot_no_access"].format(chat_id=chat_id, title=title)
-                    )
-                reported_missing_chats.add(chat_id)
+async def check_required_chats(update: Update, context: ContextTypes.DEFAULT_TYPE, notify: bool = True):
+    user_id = update.effective_user.id
+    chats = snapshot().required_chats
+
+    # Bot must be able to see every required chat, otherwise the check is skipped
+    statuses = await asyncio.gather(*(bot_chat_status(context.bot, item["chat_id"]) for item in chats))
+    for item, status in zip(chats, statuses):
+        if status != "ok":
+            await report_missing_chat(context.bot, item, status)
             return True
 
-        if not await is_user_joined(context.bot, chat_id, user_id):
-            not_joined_user.append((title, join_link))
+    joined = await asyncio.gather(*(is_user_joined(context.bot, item["chat_id"], user_id) for item in chats))
+    not_joined_user = [(item["title"], item["join_link"]) for item, ok in zip(chats, joined) if not ok]
 
     if not_joined_user:
-        buttons = [
-            [InlineKeyboardButton(title, url=join_link)]
-            for title, join_link in not_joined_user
-        ]
-        reply_markup = InlineKeyboardMarkup(buttons)
-
-        await update.effective_message.reply_text(
-            TEXTS["required_chat"]["message"],
-            reply_markup=reply_markup
-        )
+        if notify and update.effective_message:
+            buttons = [
+                [InlineKeyboardButton(title, url=join_link)]
+                for title, join_link in not_joined_user
+            ]
+            buttons.append([InlineKeyboardButton(TEXTS["required_chat"]["joined_button"], callback_data="check_join")])
+            reply_markup = InlineKeyboardMarkup(buttons)
+
+            await update.effective_message.reply_text(
+                TEXTS["required_chat"]["message"],
+                reply_markup=reply_markup
+            )
         return False
 
     return True
@@ -173,11 +213,77 @@ async def check_user(update: Update, context: ContextTypes.DEFAULT_TYPE, check_f
     return 0
 
 ### --- Check is user has active chat with bot --- ###
+# users.pm_state values
+PM_BLOCKED, PM_REACHABLE = 0, 1
+reachability_stats = {"lookups": 0, "probes": 0}
+
 async def has_active_private_chat(bot, user_id: int) -> bool:
+    reachability_stats["lookups"] += 1
+    row = await ADB.get_user(user_id)
+    state = row.get("pm_state") if row else None
+    if state is not None:
+        return state == PM_REACHABLE
+
+    # Unknown (e.g. user from before pm_state existed): probe once and remember the answer
+    reachability_stats["probes"] += 1
     try:
-        await bot.send_chat_action(chat_id=user_id, action="typing")  
-        return True
+        await bot.send_chat_action(chat_id=user_id, action="typing")
+        state = PM_REACHABLE
     except Forbidden:
+        state = PM_BLOCKED
+    except Exception:
+        # Network trouble says nothing about the user, don't persist it
         return False
-    except Exception as e:
-        return False
\ No newline at end of file
+    if row:
+        await ADB.set_pm_state([user_id], state)
+    return state == PM_REACHABLE
+
+### --- Learn reachability from my_chat_member updates --- ###
+async def track_private_chat(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    member_update = update.my_chat_member
+    if not member_update or member_update.chat.type != "private":
+        return
+    status = member_update.new_chat_member.status
+    state = PM_BLOCKED if status in ["kicked", "left"] else PM_REACHABLE
+    await ADB.set_pm_state([member_update.chat.id], state)
+
+### --- Learn reachability from Forbidden errors raised by any handler --- ###
+async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
+    if isinstance(context.error, Forbidden) and isinstance(update, Update):
+        chat = update.effective_chat
+        if chat and chat.type == "private":
+            await ADB.set_pm_state([chat.id], PM_BLOCKED)
+            return
+    log.error("Unhandled error while processing %s", update, exc_info=context.error)
+
+### --- Apply changes made by other workers --- ###
+async def apply_shared_event(channel: str, payload):
+    if channel == "user":
+        ADB.db.invalidate_cache(payload)
+        invalidate_membership(payload)
+    elif channel == "membership":
+        invalidate_membership(payload)
+    elif channel == "reload_config":
+        reload_config()
+    elif channel == "reload_texts":
+        reload_texts()
+    elif channel == "stats":
+        # Another worker recounted (e.g. after an import): take its counters instead of our drifted ones
+        await ADB.load_stats()
+
+async def watch_shared_events(interval: float = 1.0):
+    last_seen = await asyncio.to_thread(STATE.last_event_id)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            events = await asyncio.to_thread(STATE.events_since, last_seen)
+        except Exception as e:
+            log.warning("Shared state poll failed: %r", e)
+            continue
+        for event_id, channel, payload, origin in events:
+            last_seen = event_id
+            if origin != WORKER_ID:
+                try:
+                    await apply_shared_event(channel, payload)
+                except Exception as e:
+                    log.warning("Shared event %s failed: %r", channel, e)
@@ -0,0 +1,74 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import signal
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+from core.config_loader import CFG
+
+log = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+def webhook_settings() -> dict:
+    webhook_cfg = dict(CFG.get("WEBHOOK", {}))
+    # Stable across restarts and workers when not set explicitly
+    webhook_cfg.setdefault("SECRET_TOKEN", "")
+    if not webhook_cfg["SECRET_TOKEN"]:
+        webhook_cfg["SECRET_TOKEN"] = hashlib.sha256(CFG["BOT_TOKEN"].encode()).hexdigest()
+    return webhook_cfg
+
+### --- aiohttp endpoint: verify, decode, enqueue, answer 200 right away --- ###
+def build_webhook_app(app: Application, path: str, secret_token: str) -> web.Application:
+    async def handle(request: web.Request):
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret_token):
+            return web.Response(status=403)
+        try:
+            data = await request.json(loads=json.loads)
+            update = Update.de_json(data, app.bot)
+        except (ValueError, KeyError, TypeError):
+            return web.Response(status=400)
+        # Processing happens in the application's update workers, not in this request
+        await app.update_queue.put(update)
+        return web.Response()
+
+    server = web.Application()
+    server.router.add_post(path, handle)
+    return server
+
+async def serve_webhook(app: Application, on_startup, on_shutdown):
+    settings = webhook_settings()
+    path = settings.get("PATH", "/telegram")
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    runner = web.AppRunner(build_webhook_app(app, path, settings["SECRET_TOKEN"]), access_log=None)
+    async with app:
+        await on_startup(app)
+        await app.start()
+        await runner.setup()
+        await web.TCPSite(runner, settings.get("LISTEN", "0.0.0.0"), settings.get("PORT", 8443), backlog=settings.get("BACKLOG", 1024)).start()
+        await app.bot.set_webhook(
+            url=settings["URL"].rstrip("/") + path,
+            secret_token=settings["SECRET_TOKEN"],
+            max_connections=settings.get("MAX_CONNECTIONS", 40),
+            allowed_updates=Update.ALL_TYPES,
+            drop_pending_updates=settings.get("DROP_PENDING_UPDATES", False),
+        )
+        log.info("Webhook listening on %s:%s%s", settings.get("LISTEN", "0.0.0.0"), settings.get("PORT", 8443), path)
+        try:
+            await stop.wait()
+        finally:
+            await runner.cleanup()
+            await app.stop()
+            await on_shutdown(app)
+
+def run_webhook(app: Application, on_startup, on_shutdown):
+    asyncio.run(serve_webhook(app, on_startup, on_shutdown))
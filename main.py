@@ -1,18 +1,33 @@
+import asyncio
+from typing import Optional
+
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
-from telegram.ext import Application, CommandHandler, InlineQueryHandler, CallbackQueryHandler, ContextTypes
+from telegram.request import BaseRequest
+from telegram.ext import Application, CommandHandler, InlineQueryHandler, CallbackQueryHandler, ChatMemberHandler, ContextTypes, TypeHandler
 
-from core.config_loader import CFG, TEXTS
-from core.admin_system import adminpanel, admin_userinfo, broadcast, admin_callbacks, show_all_users
-from core.utils import check_user
-from core.anime_bot_core import random_inline
+from core.config_loader import CFG, TEXTS, ADB, STATE, DB_SETUP_HOOKS, render, watch_config_files
+from core.admin_system import adminpanel, admin_userinfo, broadcast, admin_callbacks, show_all_users, admin_export, admin_import
+from core.utils import check_user, check_required_chats, invalidate_membership, track_private_chat, error_handler, watch_shared_events
+from core.anime_bot_core import random_inline, POOLS
+from core.media_cache import start_uploader
+from core.http_client import start_http_session, close_http_session
+from core.broadcast import resume_jobs, resume_periodically, stop_jobs
+from core.webhook import run_webhook
+from core.update_processor import build_update_processor
+from core.throttle import rate_limit_guard
+from core.outbound import OUTBOUND, outbound_enabled
+from core.metrics import metrics_enabled, InstrumentedRequest, instrument_application, instrument_db, start_metrics_server, watch_loop_lag
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Coming back from a join link usually means /start again
+    if update.effective_user:
+        invalidate_membership(update.effective_user.id)
     if await check_user(update, context) < 0:
         return
     chat_id = update.effective_message.chat_id
     message_id = update.effective_message.message_id
     keyboard = InlineKeyboardMarkup([[InlineKeyboardButton(TEXTS["main_menu"]["inline_button"], switch_inline_query_current_chat="")]])
-    await context.bot.send_message(chat_id=chat_id, reply_to_message_id=message_id, text=TEXTS["main_menu"]["title"].format(version=CFG["VERSION"]), reply_markup=keyboard, parse_mode="HTML")
+    await context.bot.send_message(chat_id=chat_id, reply_to_message_id=message_id, text=render("main_menu.title", version=CFG["VERSION"]), reply_markup=keyboard, parse_mode="HTML")
 
 async def developer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if await check_user(update, context) < 0:
@@ -20,7 +35,7 @@ async def developer(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message_id = update.effective_message.message_id
     markup = InlineKeyboardMarkup([[InlineKeyboardButton(r"¯\_(ツ)_/¯", callback_data="emptycallback")]])
     await update.effective_chat.send_animation("CAACAgQAAxkBAAEYyVZpDKbhBLct5GxqAgLGhtlAtFw-XgAC5RoAAl5MgVAKPOJUbDxWLjYE", reply_to_message_id=message_id)
-    await update.effective_chat.send_message(text=TEXTS["dev"].format(version=CFG["VERSION"]), reply_to_message_id=message_id, reply_markup=markup, parse_mode="HTML")
+    await update.effective_chat.send_message(text=render("dev", version=CFG["VERSION"]), reply_to_message_id=message_id, reply_markup=markup, parse_mode="HTML")
 
 # ——— Global Callbacks ———
 async def global_callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -33,10 +48,80 @@ async def global_callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.answer(r"¯\_(ツ)_/¯")
         return
 
+    # User says they joined the required chats
+    if data == "check_join":
+        invalidate_membership(update.effective_user.id)
+        await asyncio.to_thread(STATE.publish, "membership", update.effective_user.id)
+        if await check_required_chats(update, context, notify=False):
+            await query.edit_message_text(TEXTS["required_chat"]["joined"])
+        else:
+            await query.answer(TEXTS["required_chat"]["not_joined_yet"], show_alert=True)
+        return
+
+# ——— App lifecycle ———
+async def on_startup(app: Application):
+    await start_http_session()
+    POOLS.start()
+    app.bot_data["media_uploader"] = start_uploader(app.bot)
+    app.bot_data["db_flusher"] = asyncio.create_task(ADB.flush_periodically(CFG.get("WRITE_BEHIND", {}).get("FLUSH_INTERVAL", 5)))
+    app.bot_data["stats_reconciler"] = asyncio.create_task(ADB.reconcile_periodically(CFG.get("STATS_RECONCILE_INTERVAL", 600)))
+    app.bot_data["shared_events"] = asyncio.create_task(watch_shared_events(CFG.get("STATE", {}).get("POLL_INTERVAL", 1)))
+    await resume_jobs(app.bot)
+    watch_cfg = CFG.get("CONFIG_WATCH", {})
+    if watch_cfg.get("ENABLED", False):
+        app.bot_data["config_watcher"] = asyncio.create_task(watch_config_files(watch_cfg.get("INTERVAL", 2), watch_cfg.get("DEBOUNCE", 1)))
+    app.bot_data["broadcast_resumer"] = asyncio.create_task(resume_periodically(app.bot))
+    if metrics_enabled():
+        app.bot_data["metrics_server"] = await start_metrics_server()
+        app.bot_data["loop_lag"] = asyncio.create_task(watch_loop_lag())
+
+async def on_shutdown(app: Application):
+    if "metrics_server" in app.bot_data:
+        app.bot_data["loop_lag"].cancel()
+        await app.bot_data["metrics_server"].cleanup()
+    app.bot_data["broadcast_resumer"].cancel()
+    if "config_watcher" in app.bot_data:
+        app.bot_data["config_watcher"].cancel()
+    app.bot_data["shared_events"].cancel()
+    await stop_jobs()
+    await POOLS.stop()
+    if app.bot_data.get("media_uploader"):
+        app.bot_data["media_uploader"].cancel()
+    await close_http_session()
+    app.bot_data["db_flusher"].cancel()
+    app.bot_data["stats_reconciler"].cancel()
+    await ADB.flush()
+    ADB.close()
+    ADB.db.close()
+
 # ——— App bootstrap ———
-def main():
+def build_application(request: Optional[BaseRequest] = None) -> Application:
     token = CFG["BOT_TOKEN"]
-    app = Application.builder().token(token).build()
+    webhook_mode = CFG.get("MODE", "polling") == "webhook"
+    builder = (
+        Application.builder()
+        .token(token)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        # Users in parallel, each user's updates in order
+        .concurrent_updates(build_update_processor())
+    )
+    if outbound_enabled():
+        # Priorities, per-chat / global pacing and RetryAfter handling for every Bot API call
+        builder = builder.rate_limiter(OUTBOUND)
+    if webhook_mode:
+        # Updates arrive through our own HTTP server
+        builder = builder.updater(None)
+    if request is not None:
+        # Injected transport (bench/): updates are fed in directly, no updater
+        builder = builder.request(request).updater(None)
+    elif metrics_enabled():
+        # Same pool size PTB uses by default, plus per-method call counting
+        builder = builder.request(InstrumentedRequest(connection_pool_size=256))
+    app = builder.build()
+
+    # Per-user / global budgets, checked before any other handler
+    app.add_handler(TypeHandler(Update, rate_limit_guard), group=-1)
 
     # Commands
     app.add_handler(CommandHandler("start", start))
@@ -45,16 +130,37 @@ def main():
     app.add_handler(CommandHandler("user", admin_userinfo))
     app.add_handler(CommandHandler("adminpanel", adminpanel))
     app.add_handler(CommandHandler("broadcast", broadcast))
+    app.add_handler(CommandHandler("export", admin_export))
+    app.add_handler(CommandHandler("import", admin_import))
 
     # Inline Handler
     app.add_handler(InlineQueryHandler(random_inline))
 
     # Callbacks
-    app.add_handler(CallbackQueryHandler(global_callbacks, pattern=r"^(emptycallback)$"))
+    app.add_handler(CallbackQueryHandler(global_callbacks, pattern=r"^(emptycallback|check_join)$"))
     app.add_handler(CallbackQueryHandler(admin_callbacks, pattern=r"^(admin_|show_users:|toggle_user_notify|status_panel|reload_config|reload_texts|adminpanel)"))
 
+    # Private chat reachability (blocked / unblocked)
+    app.add_handler(ChatMemberHandler(track_private_chat, ChatMemberHandler.MY_CHAT_MEMBER))
+    app.add_error_handler(error_handler)
+
+    # Instrumentation is opt-in, nothing is wrapped when it is off
+    if metrics_enabled():
+        instrument_application(app)
+        instrument_db(ADB.db)
+        # and a database opened later by a DB_PATH change on reload
+        if instrument_db not in DB_SETUP_HOOKS:
+            DB_SETUP_HOOKS.append(instrument_db)
+    return app
+
+def main():
+    webhook_mode = CFG.get("MODE", "polling") == "webhook"
+    app = build_application()
     print("Bot started")
-    app.run_polling(close_loop=False)
+    if webhook_mode:
+        run_webhook(app, on_startup, on_shutdown)
+    else:
+        app.run_polling(close_loop=False, allowed_updates=Update.ALL_TYPES)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,29 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+OWNER_ID = 1
+
+### --- Throwaway config/ for core.config_loader, which reads it at import --- ###
+def _prepare_workdir() -> Path:
+    work = Path(tempfile.mkdtemp(prefix="zbtest-"))
+    (work / "config").mkdir()
+    cfg = json.loads((ROOT / "config" / "config-example.json").read_text(encoding="utf-8"))
+    cfg["BOT_TOKEN"] = "123:ABC"
+    cfg["DB_PATH"] = str(work / "bot.db")
+    cfg["OWNERS"] = [OWNER_ID]
+    cfg.setdefault("STATE", {})["BACKEND"] = "memory"
+    cfg.setdefault("METRICS", {})["ENABLED"] = False
+    cfg.setdefault("CONFIG_WATCH", {})["ENABLED"] = False
+    (work / "config" / "config.json").write_text(json.dumps(cfg, ensure_ascii=False), encoding="utf-8")
+    shutil.copy(ROOT / "config" / "texts.json", work / "config" / "texts.json")
+    return work
+
+WORKDIR = _prepare_workdir()
+os.chdir(WORKDIR)
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
@@ -0,0 +1,49 @@
+import asyncio
+
+from core import broadcast
+from core.config_loader import ADB, STATE
+
+def test_lease_released_when_job_ends_or_is_stopped(monkeypatch):
+    async def slow(bot, job):
+        await asyncio.sleep(10)
+
+    async def broken(bot, job):
+        raise RuntimeError("boom")
+
+    async def no_report(bot, job):
+        pass
+
+    monkeypatch.setattr(broadcast, "_report", no_report)
+
+    async def scenario():
+        held = []
+        for send_all in (slow, broken):
+            monkeypatch.setattr(broadcast, "_send_all", send_all)
+            job_id = await ADB.create_broadcast_job(-1001, 1, 0, 0)
+            task = await broadcast.start_job(None, job_id)
+            await asyncio.sleep(0.05)
+            held.append(STATE.get(broadcast._lease_key(job_id)) is not None)
+            await broadcast.stop_jobs()
+            assert task.done()
+            assert STATE.get(broadcast._lease_key(job_id)) is None
+        return held
+
+    # held while sending (the failing one may already be done)
+    assert asyncio.run(scenario())[0]
+
+def test_failed_release_is_logged(monkeypatch, caplog):
+    def unavailable(key, expected):
+        raise OSError("state file gone")
+
+    async def done(bot, job):
+        pass
+
+    monkeypatch.setattr(broadcast, "_send_all", done)
+    monkeypatch.setattr(STATE, "delete_if", unavailable)
+
+    async def scenario():
+        job_id = await ADB.create_broadcast_job(-1001, 1, 0, 0)
+        await (await broadcast.start_job(None, job_id))
+
+    asyncio.run(scenario())
+    assert "releasing the lease failed" in caplog.text
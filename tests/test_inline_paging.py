@@ -0,0 +1,72 @@
+import asyncio
+import random
+from types import SimpleNamespace
+
+from core import anime_bot_core
+
+PAGES = 5
+
+class _InlineQuery:
+    def __init__(self, offset: str):
+        self.id = "1"
+        self.query = ""
+        self.offset = offset
+        self.results = None
+        self.next_offset = None
+
+    async def answer(self, results, next_offset=None, **kwargs):
+        self.results, self.next_offset = results, next_offset
+
+def _stub_pool(monkeypatch):
+    # A small pool handing out overlapping random batches, like prefetched pools refilled from the same upstream
+    rng = random.Random(3)
+    urls = [f"https://cdn.test/{n}.jpg" for n in range(200)]
+
+    async def get_inline_images(orientation, is_nsfw, limit=10):
+        return [(url, "waifu") for url in rng.sample(urls, limit * 2)]
+
+    async def allowed(*args, **kwargs):
+        return True
+
+    async def checked(update, context):
+        return 0
+
+    monkeypatch.setattr(anime_bot_core, "get_inline_images", get_inline_images)
+    monkeypatch.setattr(anime_bot_core, "check_user", checked)
+    monkeypatch.setattr(anime_bot_core, "has_active_private_chat", allowed)
+    monkeypatch.setattr(anime_bot_core, "media_enabled", lambda cfg=None: False)
+
+def test_next_offset_pages_never_repeat(monkeypatch):
+    _stub_pool(monkeypatch)
+
+    async def walk():
+        offset, pages = "", []
+        for _ in range(PAGES):
+            query = _InlineQuery(offset)
+            update = SimpleNamespace(inline_query=query, effective_user=SimpleNamespace(id=42))
+            await anime_bot_core.random_inline(update, SimpleNamespace(bot=None))
+            pages.append([result.photo_url for result in query.results])
+            offset = query.next_offset
+            assert offset
+        return pages
+
+    pages = asyncio.run(walk())
+    assert all(pages)
+    seen = [url for page in pages for url in page]
+    assert len(seen) == len(set(seen))
+
+def test_same_offset_twice_gets_the_same_page(monkeypatch):
+    _stub_pool(monkeypatch)
+
+    async def twice():
+        session, page_no = anime_bot_core.get_inline_session("", 7, None, False)
+        first = await anime_bot_core.inline_page(session, page_no, 10)
+        # Telegram retrying the next offset must not skip a page
+        again, next_no = anime_bot_core.get_inline_session(f"{session['token']}:1", 7, None, False)
+        assert again is session and next_no == 1
+        second = await anime_bot_core.inline_page(session, 1, 10)
+        return first, second, await anime_bot_core.inline_page(session, 1, 10)
+
+    first, second, retried = asyncio.run(twice())
+    assert second == retried
+    assert not {url for url, _ in first} & {url for url, _ in second}
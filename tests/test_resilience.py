@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from core.resilience import CircuitBreaker, CircuitOpen, ResilientCall
+
+def test_one_probe_at_a_time_in_half_open():
+    breaker = CircuitBreaker(failures=1, reset_timeout=0.05)
+    upstream = ResilientCall(deadline=5, attempt_timeout=5, retries=0, hedge=False, breaker=breaker)
+
+    async def scenario():
+        slow_done, probe_done = asyncio.Event(), asyncio.Event()
+
+        async def wait_for(event):
+            await event.wait()
+            return "ok"
+
+        # started while the breaker is closed, given up on (cancelled) while a probe is out
+        old = asyncio.create_task(upstream(lambda: wait_for(slow_done)))
+        await asyncio.sleep(0)
+        breaker.record_failure()
+        await asyncio.sleep(0.06)
+        probe = asyncio.create_task(upstream(lambda: wait_for(probe_done)))
+        await asyncio.sleep(0)
+        assert breaker.state == "half_open" and breaker.probing
+
+        old.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await old
+        # still the first probe's slot: nobody else gets through
+        with pytest.raises(CircuitOpen):
+            await upstream(lambda: wait_for(probe_done))
+        probe_done.set()
+        assert await probe == "ok"
+        assert breaker.state == "closed" and not breaker.probing
+
+    asyncio.run(scenario())
@@ -0,0 +1,76 @@
+import multiprocessing
+
+import pytest
+
+from core.state import WORKER_ID, SQLiteState
+
+WORKERS = 4
+
+# Each worker is its own process (spawn: own WORKER_ID) with its own connection to the state file
+def _claim(path: str, key: str, start, results):
+    state = SQLiteState(path)
+    start.wait()
+    results.put((WORKER_ID, state.add_once(key, WORKER_ID, ttl=60)))
+
+def _toggle(path: str, name: str):
+    state = SQLiteState(path)
+    state.set(f"admin_panel:{name}", False)
+    state.publish("reload_config")
+
+def _steal_lease(path: str, key: str, results):
+    state = SQLiteState(path)
+    results.put((state.set_if(key, WORKER_ID, WORKER_ID, ttl=60), state.delete_if(key, WORKER_ID)))
+
+@pytest.fixture
+def ctx():
+    return multiprocessing.get_context("spawn")
+
+def _run(ctx, target, *args):
+    process = ctx.Process(target=target, args=args)
+    process.start()
+    return process
+
+def _join(processes):
+    for process in processes:
+        process.join(30)
+        assert process.exitcode == 0
+
+def test_add_once_has_one_winner_across_workers(tmp_path, ctx):
+    path = str(tmp_path / "state.db")
+    start, results = ctx.Event(), ctx.Queue()
+    processes = [_run(ctx, _claim, path, "missing_chat:-100", start, results) for _ in range(WORKERS)]
+    start.set()
+    _join(processes)
+
+    outcomes = [results.get(timeout=5) for _ in range(WORKERS)]
+    winners = [worker for worker, won in outcomes if won]
+    assert len({worker for worker, _ in outcomes}) == WORKERS
+    assert len(winners) == 1
+    assert SQLiteState(path).get("missing_chat:-100") == winners[0]
+
+def test_toggle_and_events_reach_other_workers(tmp_path, ctx):
+    path = str(tmp_path / "state.db")
+    state = SQLiteState(path)
+    assert state.get("admin_panel:notify_new_user", True) is True
+    seen = state.last_event_id()
+
+    _join([_run(ctx, _toggle, path, "notify_new_user")])
+
+    assert state.get("admin_panel:notify_new_user", True) is False
+    events = state.events_since(seen)
+    assert [channel for _, channel, _, _ in events] == ["reload_config"]
+    assert events[0][3] != WORKER_ID
+
+def test_lease_is_renewed_and_released_only_by_its_owner(tmp_path, ctx):
+    path = str(tmp_path / "state.db")
+    state = SQLiteState(path)
+    assert state.add_once("broadcast_lease:1", WORKER_ID, ttl=60)
+
+    results = ctx.Queue()
+    _join([_run(ctx, _steal_lease, path, "broadcast_lease:1", results)])
+    assert results.get(timeout=5) == (False, False)
+
+    assert state.get("broadcast_lease:1") == WORKER_ID
+    assert state.set_if("broadcast_lease:1", WORKER_ID, WORKER_ID, ttl=60)
+    assert state.delete_if("broadcast_lease:1", WORKER_ID)
+    assert state.get("broadcast_lease:1") is None
@@ -0,0 +1,56 @@
+import asyncio
+from types import SimpleNamespace
+
+from conftest import OWNER_ID
+from core.db import DB, AsyncDB
+
+def _import(tmp_path, text: str) -> AsyncDB:
+    from core.user_io import import_users_async
+
+    path = tmp_path / "users.csv"
+    path.write_text(text, encoding="utf-8")
+    adb = AsyncDB(DB(str(tmp_path / "import.db")))
+    counts = asyncio.run(import_users_async(adb, str(path), batch=10))
+    assert counts == {"read": 25, "added": 25, "invalid": 0, "skipped": 0}
+    return adb
+
+def test_import_without_timestamps_pages_through_the_panel(tmp_path, monkeypatch):
+    from core import admin_system
+
+    # Only the required columns: every user still gets created_at / last_active
+    adb = _import(tmp_path, "user_id,user_hash\n" + "".join(f"{500 + n},h{n}\n" for n in range(25)))
+    rows = adb.db.get_users_page(100, 0)
+    assert all(row["created_at"] and row["last_active"] for row in rows)
+    monkeypatch.setattr(admin_system, "ADB", adb)
+
+    class _Query:
+        async def edit_message_text(self, text, reply_markup=None, **kwargs):
+            self.markup = reply_markup
+
+    query = _Query()
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=OWNER_ID), callback_query=query)
+    asyncio.run(admin_system.show_all_users(update, None))
+    data = query.markup.inline_keyboard[0][0].callback_data
+    assert admin_system.parse_users_cursor(data.split(":")[2:]) is not None
+    adb.close()
+    adb.db.close()
+
+def test_cursor_parsing_refuses_junk():
+    from core.admin_system import parse_users_cursor
+
+    assert parse_users_cursor(["n", "1700000000", "519"]) == ("n", 1700000000, 519)
+    assert parse_users_cursor(["n", "None", "519"]) is None
+    assert parse_users_cursor(["x", "1", "2"]) is None
+    assert parse_users_cursor([]) is None
+
+def test_rows_missing_timestamps_are_backfilled_on_open(tmp_path):
+    path = str(tmp_path / "old.db")
+    db = DB(path)
+    with db._connect() as con:
+        con.execute("INSERT INTO users (user_id, user_hash) VALUES (1, 'a')")
+        con.execute("PRAGMA user_version=3")
+    db.close()
+    db = DB(path)
+    row = db.get_user(1)
+    assert row["created_at"] and row["last_active"] == row["created_at"]
+    db.close()
@@ -0,0 +1,113 @@
+import asyncio
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import OWNER_ID
+from core.db import DB
+
+PAGES = 5
+
+@pytest.fixture
+def seeded_db(tmp_path):
+    db = DB(str(tmp_path / "users.db"))
+    _seed(db, PAGES * 20 - 7)
+    yield db
+    db.close()
+
+def _seed(db: DB, count: int):
+    # Bursts of sign-ups in the same second: created_at ties broken only by user_id, inserted out of order
+    user_ids = random.Random(7).sample(range(1000, 100000), count)
+    for n, user_id in enumerate(user_ids):
+        db.upsert_user(user_id, None, f"user {user_id}", f"h{user_id}", 1_700_000_000 + n // 9)
+    return user_ids
+
+def _key(row):
+    return (row["created_at"], row["user_id"])
+
+def test_keyset_pages_forward_and_back(seeded_db):
+    db, size = seeded_db, 20
+    expected = [_key(row) for row in db.get_users_page(10 ** 6, 0)]
+
+    pages = [[_key(row) for row in db.get_users_page(size, 0)]]
+    while len(pages) < PAGES:
+        pages.append([_key(row) for row in db.get_users_after(*pages[-1][-1], size)])
+    assert db.get_users_after(*pages[-1][-1], size) == []
+
+    flat = [key for page in pages for key in page]
+    assert flat == expected
+    assert len(set(flat)) == len(flat)
+
+    # and back from the last page, each page exactly as it was going forward
+    back = [pages[-1]]
+    while len(back) < PAGES:
+        back.append([_key(row) for row in db.get_users_before(*back[-1][0], size)])
+    assert back[::-1] == pages
+    assert db.get_users_before(*back[-1][0], size) == []
+
+### --- /users panel, following its own buttons --- ###
+class _Query:
+    def __init__(self):
+        self.text = None
+        self.markup = None
+
+    async def edit_message_text(self, text, reply_markup=None, **kwargs):
+        self.text, self.markup = text, reply_markup
+
+def _listed(text: str):
+    return [int(line.split("<code>")[1].split("</code>")[0]) for line in text.splitlines() if "<code>" in line]
+
+def _button(markup, page: int):
+    for button in markup.inline_keyboard[0]:
+        if button.callback_data.startswith(f"show_users:{page}:"):
+            return button.callback_data
+    return None
+
+def test_show_all_users_buttons_walk_every_user():
+    from core import admin_system
+    from core.config_loader import ADB
+
+    user_ids = _seed(ADB.db, PAGES * admin_system.PAGE_SIZE - 7)
+    expected = [row["user_id"] for row in ADB.db.get_users_page(10 ** 6, 0)]
+    assert sorted(expected) == sorted(user_ids)
+
+    async def open_page(data=None):
+        query = _Query()
+        update = SimpleNamespace(effective_user=SimpleNamespace(id=OWNER_ID), callback_query=query)
+        if data is None:
+            await admin_system.show_all_users(update, None)
+        else:
+            parts = data.split(":")
+            await admin_system.show_all_users(update, None, page=int(parts[1]), cursor=(parts[2], int(parts[3]), int(parts[4])))
+        return query
+
+    async def walk():
+        forward = [await open_page()]
+        for page in range(2, PAGES + 1):
+            forward.append(await open_page(_button(forward[-1].markup, page)))
+        assert _button(forward[-1].markup, PAGES + 1) is None
+        back = [forward[-1]]
+        for page in range(PAGES - 1, 0, -1):
+            back.append(await open_page(_button(back[-1].markup, page)))
+        return [_listed(q.text) for q in forward], [_listed(q.text) for q in back]
+
+    forward, back = asyncio.run(walk())
+    assert [user_id for page in forward for user_id in page] == expected
+    assert back[::-1] == forward
+
+def test_show_all_users_when_the_counter_ran_ahead(tmp_path, monkeypatch):
+    from core import admin_system
+    from core.db import AsyncDB
+
+    # Counter says 100 users, the table is empty: a stale button must not crash the panel
+    adb = AsyncDB(DB(str(tmp_path / "empty.db")))
+    adb.db.stats.total = 100
+    monkeypatch.setattr(admin_system, "ADB", adb)
+
+    query = _Query()
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=OWNER_ID), callback_query=query)
+    asyncio.run(admin_system.show_all_users(update, None, page=4, cursor=("n", 1_700_000_000, 5)))
+    assert query.text == admin_system.TEXTS["errors"]["user_notfound"]
+    adb.close()
+    adb.db.close()
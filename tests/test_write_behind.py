@@ -0,0 +1,35 @@
+import threading
+import time
+
+from core.db import DB
+
+def test_close_waits_for_a_flush_in_flight(tmp_path):
+    db = DB(str(tmp_path / "wb.db"))
+    for user_id in (1, 2):
+        db.upsert_user(user_id, None, "old", f"h{user_id}", 100)
+
+    # A flush on another thread takes user 1 and then waits for the writer
+    db._write_lock.acquire()
+    db.upsert_user(1, None, "new", "h1", 200)
+    # counters saved now, so that flush goes straight to the users batch
+    db.save_stats()
+    flusher = threading.Thread(target=db.flush)
+    flusher.start()
+    deadline = time.monotonic() + 5
+    while not db._inflight and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert db._inflight
+    # touched after that flush took its batch
+    db.upsert_user(2, None, "new", "h2", 300)
+
+    closer = threading.Thread(target=db.close)
+    closer.start()
+    time.sleep(0.05)
+    assert closer.is_alive()
+    db._write_lock.release()
+    flusher.join()
+    closer.join()
+
+    reopened = DB(str(tmp_path / "wb.db"))
+    assert [(row["user_id"], row["full_name"], row["last_active"]) for row in reopened.get_users_page(10, 0)] == [(1, "new", 200), (2, "new", 300)]
+    reopened.close()